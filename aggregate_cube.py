@@ -0,0 +1,190 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Standard Library
+import hashlib
+import json
+import os
+import shutil
+
+# Date Range Library
+from date_index import slice_date_range
+
+# Instrumentation Library
+from instrumentation import timed
+
+
+CUBE_KEYS = ["order_approved_at", "customer_state", "payment_type"]
+CELL_COLUMNS = ["cents", "count", "cents_sq"]
+
+
+# Cents Function
+# payment_value in integer cents: integer sums do not depend on the order rows
+# are added in, so every query backend returns the same totals to the last digit
+def payment_cents(values):
+    return np.rint(np.asarray(values, dtype=np.float64) * 100).astype(np.int64)
+
+
+# Measure Function
+# Turns summed (cents, count, cents_sq) cells into the value a chart asks for
+def measure(grouped, method):
+    if(method == 'sum'):
+        series = grouped["cents"] / 100
+    elif(method == 'mean'):
+        series = grouped["cents"] / grouped["count"] / 100
+    elif(method == 'count'):
+        series = grouped["count"]
+    elif(method == 'std'):
+        count = grouped["count"]
+        cents = grouped["cents"].astype(np.float64)
+        variance = (grouped["cents_sq"].astype(np.float64) - cents ** 2 / count) / (count - 1) / 10_000
+        series = np.sqrt(variance.clip(lower=0))
+    else:
+        raise ValueError(f"Unknown aggregation method: {method}")
+
+    return series.rename("payment_value")
+
+
+# Daily Cells Function
+def daily_cells(df):
+    cells = df[CUBE_KEYS].copy()
+    for column in CUBE_KEYS[1:]:
+        if not isinstance(cells[column].dtype, pd.CategoricalDtype):
+            cells[column] = cells[column].astype("category")
+    cells["cents"] = payment_cents(df["payment_value"])
+    cells["count"] = 1
+    cells["cents_sq"] = cells["cents"] ** 2
+
+    return (
+        cells.groupby(by=CUBE_KEYS, observed=True, sort=True)[CELL_COLUMNS]
+        .sum()
+        .reset_index()
+    )
+
+
+# Aggregate Cube
+#
+# One row per (day, customer_state, payment_type) holding the sum, count and sum
+# of squares of payment_value (in cents). Every EDA chart is a roll-up of this table, so a
+# chart costs O(days x states x payment types) instead of O(orders).
+class AggregateCube:
+    def __init__(self, df):
+        self.daily = daily_cells(df)
+        # content hash, used as the cache key of every chart drawn from the cube
+        self.fingerprint = hashlib.md5(pd.util.hash_pandas_object(self.daily, index=False).to_numpy().tobytes()).hexdigest()
+
+    # Cube of cells already grouped (see read_cells), with their fingerprint
+    @classmethod
+    def from_cells(cls, daily, fingerprint):
+        cube = cls.__new__(cls)
+        cube.daily = daily
+        cube.fingerprint = fingerprint
+        return cube
+
+    # Incremental Update Function
+    # Only the cells from the batch's first day on are regrouped, so an append
+    # costs O(batch + cells of the days it touches) instead of O(orders).
+    @timed("AggregateCube.apply_batch")
+    def apply_batch(self, batch):
+        if len(batch) == 0:
+            return
+
+        cells = daily_cells(batch)
+        first_day = cells["order_approved_at"].iloc[0]
+        split = int(np.searchsorted(self.daily["order_approved_at"].to_numpy(), first_day.to_datetime64(), side="left"))
+        head, tail = self.daily.iloc[:split], self.daily.iloc[split:]
+
+        for column in CUBE_KEYS[1:]:
+            categories = self.daily[column].cat.categories.union(cells[column].cat.categories)
+            head = head.assign(**{column: head[column].cat.set_categories(categories)})
+            tail = tail.assign(**{column: tail[column].cat.set_categories(categories)})
+            cells[column] = cells[column].cat.set_categories(categories)
+
+        tail = (
+            pd.concat([tail, cells], ignore_index=True)
+            .groupby(by=CUBE_KEYS, observed=True, sort=True)[CELL_COLUMNS]
+            .sum()
+            .reset_index()
+        )
+        self.daily = pd.concat([head, tail], ignore_index=True)
+
+        batch_digest = pd.util.hash_pandas_object(cells, index=False).to_numpy().tobytes()
+        self.fingerprint = hashlib.md5(self.fingerprint.encode("ascii") + batch_digest).hexdigest()
+
+    # Cells inside the date window, optionally restricted to some states
+    def select(self, min_date_filter, max_date_filter, states=None):
+        daily = slice_date_range(self.daily, min_date_filter, max_date_filter)
+        if states is not None:
+            daily = daily[daily['customer_state'].isin(states)]
+        return daily
+
+    # Time series rolled up to freq ('1Q', '1M', '1W', '1D'), optionally per state
+    @timed("AggregateCube.rollup")
+    def rollup(self, min_date_filter, max_date_filter, freq, method, states=None, by_state=False):
+        daily = self.select(min_date_filter, max_date_filter, states)
+
+        by = [pd.Grouper(key='order_approved_at', freq=freq)]
+        if by_state:
+            by = ['customer_state'] + by
+
+        series = measure(daily.groupby(by=by, observed=True)[CELL_COLUMNS].sum(), method)
+        if by_state:
+            series = series.reset_index()
+            series['customer_state'] = series['customer_state'].astype(str)
+        return series
+
+    # Totals per customer_state or payment_type
+    @timed("AggregateCube.totals")
+    def totals(self, min_date_filter, max_date_filter, by, method, states=None):
+        daily = self.select(min_date_filter, max_date_filter, states)
+
+        series = measure(daily.groupby(by=by, observed=True)[CELL_COLUMNS].sum(), method)
+        series.index = series.index.astype(str)
+        return series
+
+
+# Cell Store Functions
+#
+# The daily cells of a cube (AggregateCube.daily or DuckDBCube.daily) in the
+# column store's layout: one .npy file per column, states and payment types as
+# codes with their categories in meta.json. read_cells memory-maps them back
+# into an AggregateCube, so a chart worker answers from the same page-cache
+# pages as every other process instead of regrouping the orders.
+def write_cells(directory, daily, fingerprint):
+    staging = f"{directory}.tmp-{os.getpid()}"
+    meta = {"fingerprint": fingerprint, "categories": {}}
+    try:
+        os.makedirs(staging, exist_ok=True)
+        for column in CUBE_KEYS + CELL_COLUMNS:
+            values = daily[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                meta["categories"][column] = [str(category) for category in values.cat.categories]
+                values = values.cat.codes
+            np.save(os.path.join(staging, f"{column}.npy"), values.to_numpy())
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+    return True
+
+
+@timed("read_cells")
+def read_cells(directory):
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+
+        columns = {}
+        for column in CUBE_KEYS + CELL_COLUMNS:
+            values = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r").view(np.ndarray)
+            if column in meta["categories"]:
+                values = pd.Categorical.from_codes(values, categories=meta["categories"][column])
+            columns[column] = values
+    except (OSError, ValueError, KeyError):
+        return None
+    return AggregateCube.from_cells(pd.DataFrame(columns, copy=False), meta["fingerprint"])
@@ -0,0 +1,361 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Dashboard Libraries
+from aggregate_cube import CUBE_KEYS, measure, payment_cents
+from date_index import slice_date_range
+from instrumentation import timed
+from rfm_engine import RFM_METRICS, RFMEngine, grow, to_day
+
+# Standard Library
+import hashlib
+
+
+# Datasets from this many orders open the EDA and RFM pages with sampled
+# previews (the sidebar toggle overrides it)
+APPROXIMATE_ROWS = 1_000_000
+# Sample sizes aimed at: orders for the EDA charts, customers for the RFM page
+SAMPLE_ROWS = 100_000
+SAMPLE_CUSTOMERS = 50_000
+# every (state, month) stratum keeps at least this many units, all of them when
+# it has fewer
+MIN_STRATUM_UNITS = 30
+# 95% normal confidence intervals
+CONFIDENCE_Z = 1.96
+
+# Weighted cells of the sample: estimates of the cube's cents, count and
+# cents_sq, and the terms of their variances
+SAMPLE_COLUMNS = ["cents", "count", "cents_sq", "var_cents", "var_count", "covariance"]
+
+
+# Hash Uniform Function
+# A fixed uniform draw in [0, 1) per id (splitmix64), so whether a unit is in
+# the sample never changes between processes, rebuilds and appended batches.
+# The salt is mixed in by xor: an added salt would only shift consecutive ids
+# onto each other's draws.
+def uniform_hash(values, salt=0):
+    salt = np.uint64((salt * 0xD1B54A32D192ED03) % 2 ** 64)
+    x = (np.asarray(values).astype(np.uint64) ^ salt) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / 2.0 ** 53
+
+
+def month_number(dates):
+    return np.asarray(dates).astype("datetime64[M]").astype(np.int64)
+
+
+# Confidence Interval Function
+# estimate/low/high frame of an estimate and the estimate of its variance
+def interval(estimate, variance):
+    margin = CONFIDENCE_Z * np.sqrt(np.clip(variance, 0, None))
+    return pd.DataFrame({"estimate": estimate, "low": estimate - margin, "high": estimate + margin})
+
+
+# Stratified Sample
+#
+# Poisson sampling inside (customer_state, month) strata: a unit of stratum h
+# is kept with probability p_h, the same fraction everywhere except that small
+# strata keep at least MIN_STRATUM_UNITS units, so every state and every month
+# is represented. A kept unit stands for 1 / p_h units (Horvitz-Thompson), and
+# the variance of any total is estimated by the sum of (1 - p) / p^2 * y^2 over
+# the sample, so every chart bin gets its own confidence interval. Strata first
+# seen in an appended batch get their rate from the batch.
+class StratifiedSample:
+    def stratify(self, state_codes, categories, months, target):
+        self.fraction = min(1.0, target / max(len(months), 1))
+        if len(months) == 0:
+            self.rates = pd.Series([], dtype=np.float64, index=pd.MultiIndex.from_arrays([[], []], names=["customer_state", "month"]))
+            return np.zeros(0)
+
+        # missing states (code -1) get a stratum of their own
+        labels = np.append(np.asarray(categories).astype(str), "")
+        state_codes = np.where(state_codes < 0, len(categories), state_codes)
+        first_month = months.min()
+        keys = (months - first_month) * len(labels) + state_codes
+        counts = np.bincount(keys)
+        with np.errstate(divide="ignore"):
+            rates = np.minimum(1.0, np.maximum(self.fraction, MIN_STRATUM_UNITS / counts))
+
+        used = np.flatnonzero(counts)
+        self.rates = pd.Series(rates[used], index=pd.MultiIndex.from_arrays(
+            [labels[used % len(labels)], first_month + used // len(labels)], names=["customer_state", "month"]))
+        return rates[keys]
+
+    def batch_rates(self, states, months):
+        index = pd.MultiIndex.from_arrays([np.asarray(states).astype(str), months], names=["customer_state", "month"])
+        rates = self.rates.reindex(index).to_numpy(dtype=np.float64)
+        new = np.isnan(rates)
+        if new.any():
+            counts = pd.Series(1, index=index[new]).groupby(level=[0, 1]).size()
+            added = np.minimum(1.0, np.maximum(self.fraction, MIN_STRATUM_UNITS / counts))
+            self.rates = pd.concat([self.rates, added])
+            rates[new] = added.reindex(index[new]).to_numpy()
+        return rates
+
+
+# Weighted Cells Function
+# Sampled orders summed per (day, state, payment type), weighted by 1 / rate
+def weighted_cells(rows, rates):
+    cents = payment_cents(rows["payment_value"]).astype(np.float64)
+    weights = 1 / rates
+    factors = (1 - rates) * weights ** 2
+    cells = pd.DataFrame({
+        "order_approved_at": rows["order_approved_at"].to_numpy(),
+        "customer_state": rows["customer_state"].astype(str).to_numpy(dtype=object),
+        "payment_type": rows["payment_type"].astype(str).to_numpy(dtype=object),
+        "cents": weights * cents,
+        "count": weights,
+        "cents_sq": weights * cents ** 2,
+        "var_cents": factors * cents ** 2,
+        "var_count": factors,
+        "covariance": factors * cents,
+    })
+    return cells.groupby(by=CUBE_KEYS, sort=True)[SAMPLE_COLUMNS].sum().reset_index()
+
+
+# Sampled Interval Function
+# measure() of summed weighted cells with its 95% interval; a mean is a ratio
+# of two estimates, its variance linearized. std has no interval (NaN bounds).
+def sample_interval(grouped, method):
+    estimate = measure(grouped, method)
+    if method == 'sum':
+        variance = grouped["var_cents"] / 10_000
+    elif method == 'count':
+        variance = grouped["var_count"]
+    elif method == 'mean':
+        ratio = grouped["cents"] / grouped["count"]
+        variance = (grouped["var_cents"] - 2 * ratio * grouped["covariance"] + ratio ** 2 * grouped["var_count"]) / grouped["count"] ** 2 / 10_000
+    else:
+        variance = estimate * np.nan
+    return interval(estimate, variance)
+
+
+# Sample Cube
+#
+# AggregateCube of a stratified sample of the orders: the same rollup and
+# totals, answered with estimates from about SAMPLE_ROWS orders whatever the
+# size of the dataset, and rollup_interval / totals_interval with their
+# confidence bounds for the plot helpers to draw.
+class SampleCube(StratifiedSample):
+    @timed("SampleCube.build")
+    def __init__(self, df, target=SAMPLE_ROWS):
+        rates = self.stratify(df["customer_state"].cat.codes.to_numpy(), df["customer_state"].cat.categories,
+                              month_number(df["order_approved_at"]), target)
+        keep = np.flatnonzero(uniform_hash(df["index"].to_numpy()) < rates)
+        self.daily = weighted_cells(df.iloc[keep], rates[keep])
+        self.population = len(df)
+        self.rows = len(keep)
+        self.fingerprint = hashlib.md5(pd.util.hash_pandas_object(self.daily, index=False).to_numpy().tobytes()).hexdigest()
+
+    @timed("SampleCube.apply_batch")
+    def apply_batch(self, batch):
+        if len(batch) == 0:
+            return
+
+        rates = self.batch_rates(batch["customer_state"], month_number(batch["order_approved_at"]))
+        keep = np.flatnonzero(uniform_hash(batch["index"].to_numpy()) < rates)
+        cells = weighted_cells(batch.iloc[keep], rates[keep])
+        self.daily = pd.concat([self.daily, cells], ignore_index=True).sort_values(by="order_approved_at", kind="stable", ignore_index=True)
+        self.population += len(batch)
+        self.rows += len(keep)
+
+        batch_digest = pd.util.hash_pandas_object(cells, index=False).to_numpy().tobytes()
+        self.fingerprint = hashlib.md5(self.fingerprint.encode("ascii") + batch_digest).hexdigest()
+
+    def select(self, min_date_filter, max_date_filter, states=None):
+        daily = slice_date_range(self.daily, min_date_filter, max_date_filter)
+        if states is not None:
+            daily = daily[daily['customer_state'].isin(states)]
+        return daily
+
+    def rollup_interval(self, min_date_filter, max_date_filter, freq, method, states=None, by_state=False):
+        daily = self.select(min_date_filter, max_date_filter, states)
+
+        by = [pd.Grouper(key='order_approved_at', freq=freq)]
+        if by_state:
+            by = ['customer_state'] + by
+        return sample_interval(daily.groupby(by=by)[SAMPLE_COLUMNS].sum(), method)
+
+    def totals_interval(self, min_date_filter, max_date_filter, by, method, states=None):
+        daily = self.select(min_date_filter, max_date_filter, states)
+        return sample_interval(daily.groupby(by=by)[SAMPLE_COLUMNS].sum(), method)
+
+    # Estimates shaped like AggregateCube.rollup / totals
+    def rollup(self, min_date_filter, max_date_filter, freq, method, states=None, by_state=False):
+        series = self.rollup_interval(min_date_filter, max_date_filter, freq, method, states, by_state)["estimate"].rename("payment_value")
+        if by_state:
+            series = series.reset_index()
+        return series
+
+    def totals(self, min_date_filter, max_date_filter, by, method, states=None):
+        return self.totals_interval(min_date_filter, max_date_filter, by, method, states)["estimate"].rename("payment_value")
+
+
+# Weighted Metric
+# Sampled counterpart of rfm_engine.MetricIndex for histplotfunc: estimated
+# customers per bin (numpy "auto" bins of the sampled values in the range) and
+# the 95% interval of every bin
+class WeightedMetric:
+    def __init__(self, values, weights, factors):
+        order = np.argsort(values.to_numpy(), kind="stable")
+        self.sorted = values.to_numpy()[order]
+        self.weights = weights[order]
+        self.factors = factors[order]
+        self.fingerprint = hashlib.md5(self.sorted.tobytes() + self.weights.tobytes()).hexdigest()
+
+    def min(self):
+        return self.sorted[0]
+
+    def max(self):
+        return self.sorted[-1]
+
+    def bounds(self, start, end):
+        return np.searchsorted(self.sorted, start, side="left"), np.searchsorted(self.sorted, end, side="right")
+
+    def histogram(self, start, end):
+        lo, hi = self.bounds(start, end)
+        if lo == hi:
+            return np.array([0.0, 1.0]), np.zeros(1)
+        edges = np.histogram_bin_edges(self.sorted[lo:hi], bins="auto")
+        return edges, np.histogram(self.sorted[lo:hi], bins=edges, weights=self.weights[lo:hi])[0]
+
+    # (low, high) of every bin of histogram(start, end)
+    def histogram_interval(self, start, end):
+        edges, counts = self.histogram(start, end)
+        lo, hi = self.bounds(start, end)
+        variance = np.histogram(self.sorted[lo:hi], bins=edges, weights=self.factors[lo:hi])[0] if lo < hi else np.zeros(1)
+        bounds = interval(counts, variance)
+        return bounds["low"].to_numpy(), bounds["high"].to_numpy()
+
+
+# RFM Estimate
+# Sampled counterpart of rfm_engine.RFMWindow: the averages of the window (a
+# ratio of two estimates each) with their intervals, and a WeightedMetric per
+# metric
+class RFMEstimate:
+    def __init__(self, rfm_df, rates):
+        weights = 1 / rates
+        factors = (1 - rates) * weights ** 2
+        self.frame = rfm_df
+        self.customers = weights.sum()
+        self.sample_customers = len(rfm_df)
+        self.intervals = {}
+        for metric in RFM_METRICS:
+            values = rfm_df[metric].to_numpy(dtype=np.float64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = (weights * values).sum() / self.customers
+                variance = (factors * (values - mean) ** 2).sum() / self.customers ** 2
+            self.intervals[metric] = interval(np.array([mean]), np.array([variance])).iloc[0]
+        self.means = {metric: bounds["estimate"] for metric, bounds in self.intervals.items()}
+        self.metrics = {metric: WeightedMetric(rfm_df[metric], weights, factors) for metric in RFM_METRICS}
+
+
+def last_day_in(days, start_day, end_day):
+    position = np.searchsorted(days, end_day, side="right") - 1
+    return int(days[position]) if position >= 0 and days[position] >= start_day else None
+
+
+# Sample RFM
+#
+# Stratified sample of the customers, by the state and month of their first
+# order, with every order of a sampled customer: an RFMEngine over those orders
+# gives each sampled customer its exact recency, frequency and monetary in any
+# window, and the rates weight them into estimates for all customers. Recency
+# is counted from the window's last order day in the whole dataset, as
+# create_rfm_df does.
+class SampleRFM(StratifiedSample):
+    @timed("SampleRFM.build")
+    def __init__(self, df, target=SAMPLE_CUSTOMERS):
+        ids = df["customer_id"].to_numpy()
+        dates = df["order_approved_at"].to_numpy()
+        size = int(ids.max()) + 1 if len(ids) else 0
+
+        # first order of every customer: the frame is in date order, so
+        # writing row numbers in reverse leaves the smallest one
+        first_row = np.full(size, -1, dtype=np.int64)
+        first_row[ids[::-1]] = np.arange(len(ids) - 1, -1, -1)
+        customers = np.flatnonzero(first_row >= 0)
+        first = first_row[customers]
+
+        rates = self.stratify(df["customer_state"].cat.codes.to_numpy()[first], df["customer_state"].cat.categories,
+                              month_number(dates[first]), target)
+        self.known = first_row >= 0
+        self.customer_rate = np.zeros(size, dtype=np.float64)
+        self.customer_rate[customers] = rates
+        self.included = np.zeros(size, dtype=bool)
+        self.included[customers] = uniform_hash(customers, salt=1) < rates
+
+        sample = df[["customer_id", "order_approved_at", "payment_value"]].iloc[np.flatnonzero(self.included[ids])]
+        self.engine = RFMEngine(sample)
+        self.population = len(customers)
+        self.order_days = self.unique_days(dates)
+        self.sample_days = self.unique_days(sample["order_approved_at"].to_numpy())
+
+    # sorted distinct days of dates already in order
+    def unique_days(self, dates):
+        days = np.asarray(dates).astype("datetime64[D]").astype(np.int64)
+        return days[np.append(True, days[1:] != days[:-1])] if len(days) else days
+
+    @timed("SampleRFM.apply_batch")
+    def apply_batch(self, batch):
+        if len(batch) == 0:
+            return
+
+        ids = batch["customer_id"].to_numpy()
+        size = max(len(self.known), int(ids.max()) + 1)
+        self.known = grow(self.known, size, False)
+        self.customer_rate = grow(self.customer_rate, size, 0.0)
+        self.included = grow(self.included, size, False)
+
+        # customers first seen in the batch, at their first row of it
+        new, first = np.unique(ids, return_index=True)
+        first = first[~self.known[new]]
+        new = new[~self.known[new]]
+        if len(new):
+            rates = self.batch_rates(batch["customer_state"].to_numpy()[first], month_number(batch["order_approved_at"].to_numpy()[first]))
+            self.known[new] = True
+            self.customer_rate[new] = rates
+            self.included[new] = uniform_hash(new, salt=1) < rates
+            self.population += len(new)
+
+        sample = batch[["customer_id", "order_approved_at", "payment_value"]].iloc[np.flatnonzero(self.included[ids])]
+        self.engine.apply_batch(sample)
+        self.order_days = np.union1d(self.order_days, self.unique_days(np.sort(batch["order_approved_at"].to_numpy())))
+        self.sample_days = np.union1d(self.sample_days, self.unique_days(np.sort(sample["order_approved_at"].to_numpy())))
+
+    @timed("SampleRFM.window")
+    def window(self, start_date, end_date):
+        start_day, end_day = to_day(start_date), to_day(end_date)
+        rfm_df = self.engine.window(start_date, end_date)
+
+        last_day, sample_last_day = last_day_in(self.order_days, start_day, end_day), last_day_in(self.sample_days, start_day, end_day)
+        if last_day is not None and sample_last_day is not None:
+            rfm_df = rfm_df.assign(recency=rfm_df["recency"] + (last_day - sample_last_day))
+        return RFMEstimate(rfm_df, self.customer_rate[rfm_df["customer_id"].to_numpy()])
+
+
+# Approximation Error Function
+# How far a sampled chart (estimate/low/high frame) was from the exact values:
+# the largest error relative to the largest exact value, and how many exact
+# values fell inside the 95% interval
+def approximation_error(bounds, exact):
+    bounds = bounds.reindex(exact.index)
+    error = (bounds["estimate"] - exact).abs().fillna(exact.abs())
+    scale = exact.abs().max()
+    inside = (bounds["low"] <= exact) & (exact <= bounds["high"])
+    return {
+        "max_error": error.max() / scale if scale else 0.0,
+        "inside": int(inside.sum()),
+        "points": len(exact),
+    }
+
+
+# Margin Function
+# Widest half interval of a sampled chart, relative to its largest estimate
+def relative_margin(bounds):
+    scale = bounds["estimate"].abs().max()
+    margin = ((bounds["high"] - bounds["low"]) / 2).max()
+    return margin / scale if scale else 0.0
@@ -0,0 +1,309 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Dashboard Libraries
+from chart_pool import publish_cells
+import data_loader
+from figure_cache import SAVEFIG_OPTIONS
+from query_backend import QUERY_BACKENDS, cube_reference, rfm_reference
+from rfm_engine import RFMWindow, to_day
+
+# Standard Library
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+
+
+REPORT_FORMATS = ["png", "svg", "csv"]
+DEFAULT_FREQ = "1M"
+
+# Columns of an RFM window, in create_rfm_df's order
+WINDOW_COLUMNS = ["customer_id", "frequency", "monetary", "recency"]
+
+# Worker state: the cube's published cells (chart_pool.CubeCells) and the RFM
+# window of the last job
+_worker = {}
+
+
+# Jobs Function
+#
+# A job is one (date range, freq, states) selection of the dashboard:
+#   {"name": "sp_2017", "start": "2017-01-01", "end": "2017-12-31", "freq": "1M", "states": ["SP"]}
+# name and freq are optional, no states means every state. Jobs come from a
+# json list or a csv with the same columns (states separated by ";").
+def read_jobs(path):
+    if path.endswith(".csv"):
+        rows = pd.read_csv(path, dtype=str, keep_default_na=False).to_dict("records")
+    else:
+        with open(path) as f:
+            rows = json.load(f)
+    return [parse_job(row, index) for index, row in enumerate(rows)]
+
+
+def parse_job(row, index):
+    states = row.get("states") or []
+    if isinstance(states, str):
+        states = [state.strip() for state in states.split(";") if state.strip()]
+    name = row.get("name") or f"job_{index:03d}"
+    return {
+        "name": re.sub(r"[^\w.-]+", "_", name),
+        "start": pd.Timestamp(row["start"]).date(),
+        "end": pd.Timestamp(row["end"]).date(),
+        "freq": row.get("freq") or DEFAULT_FREQ,
+        "states": sorted(states) or None,
+    }
+
+
+# RFM Window Store Functions
+#
+# The parent answers every distinct date window of the jobs once, with the
+# query backend's RFM engine, and writes it to a directory of its own in the
+# column store: one .npy file per column, customer ids already decoded. A
+# worker memory-maps the window of its job, so no worker builds an engine or
+# loads the dataset.
+def write_window(directory, rfm_df, schema):
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "customer_id.npy"), schema.decode("customer_id", rfm_df["customer_id"].to_numpy()).astype("S32"))
+    for column in WINDOW_COLUMNS[1:]:
+        np.save(os.path.join(directory, f"{column}.npy"), rfm_df[column].to_numpy())
+
+
+def read_window(directory):
+    columns = {column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r").view(np.ndarray) for column in WINDOW_COLUMNS}
+    columns["customer_id"] = columns["customer_id"].astype("U32").astype(object)
+    return RFMWindow(pd.DataFrame(columns, copy=False))
+
+
+# RFM windows of the jobs, {(start day, end day): directory}; empty when the
+# store is not writable (the workers then resolve the engine themselves)
+def publish_windows(jobs, path, backend, directory):
+    reference, schema = rfm_reference(path, backend), data_loader.load_schema(path)
+    windows = {}
+    try:
+        for job in jobs:
+            key = (to_day(job["start"]), to_day(job["end"]))
+            if key not in windows:
+                windows[key] = os.path.join(directory, f"window-{key[0]}-{key[1]}")
+                write_window(windows[key], reference.resolve().window(job["start"], job["end"]), schema)
+    except OSError:
+        return {}
+    return windows
+
+
+# Worker Functions
+#
+# The parent loads the dataset, publishes the cube's cells and the RFM
+# windows; every worker memory-maps them and keeps the cube for all the jobs
+# it is given.
+def start_worker(path, backend=None, cube=None):
+    import matplotlib
+    matplotlib.use("Agg")
+    import plot_functions  # noqa: F401 (pyplot, seaborn theme)
+
+    _worker["path"] = path
+    _worker["backend"] = backend
+    _worker["cube"] = cube or cube_reference(path, backend)
+    _worker["cube"].resolve()
+
+
+# The job's RFM window with its customer ids decoded
+def job_window(job):
+    directory = job.get("rfm_window")
+    if directory is None:
+        rfm_window = rfm_reference(_worker["path"], _worker["backend"]).resolve().window_index(job["start"], job["end"])
+        return RFMWindow(data_loader.load_schema(_worker["path"]).expand(rfm_window.frame))
+
+    if _worker.get("window_directory") != directory:
+        _worker["window"] = read_window(directory)
+        _worker["window_directory"] = directory
+    return _worker["window"]
+
+
+# Charts and tables of a job, the ones the dashboard pages show; the payment
+# type and RFM charts are left out when the selection has no orders
+def job_outputs(job):
+    from plot_functions import barplotfunc, barplotfunc2, donutchartfunc, histplotfunc, lineplotfunct1, lineplotfunct2, payment_labels
+
+    cube = _worker["cube"].resolve()
+    start, end, freq, states = job["start"], job["end"], job["freq"], job["states"]
+
+    # jobs that only differ in freq or states share the window
+    rfm_window = job_window(job)
+    rfm_df = rfm_window.frame
+    scored_df, segments = rfm_window.segments()
+    state_counts = cube.totals(start, end, by='customer_state', method='count', states=states).sort_values(ascending=False)
+    payment_counts = cube.totals(start, end, by='payment_type', method='count', states=states).sort_values(ascending=False)
+
+    charts = {
+        "total_trend": (lineplotfunct1, (cube, start, end), dict(xlabel='Dates', ylabel='Transaction Value', title='Total Transaction Trend', freq=freq, method='sum')),
+        "average_trend": (lineplotfunct1, (cube, start, end), dict(xlabel='Dates', ylabel='Transaction Value', title='Average Transaction Trend', freq=freq, method='mean')),
+        "state_orders": (barplotfunc, (), dict(x=state_counts, y=state_counts.index, xlabel='Total Order', ylabel='State', title='Total Order by State')),
+        "state_total": (barplotfunc2, (), dict(cube=cube, min_date_filter=start, max_date_filter=end, states=states, xlabel='Transaction Value', ylabel='State', title='Total Transaction Value by State', method='sum')),
+        "state_average": (barplotfunc2, (), dict(cube=cube, min_date_filter=start, max_date_filter=end, states=states, xlabel='Transaction Value', ylabel='State', title='Average Transaction Value by State', method='mean')),
+        "state_trend": (lineplotfunct2, (cube, start, end), dict(states=states, hue='customer_state', xlabel='Dates', ylabel='Transaction Value', title='Total Transaction Value By States', freq=freq, method='sum')),
+    }
+    if len(payment_counts):
+        charts["payment_types"] = (donutchartfunc, (payment_counts,), dict(label=payment_labels(payment_counts.index), title='Donut Chart of Payment Types'))
+    for measure, label, ascending, top_title in [("recency", "Days", True, "By Recency (days)"), ("frequency", "Frequency", False, "By Frequency"),
+                                                 ("monetary", "Monetary", False, "By Monetary")]:
+        if not len(rfm_df):
+            break
+        values = rfm_window.metrics[measure]
+        rank = rfm_df.loc[values.smallest(5) if ascending else values.largest(5)]
+        charts[f"{measure}_histogram"] = (histplotfunc, (values,), dict(start=values.min(), end=values.max(), xlabel=label, ylabel='Total Customer',
+                                                                        title=f'Histogram of {measure.capitalize()} by Customer'))
+        charts[f"{measure}_top"] = (barplotfunc, (), dict(x=rank[measure], y=rank['customer_id'], xlabel=label, ylabel="customer_id", title=top_title))
+
+    segment_revenue = (segments['revenue_share'] * 100).round(1)
+    charts["segments"] = (barplotfunc, (), dict(x=segment_revenue, y=segment_revenue.index, xlabel='Revenue Share (%)', ylabel="Segment",
+                                                 title="Revenue Share by Segment"))
+
+    tables = {
+        "trend": pd.DataFrame({
+            "sum": cube.rollup(start, end, freq=freq, method='sum'),
+            "mean": cube.rollup(start, end, freq=freq, method='mean'),
+        }),
+        "states": pd.DataFrame({method: cube.totals(start, end, by='customer_state', method=method, states=states) for method in ['count', 'sum', 'mean']}),
+        "payment_types": pd.DataFrame({method: cube.totals(start, end, by='payment_type', method=method, states=states) for method in ['count', 'sum', 'mean']}),
+        "rfm": scored_df,
+        "segments": segments,
+    }
+    return charts, tables
+
+
+# Save Function
+# Draws a chart once and writes it in every requested image format
+def save_chart(func, args, kwargs, base, formats):
+    import matplotlib.pyplot as plt
+
+    options = {name: value for name, value in SAVEFIG_OPTIONS.items() if name != "format"}
+    files = []
+    try:
+        fig = func(*args, **kwargs)
+        for image_format in formats:
+            files.append(f"{base}.{image_format}")
+            fig.savefig(files[-1], format=image_format, **options)
+    finally:
+        # a worker draws one chart at a time, nothing else is open
+        plt.close("all")
+    return files
+
+
+# A failing job is reported with its error instead of stopping the others
+def run_job(job, output_dir, formats):
+    start = time.perf_counter()
+    job_dir = os.path.join(output_dir, job["name"])
+    files = []
+    try:
+        os.makedirs(job_dir, exist_ok=True)
+        charts, tables = job_outputs(job)
+        image_formats = [image_format for image_format in formats if image_format != "csv"]
+        if image_formats:
+            for name, (func, args, kwargs) in charts.items():
+                files.extend(save_chart(func, args, kwargs, os.path.join(job_dir, name), image_formats))
+        if "csv" in formats:
+            for name, table in tables.items():
+                files.append(os.path.join(job_dir, f"{name}.csv"))
+                table.to_csv(files[-1], index=name != "rfm")
+    except Exception as error:
+        return failed_job(job, error, len(files), time.perf_counter() - start)
+
+    return {"name": job["name"], "files": len(files), "seconds": time.perf_counter() - start, "error": None}
+
+
+def failed_job(job, error, files=0, seconds=0.0):
+    return {"name": job["name"], "files": files, "seconds": seconds, "error": f"{type(error).__name__}: {error}"}
+
+
+# Report Function
+#
+# Runs the jobs in worker processes (in this process when workers is 1) and
+# returns one result per job, in job order, with the throughput of the run and
+# the jobs that failed. The dataset, the cube and the RFM windows are built
+# once here, before the workers start, and published to the column store, so
+# the workers memory-map them instead of each building them again.
+def run_report(jobs, path="main_data.csv", output_dir="reports", formats=("png", "csv"), workers=None, backend=None):
+    path = os.path.abspath(path)
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    start = time.perf_counter()
+    data_loader.load_main_data(path)
+
+    reference = cube_reference(path, backend)
+    cube = publish_cells(reference) or reference
+    windows_dir = os.path.join(data_loader.store_path(path), f"report-{os.getpid()}")
+    try:
+        windows = publish_windows(jobs, path, backend, windows_dir)
+        jobs = [{**job, "rfm_window": windows.get((to_day(job["start"]), to_day(job["end"])))} for job in jobs]
+        results = run_jobs(jobs, path, output_dir, formats, workers, backend, cube)
+    finally:
+        shutil.rmtree(windows_dir, ignore_errors=True)
+
+    seconds = time.perf_counter() - start
+    return {
+        "jobs": len(jobs),
+        "workers": workers,
+        "files": sum(result["files"] for result in results),
+        "seconds": seconds,
+        "jobs_per_second": len(jobs) / seconds if seconds else float("inf"),
+        "failed": [result["name"] for result in results if result["error"]],
+        "results": results,
+    }
+
+
+def run_jobs(jobs, path, output_dir, formats, workers, backend, cube):
+    results = [None] * len(jobs)
+    if workers <= 1:
+        start_worker(path, backend, cube)
+        for index, job in enumerate(jobs):
+            results[index] = run_job(job, output_dir, formats)
+            print_progress(results[index], index, len(jobs))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=start_worker, initargs=(path, backend, cube)) as executor:
+        futures = {executor.submit(run_job, job, output_dir, formats): index for index, job in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures)):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as error:
+                # the worker itself failed (e.g. killed for memory)
+                results[index] = failed_job(jobs[index], error)
+            print_progress(results[index], done, len(jobs))
+    return results
+
+
+def print_progress(result, done, total):
+    status = f"failed, {result['error']}" if result["error"] else f"{result['files']} files"
+    print(f"[{done + 1}/{total}] {result['name']}: {status} in {result['seconds']:.2f}s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the dashboard charts and tables for a list of jobs, without streamlit.")
+    parser.add_argument("jobs", help="json list or csv of jobs: name, start, end, freq, states")
+    parser.add_argument("--data", default="main_data.csv", help="csv read by the dashboard")
+    parser.add_argument("--output-dir", default="reports", help="one sub directory per job is written here")
+    parser.add_argument("--formats", nargs="+", choices=REPORT_FORMATS, default=["png", "csv"], help="outputs of every job")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--query-backend", choices=list(QUERY_BACKENDS), default=None,
+                        help="engine of the roll-ups and RFM windows (default: $RFM_DASHBOARD_QUERY_BACKEND, else pandas)")
+    args = parser.parse_args()
+
+    jobs = read_jobs(args.jobs)
+    report = run_report(jobs, args.data, args.output_dir, args.formats, args.workers, args.query_backend)
+    print(f"{report['jobs']} jobs, {report['files']} files in {report['seconds']:.2f}s with {report['workers']} workers: "
+          f"{report['jobs_per_second']:.2f} jobs/s")
+    if report["failed"]:
+        print(f"{len(report['failed'])} jobs failed: {', '.join(report['failed'])}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,566 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Data Visualization Library
+import matplotlib
+import seaborn as sns
+
+# Dashboard Libraries
+import data_loader
+from aggregate_cube import AggregateCube
+from approximate import SampleCube, SampleRFM, approximation_error
+from chart_pool import ChartPool
+from date_index import slice_date_range
+from figure_cache import figure_cache
+from instrumentation import TIMING_LOG_ENV
+from paginated_table import page_cache
+from plot_functions import barplotfunc, barplotfunc2, donutchartfunc, histplotfunc, lineplotfunct1, lineplotfunct2, payment_labels
+from query_backend import DuckDBCube, DuckDBRFM
+from rfm_engine import RFMEngine, RFMWindow, create_rfm_df
+from rfm_segments import score_rfm, sketch_rfm
+from synthetic_data import write_main_data
+from vega_charts import payload_bytes, vega_spec
+
+# Standard Library
+import argparse
+from contextlib import contextmanager
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+BENCHMARK_SIZES = [100_000, 1_000_000, 10_000_000]
+REPOSITORY_DIR = os.path.dirname(os.path.abspath(__file__))
+DASHBOARD_SCRIPT = os.path.join(REPOSITORY_DIR, "rfm-analysis-ecommerce-dashboard.py")
+PAGES = ['Introduction', 'RFM Analysis', 'Exploratory Data Analysis']
+
+
+# Measure Function
+# Wall time of repeat calls (min and median), then one more call under
+# tracemalloc for the peak of Python and numpy allocations during the call.
+# A call may return a dict of extra metrics (e.g. time to first render); the
+# median of each over the timed calls is reported.
+def measure(func, repeat=3, memory=True):
+    times = []
+    extra = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        metrics = func()
+        times.append(time.perf_counter() - start)
+        if isinstance(metrics, dict):
+            for name, value in metrics.items():
+                extra.setdefault(name, []).append(value)
+
+    peak_bytes = None
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "seconds_min": min(times),
+        "seconds_median": statistics.median(times),
+        "repeat": repeat,
+        "peak_bytes": peak_bytes,
+        **{name: statistics.median(values) for name, values in extra.items()},
+    }
+
+
+# Chart Render Functions
+# A chart in each render mode of the dashboard, with the bytes sent to the
+# browser: the PNG, or the Vega-Lite spec with its aggregated points
+def render(func, *args, **kwargs):
+    return {"payload_bytes": len(figure_cache.rasterize(func, *args, **kwargs))}
+
+
+def render_vega(func, *args, **kwargs):
+    return {"payload_bytes": payload_bytes(vega_spec(func, *args, **kwargs))}
+
+
+# EDA Page Charts
+# The 7 charts of the EDA page for the given states, as (func, args, kwargs)
+def eda_charts(path, cube, min_date, max_date, states):
+    cube_ref = data_loader.DerivedReference(path, "aggregate_cube", AggregateCube)
+    state_counts = cube.totals(min_date, max_date, by='customer_state', method='count', states=states).sort_values(ascending=False)
+    payment_counts = cube.totals(min_date, max_date, by='payment_type', method='count', states=states).sort_values(ascending=False)
+    return [
+        (lineplotfunct1, (cube_ref, min_date, max_date), dict(xlabel='Dates', ylabel='Transaction Value', title='Total Transaction Trend', freq='1M', method='sum')),
+        (lineplotfunct1, (cube_ref, min_date, max_date), dict(xlabel='Dates', ylabel='Transaction Value', title='Average Transaction Trend', freq='1M', method='mean')),
+        (barplotfunc, (), dict(x=state_counts, y=state_counts.index, xlabel='Total Order', ylabel='State', title='Total Order by State')),
+        (barplotfunc2, (), dict(cube=cube_ref, min_date_filter=min_date, max_date_filter=max_date, states=states, xlabel='Transaction Value', ylabel='State', title='Total Transaction Value by State', method='sum')),
+        (barplotfunc2, (), dict(cube=cube_ref, min_date_filter=min_date, max_date_filter=max_date, states=states, xlabel='Transaction Value', ylabel='State', title='Average Transaction Value by State', method='mean')),
+        (lineplotfunct2, (cube_ref, min_date, max_date), dict(states=states, hue='customer_state', xlabel='Dates', ylabel='Transaction Value', title='Total Transaction Value By States', freq='1M', method='sum')),
+        (donutchartfunc, (payment_counts,), dict(label=payment_labels(payment_counts.index), title='Donut Chart of Payment Types')),
+    ]
+
+
+# Chart Pool Benchmark
+# Renders all the charts with the figure cache emptied, submitted at once and
+# collected in order, as the EDA page does. The first call also starts the
+# pool's workers; the median is that of a dashboard past its first EDA rerun.
+def render_all(pool, charts):
+    figure_cache.clear()
+    futures = [pool.submit(func, *args, **kwargs) for func, args, kwargs in charts]
+    return [future.result() for future in futures]
+
+
+def chart_pool_cases(charts, workers):
+    cases = {}
+    for count in sorted({1, workers}):
+        pool = ChartPool(count)
+        cases[f"eda_charts.workers_{count}"] = lambda pool=pool: render_all(pool, charts)
+    return cases
+
+
+# Query Backend Benchmarks
+# The roll-ups behind the EDA charts and the RFM windows on every query backend
+# that is installed, each checked first to return exactly what the pandas cube
+# and engine return
+def query_cases(df, cube, engine, path, min_date, max_date, states):
+    queries = {
+        "totals": lambda cube: cube.totals(min_date, max_date, by='customer_state', method='mean', states=states),
+        "rollup": lambda cube: cube.rollup(min_date, max_date, freq='1W', method='sum'),
+        "rollup_by_state": lambda cube: cube.rollup(min_date, max_date, freq='1M', method='sum', states=states, by_state=True),
+    }
+    cubes, engines = {"pandas": cube}, {"pandas": engine}
+    try:
+        cubes["duckdb"] = DuckDBCube(df, path=path)
+        engines["duckdb"] = DuckDBRFM(df, path=path)
+    except ImportError as error:
+        print(f"skipping the duckdb backend: {error}", file=sys.stderr)
+
+    cases = {}
+    for backend, backend_cube in cubes.items():
+        for name, query in queries.items():
+            expected, result = query(cube), query(backend_cube)
+            if isinstance(expected, pd.DataFrame):
+                pd.testing.assert_frame_equal(expected, result, check_exact=True)
+            else:
+                pd.testing.assert_series_equal(expected, result, check_exact=True)
+            cases[f"query.{name}.{backend}"] = lambda query=query, backend_cube=backend_cube: len(query(backend_cube))
+    for backend, backend_engine in engines.items():
+        pd.testing.assert_frame_equal(engine.window(min_date, max_date), backend_engine.window(min_date, max_date), check_exact=True)
+        cases[f"query.rfm_window.{backend}"] = lambda backend_engine=backend_engine: len(backend_engine.window(min_date, max_date))
+    if "duckdb" in cubes:
+        cases["DuckDBCube.build"] = lambda: DuckDBCube(df, path=path)
+    return cases
+
+
+# Approximate Mode Benchmarks
+# Building the stratified samples and answering from them; the rollup case also
+# reports how far the sampled weekly totals were from the exact ones
+def approximate_cases(df, cube, min_date, max_date):
+    sample_cube, sample_rfm = SampleCube(df), SampleRFM(df)
+    exact = cube.rollup(min_date, max_date, freq='1W', method='sum')
+    return {
+        "SampleCube.build": lambda: SampleCube(df),
+        "SampleCube.rollup": lambda: approximation_error(sample_cube.rollup_interval(min_date, max_date, freq='1W', method='sum'), exact),
+        "SampleRFM.build": lambda: SampleRFM(df),
+        "SampleRFM.window.full": lambda: sample_rfm.window(min_date, max_date),
+    }
+
+
+# Function Benchmarks
+# The hot paths of the dashboard on one dataset, each next to the original
+# implementation it replaced where there is one. The three largest states are
+# used wherever a chart takes a state selection.
+def function_cases(path):
+    parsed = data_loader.parse_main_csv(path)
+    df = data_loader.load_main_data(path)
+    engine = RFMEngine(df)
+    cube = AggregateCube(df)
+
+    min_date, max_date = df["order_approved_at"].min(), df["order_approved_at"].max()
+    start_date = max_date - pd.Timedelta(days=365)
+    states = list(parsed["customer_state"].value_counts().index[:3].astype(str))
+    rfm_df = engine.window(min_date, max_date)
+    recency = rfm_df["recency"]
+    monetary = engine.window_index(min_date, max_date).metrics["monetary"]
+    low, high = np.percentile(monetary.sorted, [10, 90])
+
+    def cold_load():
+        data_loader.clear_cache()
+        shutil.rmtree(data_loader.store_path(os.path.abspath(path)), ignore_errors=True)
+        data_loader.load_main_data(path)
+
+    def store_load():
+        data_loader.clear_cache()
+        data_loader.load_main_data(path)
+
+    charts = {
+        "lineplotfunct1": (lineplotfunct1, (cube, min_date, max_date), dict(xlabel='Dates', ylabel='Transaction Value', title='Total Transaction Trend',
+                                                                             freq='1M', method='sum')),
+        "lineplotfunct2": (lineplotfunct2, (cube, min_date, max_date), dict(states=states, hue='customer_state', xlabel='Dates', ylabel='Transaction Value',
+                                                                             title='Total Transaction Value By States', freq='1M', method='sum')),
+        "barplotfunc2": (barplotfunc2, (), dict(cube=cube, min_date_filter=min_date, max_date_filter=max_date, states=states, xlabel='Transaction Value',
+                                                ylabel='State', title='Average Transaction Value by State', method='mean')),
+        "histplotfunc": (histplotfunc, (recency,), dict(start=recency.min(), end=recency.max(), xlabel='Days', ylabel='Total Customer',
+                                                        title='Histogram of Recency by Customer')),
+    }
+
+    cases = {
+        "parse_main_csv": lambda: data_loader.parse_main_csv(path),
+        "load_main_data.cold_csv": cold_load,
+        "load_main_data.cold_store": store_load,
+        "load_main_data.warm": lambda: data_loader.load_main_data(path),
+        "create_rfm_df.full": lambda: create_rfm_df(parsed),
+        "create_rfm_df.last_year": lambda: create_rfm_df(parsed[(parsed["order_approved_at"] >= start_date) & (parsed["order_approved_at"] <= max_date)]),
+        "RFMEngine.build": lambda: RFMEngine(df),
+        "RFMEngine.window.full": lambda: engine.window(min_date, max_date),
+        "RFMEngine.window.last_year": lambda: engine.window(start_date, max_date),
+        "date_filter.boolean_mask": lambda: df[(df["order_approved_at"] >= start_date) & (df["order_approved_at"] <= max_date)],
+        "date_filter.slice_date_range": lambda: slice_date_range(df, start_date, max_date),
+        "AggregateCube.build": lambda: AggregateCube(df),
+        "RFMWindow.build": lambda: RFMWindow(engine.window(start_date, max_date)),
+        "slider_histogram.mask": lambda: np.histogram(monetary.values[(monetary.values >= low) & (monetary.values <= high)], bins="auto"),
+        "slider_histogram.index": lambda: monetary.histogram(low, high),
+        "top5.sort_values": lambda: monetary.values.sort_values(ascending=False).head(5),
+        "top5.index": lambda: monetary.largest(5),
+        "sketch_rfm": lambda: len(sketch_rfm(rfm_df)),
+        "score_rfm": lambda: score_rfm(rfm_df),
+    }
+    for name, (func, args, kwargs) in charts.items():
+        cases[name] = lambda func=func, args=args, kwargs=kwargs: render(func, *args, **kwargs)
+        cases[f"vega.{name}"] = lambda func=func, args=args, kwargs=kwargs: render_vega(func, *args, **kwargs)
+    cases.update(chart_pool_cases(eda_charts(path, cube, min_date, max_date, states), os.cpu_count() or 1))
+    cases.update(query_cases(df, cube, engine, path, min_date, max_date, states))
+    cases.update(approximate_cases(df, cube, min_date, max_date))
+    return cases, states
+
+
+@contextmanager
+def selected_page(page):
+    import streamlit_option_menu
+    option_menu = streamlit_option_menu.option_menu
+    streamlit_option_menu.option_menu = lambda *args, **kwargs: page
+    try:
+        yield
+    finally:
+        streamlit_option_menu.option_menu = option_menu
+
+
+# Page Run Function
+# One full script run of a dashboard page in streamlit's AppTest. The EDA page
+# only draws its state charts once states are picked, so its run includes
+# picking the given states and the rerun that triggers. Returns the time to
+# first render of the first script run, read from the dashboard's timing log.
+def run_page(page, data_dir, states=()):
+    from streamlit.testing.v1 import AppTest
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_path = os.path.join(log_dir, "timing.jsonl")
+        previous_log = os.environ.get(TIMING_LOG_ENV)
+        os.environ[TIMING_LOG_ENV] = log_path
+        previous = os.getcwd()
+        os.chdir(data_dir)
+        try:
+            with selected_page(page):
+                app = AppTest.from_file(DASHBOARD_SCRIPT, default_timeout=3600)
+                app.run()
+                if app.multiselect:
+                    for state in states:
+                        app.multiselect[0].select(state)
+                    app.run()
+        finally:
+            os.chdir(previous)
+            if previous_log is None:
+                del os.environ[TIMING_LOG_ENV]
+            else:
+                os.environ[TIMING_LOG_ENV] = previous_log
+        if app.exception:
+            raise RuntimeError(f"{page} failed: {app.exception[0].value}")
+
+        with open(log_path) as f:
+            first_run = json.loads(f.readline())
+    return {"first_render_seconds": first_run.get("first_render_seconds")}
+
+
+# Page Benchmarks
+# "cold" with every process cache emptied (dataset, derived structures,
+# figures, table pages), "warm" as the rerun that follows it, and "startup" in
+# a fresh interpreter, which also pays for importing the dashboard's modules.
+def page_cases(data_dir, states):
+    def run(page, cold):
+        if cold:
+            data_loader.clear_cache()
+            figure_cache.clear()
+            page_cache.clear()
+        return run_page(page, data_dir, states)
+
+    def startup(page):
+        command = f"import json, benchmark; print(json.dumps(benchmark.run_page({page!r}, {data_dir!r}, {list(states)!r})))"
+        environment = {**os.environ, "PYTHONPATH": os.pathsep.join([REPOSITORY_DIR, os.environ.get("PYTHONPATH", "")])}
+        output = subprocess.run([sys.executable, "-c", command], env=environment, capture_output=True, text=True, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    cases = {}
+    for page in PAGES:
+        cases[f"page.{page}.startup"] = lambda page=page: startup(page)
+        cases[f"page.{page}.cold"] = lambda page=page: run(page, cold=True)
+        cases[f"page.{page}.warm"] = lambda page=page: run(page, cold=False)
+    return cases
+
+
+def dataset_path(work_dir, rows, seed, regenerate=False):
+    data_dir = os.path.join(work_dir, f"rows_{rows}_seed_{seed}")
+    path = os.path.join(data_dir, "main_data.csv")
+    if regenerate or not os.path.exists(path):
+        shutil.rmtree(data_dir, ignore_errors=True)
+        os.makedirs(data_dir)
+        write_main_data(path, rows, seed)
+    return path
+
+
+def versions():
+    import streamlit
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "matplotlib": matplotlib.__version__,
+        "seaborn": sns.__version__,
+        "streamlit": streamlit.__version__,
+    }
+
+
+# Verification Functions
+#
+# The fast paths checked against the pandas code they replaced, on one
+# dataset: RFM windows of both backends against create_rfm_df, and roll-ups
+# and totals of both cubes against the groupbys of the original chart
+# functions on the float payment values, over a few date windows. The cubes and engines are checked once built from all the
+# orders, once built from the first 80% with the rest applied as three batches
+# in date order, and once with the rest dealt out as three batches whose dates
+# interleave. Nothing is written to the dataset's store.
+#
+# Tolerances: the cubes sum whole cents, pandas sums the float values, so the
+# sum, mean and std of the roll-ups and totals are checked to a relative
+# VERIFY_RTOL and their counts exactly. RFM windows are exact, except their
+# monetary after the interleaved batches: a customer's payments are then added
+# in arrival order, not in date order like pandas does, which may change the
+# last bits of the sum, so it is checked to VERIFY_RTOL as well.
+VERIFY_FREQS = ['1D', '1W', '1M', '1Q']
+VERIFY_METHODS = ['sum', 'mean', 'count', 'std']
+VERIFY_RTOL = 1e-12
+
+
+# Groupby of the original chart functions (lineplotfunct1, lineplotfunct2,
+# barplotfunc2) on the orders of the window
+def expected_group(orders, by, method):
+    grouped = orders.groupby(by=by, observed=True)
+    if(method == 'count'):
+        return grouped['order_approved_at'].count().rename('payment_value')
+    return getattr(grouped['payment_value'], method)()
+
+
+def expected_rollup(df, min_date, max_date, freq, method, states=None, by_state=False):
+    orders = slice_date_range(df, min_date, max_date)
+    if states is not None:
+        orders = orders[orders["customer_state"].isin(states)]
+    by = [pd.Grouper(key="order_approved_at", freq=freq)]
+    if by_state:
+        by = ["customer_state"] + by
+
+    series = expected_group(orders, by, method)
+    if by_state:
+        series = series.reset_index()
+        series["customer_state"] = series["customer_state"].astype(str)
+    return series
+
+
+def expected_totals(df, min_date, max_date, by, method, states=None):
+    orders = slice_date_range(df, min_date, max_date)
+    if states is not None:
+        orders = orders[orders["customer_state"].isin(states)]
+    series = expected_group(orders, [by], method)
+    series.index = series.index.astype(str)
+    return series
+
+
+# Cubes and RFM engines of every installed backend, built from all the orders
+# and from the first 80% plus three batches (in date order, then interleaved),
+# with the relative tolerance of their RFM monetary
+def verify_structures(df):
+    head = df.iloc[:len(df) * 4 // 5]
+    rest = np.arange(len(head), len(df))
+    splits = {
+        "batches": (np.array_split(rest, 3), None),
+        "interleaved": ([rest[i::3] for i in range(3)], VERIFY_RTOL),
+    }
+    builders = {"pandas": (AggregateCube, RFMEngine)}
+    try:
+        import duckdb  # noqa: F401
+        builders["duckdb"] = (DuckDBCube, DuckDBRFM)
+    except ImportError as error:
+        print(f"skipping the duckdb backend: {error}", file=sys.stderr)
+
+    structures = []
+    for backend, (cube_class, engine_class) in builders.items():
+        structures.append((backend, cube_class(df), engine_class(df), None))
+        for split, (batches, rtol) in splits.items():
+            cube, engine = cube_class(head), engine_class(head)
+            for rows in batches:
+                cube.apply_batch(df.iloc[rows])
+                engine.apply_batch(df.iloc[rows])
+            structures.append((f"{backend}+{split}", cube, engine, rtol))
+    return structures
+
+
+def verify_dataset(path):
+    df = data_loader.load_main_data(path)
+    min_date, max_date = df["order_approved_at"].min(), df["order_approved_at"].max()
+    windows = [
+        (min_date, max_date),
+        (max_date - pd.Timedelta(days=365), max_date),
+        (min_date + pd.Timedelta(days=90), min_date + pd.Timedelta(days=120)),
+        (max_date, max_date),
+    ]
+    states = list(df["customer_state"].value_counts().index[:3].astype(str))
+
+    checks, mismatches = 0, []
+
+    def check(name, expected, result, rtol=None):
+        nonlocal checks
+        checks += 1
+        try:
+            if isinstance(expected, pd.DataFrame) and rtol is not None:
+                tolerant = [column for column in ["monetary", "payment_value"] if column in expected.columns]
+                pd.testing.assert_frame_equal(expected[tolerant], result[tolerant], check_exact=False, rtol=rtol, atol=0)
+                expected, result = expected.drop(columns=tolerant), result.drop(columns=tolerant)
+            if isinstance(expected, pd.DataFrame):
+                pd.testing.assert_frame_equal(expected, result, check_exact=True)
+            elif rtol is not None:
+                pd.testing.assert_series_equal(expected, result, check_exact=False, rtol=rtol, atol=0)
+            else:
+                pd.testing.assert_series_equal(expected, result, check_exact=True)
+        except AssertionError as error:
+            mismatches.append(f"{name}: {str(error).strip().splitlines()[0]}")
+
+    for backend, cube, engine, rtol in verify_structures(df):
+        for start_date, end_date in windows:
+            window = f"{backend} {start_date.date()}..{end_date.date()}"
+            check(f"rfm_window {window}", create_rfm_df(slice_date_range(df, start_date, end_date)), engine.window(start_date, end_date), rtol)
+            for method in VERIFY_METHODS:
+                value_rtol = None if method == 'count' else VERIFY_RTOL
+                for freq in VERIFY_FREQS:
+                    check(f"rollup {window} {freq} {method}", expected_rollup(df, start_date, end_date, freq, method),
+                          cube.rollup(start_date, end_date, freq=freq, method=method), value_rtol)
+                    check(f"rollup_by_state {window} {freq} {method}", expected_rollup(df, start_date, end_date, freq, method, states, by_state=True),
+                          cube.rollup(start_date, end_date, freq=freq, method=method, states=states, by_state=True), value_rtol)
+                for by in ["customer_state", "payment_type"]:
+                    check(f"totals {window} {by} {method}", expected_totals(df, start_date, end_date, by, method),
+                          cube.totals(start_date, end_date, by=by, method=method), value_rtol)
+                    check(f"totals {window} {by} {method} states", expected_totals(df, start_date, end_date, by, method, states),
+                          cube.totals(start_date, end_date, by=by, method=method, states=states), value_rtol)
+    return checks, mismatches
+
+
+# Benchmark Function
+def run_benchmarks(sizes=BENCHMARK_SIZES, seed=0, work_dir="benchmark_data", repeat=3, memory=True, pages=True, select=None, regenerate=False):
+    matplotlib.use("Agg")
+    sns.set(style='dark')
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": seed,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions(),
+        "results": [],
+    }
+
+    for rows in sizes:
+        path = dataset_path(work_dir, rows, seed, regenerate)
+        cases, states = function_cases(path)
+        if pages:
+            cases.update(page_cases(os.path.dirname(path), states))
+
+        for name, func in cases.items():
+            if select and not any(word in name for word in select):
+                continue
+            result = {"rows": rows, "kind": "page" if name.startswith("page.") else "function", "name": name}
+            result.update(measure(func, repeat=repeat, memory=memory))
+            report["results"].append(result)
+            print(f"{rows:>10} {name:<40} {result['seconds_median']:>10.4f}s"
+                  + ("" if result["peak_bytes"] is None else f" {result['peak_bytes'] / 2 ** 20:>10.1f} MB")
+                  + ("" if result.get("first_render_seconds") is None else f"  first render {result['first_render_seconds']:.4f}s")
+                  + ("" if result.get("payload_bytes") is None else f"  payload {result['payload_bytes'] / 1024:.1f} KB"), file=sys.stderr)
+
+        data_loader.clear_cache()
+    return report
+
+
+# Comparison Function
+# Median time of every (rows, name) of a new report against a baseline report
+def compare_reports(baseline, current, threshold=1.2):
+    before = {(result["rows"], result["name"]): result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        old = before.get((result["rows"], result["name"]))
+        if old is None:
+            continue
+        ratio = result["seconds_median"] / old["seconds_median"] if old["seconds_median"] else float("inf")
+        rows.append({
+            "rows": result["rows"],
+            "name": result["name"],
+            "baseline_seconds": old["seconds_median"],
+            "seconds": result["seconds_median"],
+            "ratio": ratio,
+            "regression": ratio > threshold,
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard hot paths and pages on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=BENCHMARK_SIZES, help="dataset sizes in rows")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data")
+    parser.add_argument("--work-dir", default="benchmark_data", help="where the synthetic datasets are kept")
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls per benchmark")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory pass")
+    parser.add_argument("--no-pages", action="store_true", help="skip the dashboard page runs")
+    parser.add_argument("--select", nargs="+", default=None, help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--regenerate", action="store_true", help="write the synthetic datasets again")
+    parser.add_argument("--output", default="benchmark_results.json", help="json report to write")
+    parser.add_argument("--compare", default=None, help="baseline json report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    parser.add_argument("--verify", action="store_true", help="only check the cubes and RFM engines against plain pandas, no timings")
+    args = parser.parse_args()
+
+    if args.verify:
+        failed = False
+        for rows in args.sizes:
+            checks, mismatches = verify_dataset(dataset_path(args.work_dir, rows, args.seed, args.regenerate))
+            data_loader.clear_cache()
+            for mismatch in mismatches:
+                print(f"{rows:>10} MISMATCH {mismatch}")
+            print(f"{rows:>10} {checks - len(mismatches)} of {checks} checks passed")
+            failed = failed or bool(mismatches)
+        sys.exit(1 if failed else 0)
+
+    report = run_benchmarks(args.sizes, args.seed, args.work_dir, args.repeat, not args.no_memory, not args.no_pages, args.select, args.regenerate)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {len(report['results'])} results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparison = compare_reports(baseline, report, args.threshold)
+        print(comparison.to_string(index=False))
+        if len(comparison) and comparison["regression"].any():
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
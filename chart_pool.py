@@ -0,0 +1,208 @@
+# Dashboard Libraries
+from aggregate_cube import read_cells, write_cells
+from data_loader import DerivedReference, resolve, store_path
+from figure_cache import figure_cache
+from instrumentation import span
+
+# Standard Library
+import atexit
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import shutil
+import threading
+
+
+# Number of chart worker processes; 0 or 1 renders in the script thread, as
+# before. Defaults to one per core, up to the 7 charts of the EDA page.
+CHART_WORKERS_ENV = "RFM_DASHBOARD_CHART_WORKERS"
+MAX_CHART_WORKERS = 7
+
+
+def default_workers():
+    value = os.environ.get(CHART_WORKERS_ENV)
+    if value:
+        return int(value)
+    return min(MAX_CHART_WORKERS, os.cpu_count() or 1)
+
+
+# Worker Functions
+#
+# A worker imports matplotlib (Agg), seaborn and the plot functions once and
+# resolves the shared structures it was started with (e.g. the cube's cells)
+# from the memory-mapped store, so every chart it renders afterwards only pays
+# for its own roll-up and savefig.
+def warm_worker(references):
+    import matplotlib
+    matplotlib.use("Agg")
+    import plot_functions  # noqa: F401 (pyplot, seaborn theme)
+
+    for reference in references:
+        reference.resolve()
+
+
+def render_chart(func, args, kwargs):
+    args = [resolve(value) for value in args]
+    kwargs = {name: resolve(value) for name, value in kwargs.items()}
+    return figure_cache.rasterize(func, *args, **kwargs)
+
+
+# Cube Cells
+#
+# What a chart job carries in place of a cube reference: the directory the
+# parent wrote the cube's daily cells to (see write_cells). A worker
+# memory-maps them into an AggregateCube once per dataset version instead of
+# loading the frame and regrouping every order; the backend only matters to
+# the parent, the cells are the same. Resolves the reference itself if the
+# cells were removed in the meantime.
+_worker_cubes = {}
+
+
+class CubeCells(DerivedReference):
+    def __init__(self, reference, directory, fingerprint):
+        super().__init__(reference.path, reference.name, reference.build)
+        self.directory = directory
+        self._fingerprint = fingerprint
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint
+
+    def resolve(self):
+        cube = _worker_cubes.get(self.directory)
+        if cube is None:
+            cube = read_cells(self.directory)
+            if cube is None:
+                return super().resolve()
+            # one dataset version at a time
+            _worker_cubes.clear()
+            _worker_cubes[self.directory] = cube
+        return cube
+
+
+# Cells of the cube a reference stands for, written next to the column store
+# once per fingerprint; the cells of older versions are removed. None when the
+# structure is no cube or the store is not writable.
+def publish_cells(reference):
+    cube = reference.resolve()
+    if not hasattr(cube, "daily"):
+        return None
+
+    store = store_path(reference.path)
+    directory = os.path.join(store, f"{reference.name}-{cube.fingerprint}")
+    if not os.path.isdir(directory):
+        with span("publish_cells"):
+            if not write_cells(directory, cube.daily, cube.fingerprint):
+                return None
+        for name in os.listdir(store):
+            stale = os.path.join(store, name)
+            if name.startswith(f"{reference.name}-") and stale != directory and "." not in name:
+                shutil.rmtree(stale, ignore_errors=True)
+    return CubeCells(reference, directory, cube.fingerprint)
+
+
+# Deferred Chart
+# Future-like chart of the inline mode: rendered in the script thread when the
+# page asks for its result, so charts still appear one by one as before.
+class DeferredChart:
+    def __init__(self, key, func, args, kwargs):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self._png = None
+
+    def result(self):
+        if self._png is None:
+            with span(f"chart:{self.func.__name__}") as record:
+                self._png = render_chart(self.func, self.args, self.kwargs)
+                figure_cache.store(self.key, self._png)
+                record.update(cache="miss", bytes=len(self._png))
+        return self._png
+
+
+# Chart Pool
+#
+# Renders charts in worker processes: pyplot is global state, so figures
+# cannot be drawn concurrently in threads. submit() returns a future of the PNG
+# straight away, so a page submits all of its charts first and shows each one,
+# in page order, when it is ready. PNGs go through the process-wide figure
+# cache; a hit never reaches the pool. Cubes are passed as the CubeCells of
+# their reference, other structures as DerivedReference, so a job only pickles
+# dates, labels and small series.
+class ChartPool:
+    def __init__(self, workers=None):
+        self.workers = default_workers() if workers is None else workers
+        self._executor = None
+        self._lock = threading.Lock()
+        # (path, name) of a cube reference -> (fingerprint, CubeCells or None)
+        self._cells = {}
+        self._cells_lock = threading.Lock()
+
+    def executor(self, references):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking the multi-threaded streamlit server is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=warm_worker,
+                    initargs=(references,),
+                )
+            return self._executor
+
+    # The argument a job carries for a plot argument
+    def job_value(self, value):
+        if not isinstance(value, DerivedReference):
+            return value
+
+        key, fingerprint = (value.path, value.name), value.fingerprint
+        with self._cells_lock:
+            if self._cells.get(key, (None,))[0] != fingerprint:
+                self._cells[key] = (fingerprint, publish_cells(value))
+            cells = self._cells[key][1]
+        return value if cells is None else cells
+
+    def submit(self, func, *args, **kwargs):
+        with span(f"chart:{func.__name__}") as record:
+            key = figure_cache.key(func, args, kwargs)
+            png = figure_cache.get(key)
+            if png is not None:
+                record.update(cache="hit", bytes=len(png))
+                future = Future()
+                future.set_result(png)
+                return future
+
+            if self.workers <= 1:
+                record.update(cache="miss", pool=False)
+                return DeferredChart(key, func, args, kwargs)
+
+            # the cache key above is that of the original arguments
+            args = [self.job_value(value) for value in args]
+            kwargs = {name: self.job_value(value) for name, value in kwargs.items()}
+            references = [value for value in (*args, *kwargs.values()) if isinstance(value, DerivedReference)]
+            try:
+                future = self.executor(references).submit(render_chart, func, args, kwargs)
+            except BrokenProcessPool:
+                # a worker died (e.g. killed for memory): start a fresh pool
+                self.shutdown()
+                future = self.executor(references).submit(render_chart, func, args, kwargs)
+
+            def store(done):
+                if not done.cancelled() and done.exception() is None:
+                    figure_cache.store(key, done.result())
+
+            future.add_done_callback(store)
+            record.update(cache="miss", pool=True)
+            return future
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+chart_pool = ChartPool()
+atexit.register(chart_pool.shutdown)
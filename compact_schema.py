@@ -0,0 +1,201 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Instrumentation Library
+from instrumentation import timed
+
+
+HEX_ID_COLUMNS = ["order_id", "customer_id", "customer_unique_id"]
+LOW_CARDINALITY_COLUMNS = ["customer_city", "order_status", "customer_state", "payment_type"]
+
+
+# Hex Id Table
+#
+# 32 character hex ids packed into two uint64 words, 16 bytes per id instead of
+# a ~80 byte Python str. The rows are unique and sorted, so the integer codes
+# stored in the dataframe order exactly like the original strings (groupby and
+# sort results are unchanged) and decode back to them.
+#
+# Ids first seen in an incremental batch (see incremental_refresh) get the next
+# free codes after the sorted table; they are re-sorted into it on the next
+# full load of the dataset. Until then sort_keys orders codes like the ids.
+WORD_PAIR = np.dtype([("high", np.uint64), ("low", np.uint64)])
+
+
+def pack_hex_ids(ids):
+    return np.frombuffer(bytes.fromhex("".join(ids)), dtype=">u8").astype(np.uint64).reshape(-1, 2)
+
+
+class HexIdTable:
+    def __init__(self, words):
+        self.words = words
+        self.extra_words = np.empty((0, 2), dtype=np.uint64)
+        self.extra_codes = {}
+
+    @classmethod
+    def encode(cls, ids):
+        words, codes = np.unique(pack_hex_ids(ids), axis=0, return_inverse=True)
+        code_dtype = np.int32 if len(words) < 2 ** 31 else np.int64
+        return cls(words), codes.reshape(-1).astype(code_dtype)
+
+    def words_of(self, codes):
+        if not len(self.extra_words):
+            return self.words[codes]
+        words = np.empty((len(codes), 2), dtype=np.uint64)
+        known = codes < len(self.words)
+        words[known] = self.words[codes[known]]
+        words[~known] = self.extra_words[codes[~known] - len(self.words)]
+        return words
+
+    def decode(self, codes):
+        codes = np.asarray(codes)
+        if len(codes) == 0:
+            return np.array([], dtype=object)
+        hex_text = self.words_of(codes).astype(">u8").tobytes().hex()
+        return np.frombuffer(hex_text.encode("ascii"), dtype="S32").astype("U32").astype(object)
+
+    # Values that sort like the decoded ids (the packed words as one record),
+    # extra ids included
+    def sort_keys(self, codes):
+        codes = np.asarray(codes, dtype=np.int64)
+        return np.ascontiguousarray(self.words_of(codes)).view(WORD_PAIR).ravel()
+
+    # Codes of hex ids, -1 for ids that are not in the table
+    def find(self, ids):
+        words = pack_hex_ids(ids)
+        codes = np.full(len(words), -1, dtype=np.int64)
+        if len(self.words):
+            table = np.ascontiguousarray(self.words).view(WORD_PAIR).ravel()
+            wanted = np.ascontiguousarray(words).view(WORD_PAIR).ravel()
+            positions = np.minimum(np.searchsorted(table, wanted), len(table) - 1)
+            found = table[positions] == wanted
+            codes[found] = positions[found]
+        for i in np.flatnonzero(codes < 0):
+            codes[i] = self.extra_codes.get((int(words[i, 0]), int(words[i, 1])), -1)
+        return codes
+
+    # Codes of hex ids, giving the next free code to every id not seen before
+    def extend(self, ids):
+        words = pack_hex_ids(ids)
+        codes = self.find(ids)
+        new_words = []
+        for i in np.flatnonzero(codes < 0):
+            key = (int(words[i, 0]), int(words[i, 1]))
+            if key not in self.extra_codes:
+                self.extra_codes[key] = len(self.words) + len(self.extra_codes)
+                new_words.append(words[i])
+            codes[i] = self.extra_codes[key]
+        if new_words:
+            self.extra_words = np.vstack([self.extra_words, np.array(new_words, dtype=np.uint64)])
+        return codes.astype(np.int32 if len(self) < 2 ** 31 else np.int64)
+
+    # Position of a 128-bit id value in the sorted table
+    def searchsorted(self, value, side="left"):
+        high, low = np.uint64(value >> 64), np.uint64(value & (2 ** 64 - 1))
+        first = np.searchsorted(self.words[:, 0], high, side="left")
+        last = np.searchsorted(self.words[:, 0], high, side="right")
+        return int(first + np.searchsorted(self.words[first:last, 1], low, side=side))
+
+    # Codes [start, stop) of every id starting with a hex prefix
+    def prefix_range(self, prefix):
+        prefix = prefix.strip().lower()
+        if len(prefix) > 32 or any(char not in "0123456789abcdef" for char in prefix):
+            return 0, 0
+        start = self.searchsorted(int(prefix.ljust(32, "0"), 16), side="left")
+        stop = self.searchsorted(int(prefix.ljust(32, "f"), 16), side="right")
+        return start, stop
+
+    # Codes of the unsorted extra ids starting with a hex prefix
+    def extra_prefix_codes(self, prefix):
+        prefix = prefix.strip().lower()
+        if not len(self.extra_words):
+            return np.array([], dtype=np.int64)
+        extra = self.decode(np.arange(len(self.words), len(self)))
+        return np.arange(len(self.words), len(self))[[text.startswith(prefix) for text in extra]]
+
+    def __len__(self):
+        return len(self.words) + len(self.extra_words)
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes + self.extra_words.nbytes
+
+
+def is_hex_ids(values):
+    return bool(values.notna().all() and values.str.fullmatch("[0-9a-f]{32}").all())
+
+
+# Compact Schema
+#
+# Everything needed to turn the compact frame back into the frame parsed from
+# the csv: the id lookup tables and the original dtype of every column.
+class CompactSchema:
+    def __init__(self, id_tables, dtypes):
+        self.id_tables = id_tables
+        self.dtypes = dtypes
+
+    # Compact copy of newly parsed rows, for incremental batches
+    def encode(self, df):
+        columns = {}
+        for column in df.columns:
+            if column in self.id_tables:
+                columns[column] = pd.Series(self.id_tables[column].extend(df[column].to_numpy()), index=df.index, name=column)
+            else:
+                columns[column] = compact_values(column, df[column])
+        return pd.DataFrame(columns, index=df.index)
+
+    def decode(self, column, codes):
+        table = self.id_tables.get(column)
+        if table is None:
+            return np.asarray(codes)
+        return table.decode(codes)
+
+    # Original representation of (a slice of) the compact frame, for display
+    def expand(self, df):
+        columns = {}
+        for column in df.columns:
+            values = df[column]
+            if column in self.id_tables:
+                values = pd.Series(self.decode(column, values.to_numpy()), index=df.index, name=column)
+            elif column in self.dtypes and str(values.dtype) != self.dtypes[column]:
+                values = values.astype(self.dtypes[column])
+            columns[column] = values
+        return pd.DataFrame(columns, index=df.index)
+
+
+# Compact Frame Function
+# hex ids -> int codes, low cardinality strings -> category, integral numbers ->
+# the narrowest integer dtype. payment_value stays float64: float32 cannot hold
+# every cent amount exactly.
+@timed("compact_frame")
+def compact_frame(df):
+    id_tables = {}
+    dtypes = {column: str(df[column].dtype) for column in df.columns}
+    columns = {}
+
+    for column in df.columns:
+        values = df[column]
+        if column in HEX_ID_COLUMNS and values.dtype == object and is_hex_ids(values):
+            id_tables[column], codes = HexIdTable.encode(values.to_numpy())
+            values = pd.Series(codes, index=df.index, name=column)
+        else:
+            values = compact_values(column, values)
+        columns[column] = values
+
+    return pd.DataFrame(columns, index=df.index), CompactSchema(id_tables, dtypes)
+
+
+def compact_values(column, values):
+    if column in LOW_CARDINALITY_COLUMNS:
+        return values.astype("category")
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return pd.to_numeric(values, downcast="integer")
+    if pd.api.types.is_float_dtype(values.dtype) and values.notna().all() and (values % 1 == 0).all():
+        return pd.to_numeric(values.astype(np.int64), downcast="integer")
+    return values
+
+
+# Memory Usage Function
+def column_memory(df):
+    return {column: int(nbytes) for column, nbytes in df.memory_usage(index=False, deep=True).items()}
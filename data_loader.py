@@ -0,0 +1,560 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Compact Schema Library
+from compact_schema import CompactSchema, HexIdTable, column_memory, compact_frame
+
+# Instrumentation Library (spans show up in the dashboard's timing panel)
+from instrumentation import span, timed
+
+# Standard Library
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+
+
+DATETIME_COLUMNS = ["order_purchase_timestamp", "order_approved_at"]
+CATEGORY_COLUMNS = ["customer_state", "payment_type"]
+
+# Loaded datasets are shared by every rerun and every session of the process,
+# keyed by the absolute path of the source csv. Callers must treat the returned
+# dataframe as read-only.
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+# Source File Signature Function
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# limit: hash only the first limit bytes (the base of an appended file)
+@timed("file_hash")
+def file_hash(path, chunk_size=1 << 20, limit=None):
+    digest = hashlib.md5()
+    remaining = float("inf") if limit is None else limit
+    with open(path, "rb") as f:
+        while remaining > 0:
+            chunk = f.read(int(min(chunk_size, remaining)))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+# Watermark Function
+#
+# Written by incremental_refresh next to the csv. base_md5/base_bytes identify
+# the prefix of the file the columnar store was built from, bytes is the end of
+# the last batch completely appended after it (pending is set while a batch is
+# being written), so readers only ever parse whole batches.
+def watermark_path(path):
+    return os.path.splitext(path)[0] + ".watermark.json"
+
+
+def read_watermark(path):
+    try:
+        with open(watermark_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_watermark(path, watermark):
+    target = watermark_path(path)
+    staging = f"{target}.tmp-{os.getpid()}"
+    with open(staging, "w") as f:
+        json.dump(watermark, f)
+    os.replace(staging, target)
+
+
+def remove_watermark(path):
+    try:
+        os.remove(watermark_path(path))
+    except OSError:
+        pass
+
+
+# Columnar Store Function
+#
+# One .npy file per column (categoricals as int codes plus their categories in
+# meta.json, id tables as packed words). The files are opened with
+# mmap_mode='r', so every session and every worker process on the machine reads
+# the same page-cache pages instead of holding its own copy, and the arrays are
+# read-only by construction.
+def store_path(path):
+    return os.path.splitext(path)[0] + ".store"
+
+
+# Memory-mapped frame of the column files listed in a store's meta
+def read_columns(directory, meta):
+    columns = {}
+    for position, column in enumerate(meta["columns"]):
+        values = np.load(os.path.join(directory, f"column_{position:02d}.npy"), mmap_mode="r").view(np.ndarray)
+        if column["name"] in meta["categories"]:
+            values = pd.Categorical.from_codes(values, categories=meta["categories"][column["name"]])
+        columns[column["name"]] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+# Writes the column files of df to directory and lists them in meta
+def write_columns(directory, df, meta):
+    meta["columns"], meta["categories"] = [], {}
+    for position, column in enumerate(df.columns):
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            meta["categories"][column] = [str(category) for category in values.cat.categories]
+            values = values.cat.codes
+        elif values.dtype == object:
+            codes, categories = pd.factorize(values)
+            meta["categories"][column] = [str(category) for category in categories]
+            values = pd.Series(codes)
+        np.save(os.path.join(directory, f"column_{position:02d}.npy"), values.to_numpy())
+        meta["columns"].append({"name": column, "dtype": str(df[column].dtype)})
+
+
+@timed("read_store")
+def read_store(path, digest):
+    directory = store_path(path)
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("source_md5") != digest:
+            return None
+
+        df = read_columns(directory, meta)
+        id_tables = {
+            column: HexIdTable(np.load(os.path.join(directory, f"ids_{column}.npy"), mmap_mode="r").view(np.ndarray))
+            for column in meta["id_columns"]
+        }
+    except (OSError, ValueError, KeyError):
+        return None
+    return df, CompactSchema(id_tables, meta["dtypes"]), meta["memory_before"]
+
+
+@timed("write_store")
+def write_store(path, digest, df, schema, memory_before, source_bytes):
+    directory = store_path(path)
+    staging = f"{directory}.tmp-{os.getpid()}"
+    meta = {
+        "source": os.path.basename(path),
+        "source_md5": digest,
+        "source_bytes": source_bytes,
+        "id_columns": list(schema.id_tables),
+        "dtypes": schema.dtypes,
+        "memory_before": memory_before,
+    }
+
+    try:
+        os.makedirs(staging, exist_ok=True)
+        write_columns(staging, df, meta)
+        for column, table in schema.id_tables.items():
+            np.save(os.path.join(staging, f"ids_{column}.npy"), table.words)
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        # swap the finished store in; if another process won the race, keep theirs
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+    except OSError:
+        # Without a writable directory we simply keep the in-memory copy and
+        # parse the csv again on the next cold start.
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def read_store_meta(path):
+    try:
+        with open(os.path.join(store_path(path), "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Typed Parsing Function
+# first_position: row number of the first data row, for batches read from the
+# middle of the file
+@timed("parse_main_csv")
+def parse_main_csv(path, first_position=0):
+    with span("read_csv"):
+        df = pd.read_csv(path, dtype={column: "category" for column in CATEGORY_COLUMNS})
+    df.index += first_position
+
+    with span("to_datetime"):
+        for column in DATETIME_COLUMNS:
+            df[column] = pd.to_datetime(df[column], format='%Y-%m-%d %H:%M:%S')
+
+    with span("sort"):
+        df.sort_values(by="order_approved_at", inplace=True)
+        df.reset_index(inplace=True)
+
+    # keep day resolution only, the dashboard never looks at the time of day
+    for column in DATETIME_COLUMNS:
+        df[column] = df[column].dt.normalize()
+
+    return df
+
+
+# Byte Range Parsing Function
+# Rows stored in bytes [start, stop) of the csv, parsed like the whole file
+def parse_csv_range(path, start, stop, first_position=0):
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(start)
+        body = f.read(stop - start)
+    return parse_main_csv(io.BytesIO(body if start == 0 else header + body), first_position)
+
+
+# Append Functions
+#
+# Compact rows of appended batches are kept in a small frame of their own, in
+# arrival order, next to the memory-mapped base frame, so applying a batch
+# costs O(batch) and the base stays shared and read-only; derived structures
+# only ever see the new rows. The whole frame (categories widened to cover new
+# values, rows in order_approved_at order) is compacted into the column store
+# the first time it is read after a batch, by whichever process gets there
+# first, and memory-mapped from there like the base (see compacted_path).
+def append_rows(df, batch):
+    columns = {}
+    for column in df.columns:
+        values, added = df[column].reset_index(drop=True), batch[column].reset_index(drop=True)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            added = added.astype("category")
+            categories = values.cat.categories.union(added.cat.categories)
+            values, added = values.cat.set_categories(categories), added.cat.set_categories(categories)
+        columns[column] = pd.concat([values, added], ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def combine_rows(df, appended):
+    combined = append_rows(df, appended)
+    if not combined["order_approved_at"].is_monotonic_increasing:
+        combined = combined.sort_values(by="order_approved_at", kind="stable", ignore_index=True)
+    return combined
+
+
+# Compacted Frame Functions
+#
+# The frame of a store's base plus every batch up to a byte of the csv, one
+# directory per byte position in the store's layout. Batches are replayed in
+# file order, so new ids get the same codes in every process and the frame
+# one process writes is the frame all of them would build. Writing a position
+# removes the others; a process still mapping one keeps its pages.
+def compacted_path(path, applied_bytes):
+    return os.path.join(store_path(path), f"frame-{applied_bytes}")
+
+
+def read_compacted(path, digest, applied_bytes):
+    directory = compacted_path(path, applied_bytes)
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("source_md5") != digest:
+            return None
+        return read_columns(directory, meta)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+@timed("write_compacted")
+def write_compacted(path, digest, applied_bytes, df):
+    directory = compacted_path(path, applied_bytes)
+    staging = f"{directory}.tmp-{os.getpid()}"
+    meta = {"source_md5": digest, "applied_bytes": applied_bytes}
+    try:
+        os.makedirs(staging, exist_ok=True)
+        write_columns(staging, df, meta)
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+
+    for name in os.listdir(store_path(path)):
+        stale = os.path.join(store_path(path), name)
+        if name.startswith("frame-") and "." not in name and stale != directory:
+            shutil.rmtree(stale, ignore_errors=True)
+    return True
+
+
+# Frame Function
+# The loaded frame of a memo entry: the base frame itself until a batch is
+# applied, then the compacted frame of the bytes applied, kept until the next
+# one (a private combination only when the store is not writable)
+def current_frame(entry):
+    if not len(entry["appended"]):
+        return entry["data"]
+    if entry["combined"] is None:
+        path, digest, applied_bytes = entry["stats"]["path"], entry["stats"]["source_md5"], entry["applied_bytes"]
+        combined = read_compacted(path, digest, applied_bytes)
+        if combined is None:
+            with span("combine_rows"):
+                combined = combine_rows(entry["data"], entry["appended"])
+            stored = read_compacted(path, digest, applied_bytes) if write_compacted(path, digest, applied_bytes, combined) else None
+            if stored is not None:
+                combined = stored
+        entry["combined"] = combined
+    return entry["combined"]
+
+
+# Memory of the base frame, the appended rows and the id lookup tables
+def entry_memory(entry):
+    frames = [entry["data"], entry["appended"]]
+    return sum(sum(column_memory(frame).values()) for frame in frames) + sum(table.nbytes for table in entry["schema"].id_tables.values())
+
+
+# Incremental Replay Function
+#
+# Parses the bytes appended since the entry was built and applies them to the
+# appended rows and to every derived structure (RFMEngine, AggregateCube) in
+# O(batch), instead of reloading the whole dataset.
+@timed("apply_appended")
+def apply_appended(entry, path, stop):
+    start = entry["applied_bytes"]
+    if stop <= start:
+        return
+
+    began = time.perf_counter()
+    batch = entry["schema"].encode(parse_csv_range(path, start, stop, entry["stats"]["rows"]))
+    entry["appended"] = append_rows(entry["appended"], batch)
+    entry["combined"] = None
+    for structure in entry.get("derived", {}).values():
+        structure.apply_batch(batch)
+
+    entry["applied_bytes"] = stop
+    stats = entry["stats"]
+    stats["rows"] = len(entry["data"]) + len(entry["appended"])
+    stats["memory_bytes"] = entry_memory(entry)
+    stats["batches_applied"] = stats.get("batches_applied", 0) + 1
+    stats["rows_appended"] = stats.get("rows_appended", 0) + len(batch)
+    stats["refresh_seconds"] = time.perf_counter() - began
+    stats["version"] = f"{stats['source_md5']}:{stop}"
+
+
+# Load Function
+#
+# A csv that only grew by batches recorded in its watermark is refreshed in
+# place (see apply_appended); any other change rebuilds the dataset. On a cold
+# start the store of the base file is reused and the appended tail replayed, as
+# long as the tail is small; past that the whole file is compacted into a new
+# store and the watermark dropped.
+@timed("load_main_data")
+def load_main_data(path="main_data.csv"):
+    path = os.path.abspath(path)
+    signature = file_signature(path)
+
+    with _memo_lock:
+        entry = _memo.get(path)
+        if entry is not None and entry["signature"] == signature:
+            entry["stats"]["hits"] += 1
+            return current_frame(entry)
+
+        watermark = read_watermark(path)
+        if entry is not None and watermark is not None and watermark["base_md5"] == entry["stats"]["source_md5"] \
+                and entry["applied_bytes"] <= watermark["bytes"] <= signature[1]:
+            apply_appended(entry, path, watermark["bytes"])
+            if not watermark.get("pending"):
+                entry["signature"] = signature
+            entry["stats"]["hits"] += 1
+            return current_frame(entry)
+
+        start = time.perf_counter()
+        base_bytes = signature[1]
+        if watermark is not None and watermark["base_bytes"] <= watermark["bytes"] <= signature[1] \
+                and (watermark.get("pending") or watermark["bytes"] - watermark["base_bytes"] <= watermark["base_bytes"] // 4) \
+                and file_hash(path, limit=watermark["base_bytes"]) == watermark["base_md5"]:
+            digest, base_bytes = watermark["base_md5"], watermark["base_bytes"]
+        else:
+            digest = file_hash(path)
+            if watermark is not None and not watermark.get("pending"):
+                watermark = None
+                remove_watermark(path)
+
+        if entry is not None and entry["stats"]["source_md5"] == digest:
+            # the file was touched but its content did not change
+            entry["signature"] = signature
+            entry["stats"]["hits"] += 1
+            return current_frame(entry)
+
+        stored = read_store(path, digest)
+        source = "store"
+        if stored is None:
+            if base_bytes == signature[1]:
+                parsed = parse_main_csv(path)
+            else:
+                parsed = parse_csv_range(path, 0, base_bytes)
+            memory_before = column_memory(parsed)
+            df, schema = compact_frame(parsed)
+            del parsed
+            source = "csv"
+            write_store(path, digest, df, schema, memory_before, base_bytes)
+            # serve the memory-mapped copy, not the private one just built
+            stored = read_store(path, digest)
+            if stored is not None:
+                df, schema, memory_before = stored
+        else:
+            df, schema, memory_before = stored
+
+        stats = {
+            "path": path,
+            "source": source,
+            "source_md5": digest,
+            "rows": len(df),
+            "load_seconds": time.perf_counter() - start,
+            "file_bytes": signature[1],
+            "memory_bytes": sum(column_memory(df).values()) + sum(table.nbytes for table in schema.id_tables.values()),
+            "memory_bytes_before": sum(memory_before.values()),
+            "hits": 0,
+            "version": digest,
+        }
+        entry = _memo[path] = {
+            "signature": signature,
+            "data": df,
+            "schema": schema,
+            "memory_before": memory_before,
+            "stats": stats,
+            "applied_bytes": base_bytes,
+            "appended": df.iloc[:0],
+            "combined": None,
+        }
+        if base_bytes < signature[1] and watermark is not None:
+            apply_appended(entry, path, watermark["bytes"])
+            if watermark.get("pending"):
+                entry["signature"] = None
+
+        return current_frame(entry)
+
+
+# Derived Structure Function
+#
+# Indexes and aggregates built from the dataset live in the same memo entry, so
+# they are built once per process and dropped together with a stale dataset.
+# A build runs under a lock of its own name only: sessions that need the same
+# structure wait for it, every other one keeps loading and reading. Batches
+# applied while it was being built are applied to it before it is published.
+def load_derived(path, name, build):
+    load_main_data(path)
+
+    with _memo_lock:
+        entry = _memo[os.path.abspath(path)]
+        derived = entry.setdefault("derived", {})
+        if name in derived:
+            return derived[name]
+        building = entry.setdefault("building", {}).setdefault(name, threading.Lock())
+
+    with building:
+        with _memo_lock:
+            if name in derived:
+                return derived[name]
+            df, appended = current_frame(entry), len(entry["appended"])
+
+        start = time.perf_counter()
+        with span(f"build:{name}"):
+            structure = build(df)
+
+        with _memo_lock:
+            if len(entry["appended"]) > appended:
+                structure.apply_batch(entry["appended"].iloc[appended:])
+            derived[name] = structure
+            entry["stats"].setdefault("derived_seconds", {})[name] = time.perf_counter() - start
+        return structure
+
+
+# Whether load_derived(path, name, ...) returns without building anything;
+# never waits for a build in progress
+def derived_ready(path, name):
+    load_main_data(path)
+    with _memo_lock:
+        return name in _memo[os.path.abspath(path)].get("derived", {})
+
+
+# Background Build Function
+# Runs a build (e.g. DerivedReference.resolve) in a daemon thread, so a page
+# can show a sampled preview meanwhile; the exact path then waits for that
+# build through load_derived instead of starting its own.
+def build_in_background(func, *args):
+    thread = threading.Thread(target=func, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+# Derived Reference
+#
+# Picklable stand-in for load_derived(path, name, build). A worker process
+# resolves it against its own memo, backed by the same memory-mapped store,
+# instead of receiving a pickled copy of the structure.
+class DerivedReference:
+    def __init__(self, path, name, build):
+        self.path = os.path.abspath(path)
+        self.name = name
+        self.build = build
+
+    def resolve(self):
+        return load_derived(self.path, self.name, self.build)
+
+    # cache key of the structure it stands for (see figure_cache.fingerprint)
+    @property
+    def fingerprint(self):
+        return self.resolve().fingerprint
+
+
+# The structure a plot argument stands for, any other argument as it is
+def resolve(value):
+    return value.resolve() if isinstance(value, DerivedReference) else value
+
+
+# Dataset Version Function
+# Changes with every rebuild and every applied batch, for cache keys
+def dataset_version(path="main_data.csv"):
+    load_main_data(path)
+    return _memo[os.path.abspath(path)]["stats"]["version"]
+
+
+# Compact Schema Function
+# Id lookup tables and original dtypes of the loaded frame (see compact_schema)
+def load_schema(path="main_data.csv"):
+    load_main_data(path)
+    return _memo[os.path.abspath(path)]["schema"]
+
+
+# Memory Report Function
+# Per column footprint of the frame as parsed from the csv against the compact
+# frame actually held in memory (id columns include their lookup table).
+def memory_report(path="main_data.csv"):
+    df = load_main_data(path)
+    entry = _memo[os.path.abspath(path)]
+    schema = entry["schema"]
+
+    after = column_memory(df)
+    for column, table in schema.id_tables.items():
+        after[column] += table.nbytes
+
+    report = pd.DataFrame({
+        "before_dtype": pd.Series(schema.dtypes),
+        "before_bytes": pd.Series(entry["memory_before"]),
+        "after_dtype": df.dtypes.astype(str),
+        "after_bytes": pd.Series(after),
+    })
+    report.loc["total"] = ["", report["before_bytes"].sum(), "", report["after_bytes"].sum()]
+    report["ratio"] = report["before_bytes"] / report["after_bytes"]
+    return report
+
+
+def get_load_stats(path="main_data.csv"):
+    entry = _memo.get(os.path.abspath(path))
+    if entry is None:
+        return None
+    return dict(entry["stats"])
+
+
+def clear_cache():
+    with _memo_lock:
+        _memo.clear()
@@ -0,0 +1,21 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+
+# Date Range Bounds Function
+# df must be sorted by column (main_df and the aggregate cube both are), so the
+# rows between two dates are found with two binary searches instead of a mask.
+def date_range_bounds(df, min_date_filter, max_date_filter, column='order_approved_at'):
+    values = df[column].to_numpy()
+    lo = np.searchsorted(values, pd.to_datetime(min_date_filter).to_datetime64(), side='left')
+    hi = np.searchsorted(values, pd.to_datetime(max_date_filter).to_datetime64(), side='right')
+    return lo, max(lo, hi)
+
+
+# Date Range Slice Function
+# Same rows as df[(df[column] >= min_date_filter) & (df[column] <= max_date_filter)],
+# returned as a positional slice (a view, no row copy)
+def slice_date_range(df, min_date_filter, max_date_filter, column='order_approved_at'):
+    lo, hi = date_range_bounds(df, min_date_filter, max_date_filter, column)
+    return df.iloc[lo:hi]
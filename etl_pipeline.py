@@ -0,0 +1,155 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Standard Library
+import argparse
+import math
+import os
+import shutil
+import tempfile
+import time
+
+
+# Same inputs, join keys and cleaning rules as RFM_Analysis_in_Ecommerce.ipynb:
+# customers -> orders (customer_id) -> payments (order_id), dropna on
+# order_approved_at and payment_value, delivery dates and zip prefix dropped.
+CUSTOMERS_FILE = "customers_dataset.csv"
+ORDERS_FILE = "orders_dataset.csv"
+PAYMENTS_FILE = "order_payments_dataset.csv"
+
+CUSTOMER_COLUMNS = ["customer_id", "customer_unique_id", "customer_city", "customer_state"]
+ORDER_COLUMNS = ["order_id", "customer_id", "order_status", "order_purchase_timestamp", "order_approved_at"]
+PAYMENT_COLUMNS = ["order_id", "payment_sequential", "payment_type", "payment_installments", "payment_value"]
+DATETIME_COLUMNS = ["order_purchase_timestamp", "order_approved_at"]
+
+MAIN_COLUMNS = [
+    "customer_id", "customer_unique_id", "customer_city", "customer_state",
+    "order_id", "order_status", "order_purchase_timestamp", "order_approved_at",
+    "payment_sequential", "payment_type", "payment_installments", "payment_value",
+]
+STRING_DTYPES = {column: str for column in MAIN_COLUMNS if not column.startswith("payment_") or column == "payment_type"}
+# the notebook's left joins turn these into floats, main_data.csv keeps them so
+PAYMENT_DTYPES = {"payment_sequential": "float64", "payment_installments": "float64", "payment_value": "float64"}
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# Partition Function
+# Rows of both join sides with the same order_id land in the same partition
+def partition_of(order_ids, partitions):
+    return pd.util.hash_array(order_ids.to_numpy(dtype=object)) % np.uint64(partitions)
+
+
+def spill(df, order_ids, partitions, work_dir, prefix):
+    for partition, rows in df.groupby(partition_of(order_ids, partitions)):
+        spill_path = os.path.join(work_dir, f"{prefix}_{int(partition):04d}.csv")
+        rows.to_csv(spill_path, mode="a", header=not os.path.exists(spill_path), index=False)
+
+
+# Customer Lookup Function
+# customers is the only table held in memory: an Index on customer_id keeps its
+# hash table, so each orders chunk is joined with one get_indexer call.
+def load_customers(data_dir):
+    customers = pd.read_csv(os.path.join(data_dir, CUSTOMERS_FILE), usecols=CUSTOMER_COLUMNS, dtype=str)
+    customers = customers.set_index("customer_id")
+    if not customers.index.is_unique:
+        raise ValueError(f"{CUSTOMERS_FILE} has duplicated customer_id values")
+    return customers
+
+
+# Pass 1: stream orders, attach the customer and spill by order_id
+def partition_orders(data_dir, customers, partitions, chunk_size, work_dir, stats):
+    reader = pd.read_csv(os.path.join(data_dir, ORDERS_FILE), usecols=ORDER_COLUMNS, dtype=str, chunksize=chunk_size)
+    for chunk in reader:
+        stats["orders_in"] += len(chunk)
+        chunk = chunk.dropna(subset=["order_approved_at"])
+
+        positions = customers.index.get_indexer(chunk["customer_id"])
+        chunk = chunk[positions >= 0]
+        customer_rows = customers.iloc[positions[positions >= 0]].reset_index()
+
+        chunk = pd.concat([customer_rows, chunk.drop(columns="customer_id").reset_index(drop=True)], axis=1)
+        spill(chunk, chunk["order_id"], partitions, work_dir, "orders")
+
+
+# Pass 2: stream payments and spill by order_id
+def partition_payments(data_dir, partitions, chunk_size, work_dir, stats):
+    reader = pd.read_csv(os.path.join(data_dir, PAYMENTS_FILE), usecols=PAYMENT_COLUMNS,
+                         dtype={"order_id": str, "payment_type": str, **PAYMENT_DTYPES}, chunksize=chunk_size)
+    for chunk in reader:
+        stats["payments_in"] += len(chunk)
+        chunk = chunk.dropna(subset=["payment_value"])
+        spill(chunk, chunk["order_id"], partitions, work_dir, "payments")
+
+
+# Pass 3: join partition by partition and append to the outputs
+def join_partitions(partitions, work_dir, output, parquet_dir, stats):
+    header = True
+    for partition in range(partitions):
+        orders_path = os.path.join(work_dir, f"orders_{partition:04d}.csv")
+        payments_path = os.path.join(work_dir, f"payments_{partition:04d}.csv")
+        if not (os.path.exists(orders_path) and os.path.exists(payments_path)):
+            continue
+
+        orders = pd.read_csv(orders_path, dtype=STRING_DTYPES)
+        payments = pd.read_csv(payments_path, dtype={"order_id": str, "payment_type": str, **PAYMENT_DTYPES})
+        stats["largest_partition_rows"] = max(stats["largest_partition_rows"], len(orders) + len(payments))
+
+        joined = orders.merge(payments, on="order_id", how="inner")[MAIN_COLUMNS]
+        for column in DATETIME_COLUMNS:
+            joined[column] = pd.to_datetime(joined[column], format=DATETIME_FORMAT)
+
+        joined.to_csv(output, mode="w" if header else "a", header=header, index=False, date_format=DATETIME_FORMAT)
+        header = False
+        stats["rows_out"] += len(joined)
+
+        if parquet_dir is not None:
+            joined["order_month"] = joined["order_approved_at"].dt.strftime("%Y-%m")
+            joined.to_parquet(parquet_dir, partition_cols=["order_month"], index=False)
+
+    if header:
+        pd.DataFrame(columns=MAIN_COLUMNS).to_csv(output, index=False)
+
+
+# ETL Function
+def run_etl(data_dir, output="main_data.csv", parquet_dir=None, chunk_size=50_000, partitions=None, partition_bytes=64 * 1024 * 1024, work_dir=None):
+    start = time.perf_counter()
+    if partitions is None:
+        input_bytes = sum(os.path.getsize(os.path.join(data_dir, name)) for name in (ORDERS_FILE, PAYMENTS_FILE))
+        partitions = max(1, math.ceil(input_bytes / partition_bytes))
+    if parquet_dir is not None:
+        shutil.rmtree(parquet_dir, ignore_errors=True)
+
+    customers = load_customers(data_dir)
+    stats = {
+        "customers_in": len(customers), "orders_in": 0, "payments_in": 0, "rows_out": 0,
+        "partitions": partitions, "largest_partition_rows": 0,
+    }
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as spill_dir:
+        partition_orders(data_dir, customers, partitions, chunk_size, spill_dir, stats)
+        partition_payments(data_dir, partitions, chunk_size, spill_dir, stats)
+        join_partitions(partitions, spill_dir, output, parquet_dir, stats)
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build main_data.csv from the raw Olist tables out-of-core.")
+    parser.add_argument("--data-dir", default=".", help="directory holding the raw Olist csv files")
+    parser.add_argument("--output", default="main_data.csv", help="csv read by the dashboard")
+    parser.add_argument("--parquet-dir", default="main_data_parquet", help="partitioned parquet copy, '' to skip")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="rows read per chunk")
+    parser.add_argument("--partitions", type=int, default=None, help="hash partitions (default: inputs / 64 MB)")
+    parser.add_argument("--work-dir", default=None, help="where spill files are written")
+    args = parser.parse_args()
+
+    stats = run_etl(args.data_dir, args.output, args.parquet_dir or None, args.chunk_size, args.partitions, work_dir=args.work_dir)
+    for name, value in stats.items():
+        print(f"{name:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Data Visualization Library
+import matplotlib.pyplot as plt
+
+# Instrumentation Library
+from instrumentation import span
+
+# Standard Library
+from collections import OrderedDict
+import hashlib
+import io
+import threading
+
+
+# Same savefig options st.pyplot uses, so a cached PNG looks like the live figure
+SAVEFIG_OPTIONS = {"format": "png", "bbox_inches": "tight", "dpi": 200}
+# Sampled previews are replaced by the exact chart moments later
+PREVIEW_OPTIONS = {**SAVEFIG_OPTIONS, "dpi": 100}
+
+
+# Fingerprint Function
+# Hashable summary of a plot argument: the content of pandas/numpy data, the
+# precomputed fingerprint of objects that carry one (e.g. AggregateCube) and the
+# repr of everything else (dates, labels, freq, method).
+def fingerprint(value):
+    if hasattr(value, "fingerprint"):
+        return (type(value).__name__, value.fingerprint)
+    if isinstance(value, (pd.Series, pd.Index)):
+        digest = hashlib.md5(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes()).hexdigest()
+        return (type(value).__name__, str(value.name), str(value.dtype), digest)
+    if isinstance(value, pd.DataFrame):
+        digest = hashlib.md5(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes()).hexdigest()
+        return ("DataFrame", tuple(map(str, value.columns)), digest)
+    if isinstance(value, np.ndarray):
+        return ("ndarray", str(value.dtype), value.shape, hashlib.md5(np.ascontiguousarray(value).tobytes()).hexdigest())
+    if isinstance(value, (list, tuple)):
+        return tuple(fingerprint(item) for item in value)
+    if isinstance(value, dict):
+        return tuple((key, fingerprint(item)) for key, item in sorted(value.items()))
+    return (type(value).__name__, repr(value))
+
+
+# Figure Cache
+#
+# Process-wide LRU cache of rendered charts. A plot function is only called on a
+# miss; its figure is rasterized to PNG and closed straight away, so no
+# matplotlib figure outlives the call that created it.
+class FigureCache:
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # pyplot keeps global state, so figures are built one at a time
+        self._render_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, func, args, kwargs):
+        return (func.__module__, func.__qualname__, fingerprint(args), fingerprint(kwargs))
+
+    def render(self, func, *args, **kwargs):
+        with span(f"chart:{func.__name__}") as record:
+            key = self.key(func, args, kwargs)
+            png = self.get(key)
+            if png is not None:
+                record.update(cache="hit", bytes=len(png))
+                return png
+
+            png = self.rasterize(func, *args, **kwargs)
+            self.store(key, png)
+            record.update(cache="miss", bytes=len(png))
+            return png
+
+    # Cached PNG of a key, None (counted as a miss) when it has to be rendered
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return png
+            self.misses += 1
+            return None
+
+    # Preview Function
+    # PNG of a sampled preview (see approximate): drawn at a lower resolution
+    # and not cached, since the exact chart takes its place
+    def preview(self, func, *args, **kwargs):
+        with span(f"preview:{func.__name__}") as record:
+            png = self.rasterize(func, *args, options=PREVIEW_OPTIONS, **kwargs)
+            record.update(bytes=len(png))
+            return png
+
+    def rasterize(self, func, *args, options=SAVEFIG_OPTIONS, **kwargs):
+        with self._render_lock:
+            open_figures = set(plt.get_fignums())
+            try:
+                with span(func.__name__):
+                    fig = func(*args, **kwargs)
+                with span("savefig"):
+                    buffer = io.BytesIO()
+                    fig.savefig(buffer, **options)
+                return buffer.getvalue()
+            finally:
+                # close the figure returned and anything else the call left open
+                for number in set(plt.get_fignums()) - open_figures:
+                    plt.close(number)
+
+    def store(self, key, png):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = png
+            self._bytes += len(png)
+            while len(self._entries) > self.max_entries or (self._bytes > self.max_bytes and len(self._entries) > 1):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+figure_cache = FigureCache()
@@ -0,0 +1,121 @@
+# Data Manipulation Library
+import pandas as pd
+
+# Data Loading Library
+from data_loader import file_hash, read_store_meta, read_watermark, write_watermark
+from etl_pipeline import DATETIME_COLUMNS, DATETIME_FORMAT, MAIN_COLUMNS, run_etl
+
+# Standard Library
+import argparse
+import io
+import os
+import tempfile
+import time
+
+
+# Batch Cleaning Function
+# New orders in main_data.csv layout, with the same dropna rules as the ETL
+def prepare_batch(batch):
+    missing = [column for column in MAIN_COLUMNS if column not in batch.columns]
+    if missing:
+        raise ValueError(f"batch is missing columns: {missing}")
+
+    batch = batch[MAIN_COLUMNS].dropna(subset=["order_approved_at", "payment_value"]).copy()
+    for column in DATETIME_COLUMNS:
+        batch[column] = pd.to_datetime(batch[column], format=DATETIME_FORMAT)
+    return batch.sort_values(by="order_approved_at", kind="stable")
+
+
+# Base Watermark Function
+# The store already knows the md5 of the file it was built from, so starting a
+# watermark only hashes the csv when that store is missing or out of date.
+def base_watermark(path, size):
+    meta = read_store_meta(path)
+    if meta is not None and meta.get("source_bytes") == size:
+        digest = meta["source_md5"]
+    else:
+        digest = file_hash(path)
+    return {
+        "base_md5": digest,
+        "base_bytes": size,
+        "bytes": size,
+        "rows_applied": 0,
+        "batches": 0,
+        "max_order_approved_at": None,
+    }
+
+
+# Ingest Function
+#
+# Appends a batch of new orders to main_data.csv and advances its watermark.
+# A running dashboard notices the new bytes on its next rerun and applies just
+# these rows to the loaded frame, the RFM engine and the aggregate cube
+# (data_loader.apply_appended); nothing is reloaded.
+def ingest_batch(batch, path="main_data.csv"):
+    batch = prepare_batch(batch)
+    size = os.path.getsize(path)
+
+    watermark = read_watermark(path)
+    if watermark is not None and watermark.get("pending"):
+        if watermark["bytes"] < size:
+            # a previous append died half way: drop its partial rows
+            with open(path, "r+b") as f:
+                f.truncate(watermark["bytes"])
+            size = watermark["bytes"]
+        watermark = {name: value for name, value in watermark.items() if name != "pending"}
+    if watermark is None or watermark["bytes"] != size:
+        watermark = base_watermark(path, size)
+    if batch.empty:
+        return watermark
+
+    text = io.StringIO()
+    batch.to_csv(text, header=False, index=False, date_format=DATETIME_FORMAT)
+
+    write_watermark(path, {**watermark, "pending": True})
+    with open(path, "r+b") as f:
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        f.seek(0, os.SEEK_END)
+        f.write(text.getvalue().encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+    latest = batch["order_approved_at"].max().strftime(DATETIME_FORMAT)
+    watermark = {
+        **watermark,
+        "bytes": os.path.getsize(path),
+        "rows_applied": watermark["rows_applied"] + len(batch),
+        "batches": watermark["batches"] + 1,
+        "max_order_approved_at": max(filter(None, [watermark["max_order_approved_at"], latest])),
+        "updated_at": time.strftime(DATETIME_FORMAT),
+    }
+    write_watermark(path, watermark)
+    return watermark
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append new orders to main_data.csv for an incremental refresh.")
+    parser.add_argument("batch", nargs="?", help="csv of new rows in main_data.csv layout")
+    parser.add_argument("--raw-dir", default=None, help="directory of raw Olist csv files to run through the ETL first")
+    parser.add_argument("--output", default="main_data.csv", help="csv read by the dashboard")
+    args = parser.parse_args()
+    if (args.batch is None) == (args.raw_dir is None):
+        parser.error("give either a batch csv or --raw-dir")
+
+    if args.raw_dir is not None:
+        with tempfile.TemporaryDirectory() as work_dir:
+            batch_path = os.path.join(work_dir, "batch.csv")
+            run_etl(args.raw_dir, batch_path, work_dir=work_dir)
+            batch = pd.read_csv(batch_path, dtype=str)
+    else:
+        batch = pd.read_csv(args.batch, dtype=str)
+
+    watermark = ingest_batch(batch, args.output)
+    for name, value in watermark.items():
+        print(f"{name:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()
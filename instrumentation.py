@@ -0,0 +1,198 @@
+# Standard Library
+import argparse
+from contextlib import contextmanager
+import functools
+import json
+import os
+import threading
+import time
+
+
+# Set to a file path to append one JSON line per dashboard rerun
+TIMING_LOG_ENV = "RFM_DASHBOARD_TIMING_LOG"
+
+# pandas is only imported to build tables, so importing this module stays cheap
+# for the pages that never touch data.
+#
+# Streamlit runs every rerun in its own thread, so the timeline of the rerun in
+# progress is thread-local and library code (loader, engines, figure cache)
+# records into it without being passed anything.
+_local = threading.local()
+_log_lock = threading.Lock()
+
+SPAN_COLUMNS = ["name", "depth", "start", "seconds", "memory_delta_bytes"]
+
+try:
+    PAGE_BYTES = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    PAGE_BYTES = 4096
+
+
+# Resident Memory Function
+# Current RSS of the process (Linux /proc), None where it is not available.
+# It is process-wide, so spans of concurrent sessions see each other's memory.
+def resident_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_BYTES
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# Timeline
+#
+# Spans of one rerun in the order they started; depth is the nesting level, so
+# a stage and the work inside it read like a call tree.
+class Timeline:
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.started_at = time.time() - (time.perf_counter() - self.started)
+        self.spans = []
+        self.fields = {}
+        self.depth = 0
+        self.seconds = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    # Span measured outside a with block (e.g. the imports before the rerun)
+    def add(self, name, start, seconds, **fields):
+        self.spans.append({"name": name, "depth": self.depth, "start": start, "seconds": seconds, "memory_delta_bytes": None, **fields})
+
+    def frame(self):
+        import pandas as pd
+
+        spans = pd.DataFrame(self.spans)
+        return spans.reindex(columns=SPAN_COLUMNS + [column for column in spans.columns if column not in SPAN_COLUMNS])
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at,
+            "seconds": self.seconds,
+            **self.fields,
+            "spans": self.spans,
+        }
+
+
+# started: perf_counter() value the rerun counts from, defaults to now
+def start_timeline(started=None):
+    _local.timeline = Timeline(started)
+    return _local.timeline
+
+
+def current_timeline():
+    return getattr(_local, "timeline", None)
+
+
+# Span Function
+# Times the block and records its RSS delta in the current rerun's timeline;
+# a no-op outside a rerun (CLIs, benchmarks). Extra fields go into the record
+# and the block may add more (e.g. cache hit or miss).
+@contextmanager
+def span(name, **fields):
+    timeline = current_timeline()
+    if timeline is None:
+        yield fields
+        return
+
+    record = {"name": name, "depth": timeline.depth, "start": timeline.elapsed(), **fields}
+    timeline.spans.append(record)
+    memory_before = resident_bytes()
+    timeline.depth += 1
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        memory_after = resident_bytes()
+        record["memory_delta_bytes"] = None if memory_before is None or memory_after is None else memory_after - memory_before
+        timeline.depth -= 1
+
+
+def timed(name=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__qualname__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Fields of the whole rerun (page, session, status)
+def annotate(**fields):
+    timeline = current_timeline()
+    if timeline is not None:
+        timeline.fields.update(fields)
+
+
+# Time To First Render Function
+# Marks the moment the page shows its first content; only the first mark of a
+# rerun counts.
+def mark_first_render():
+    timeline = current_timeline()
+    if timeline is not None and "first_render_seconds" not in timeline.fields:
+        timeline.fields["first_render_seconds"] = timeline.elapsed()
+        timeline.add("first_render", timeline.elapsed(), 0.0)
+
+
+def finish_timeline(**fields):
+    timeline = current_timeline()
+    _local.timeline = None
+    if timeline is None:
+        return None
+
+    timeline.seconds = timeline.elapsed()
+    timeline.fields.update(fields)
+    write_log(timeline)
+    return timeline
+
+
+# Structured Log Function
+def write_log(timeline, path=None):
+    path = path or os.environ.get(TIMING_LOG_ENV)
+    if not path:
+        return
+    line = json.dumps(timeline.to_dict(), default=str)
+    with _log_lock:
+        with open(path, "a") as f:
+            f.write(line + "\n")
+
+
+# Log Summary Function
+# Latency percentiles per span name (and for whole reruns per page and chart
+# renderer) across every session that wrote to the log, with the mean payload
+# of the spans that record bytes (PNGs, Vega-Lite specs)
+def summarize_log(path):
+    import pandas as pd
+
+    reruns, spans = [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rerun = json.loads(line)
+            page = rerun.get("page", "") + (f" [{rerun['chart_mode']}]" if rerun.get("chart_mode") else "")
+            reruns.append({"name": f"rerun:{page}", "seconds": rerun["seconds"]})
+            if rerun.get("first_render_seconds") is not None:
+                reruns.append({"name": f"first_render:{page}", "seconds": rerun["first_render_seconds"]})
+            spans.extend({"name": record["name"], "seconds": record["seconds"], "bytes": record.get("bytes")} for record in rerun["spans"])
+
+    latencies = pd.DataFrame(reruns + spans, columns=["name", "seconds", "bytes"])
+    summary = latencies.groupby("name")["seconds"].describe(percentiles=[0.5, 0.9, 0.99])
+    summary["mean bytes"] = latencies.groupby("name")["bytes"].mean()
+    return summary[["count", "mean", "50%", "90%", "99%", "max", "mean bytes"]].sort_values("mean", ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a dashboard timing log (JSON lines).")
+    parser.add_argument("log", help=f"file written through {TIMING_LOG_ENV}")
+    args = parser.parse_args()
+
+    import pandas as pd
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(summarize_log(args.log))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Streamlit Library
+import streamlit as st
+
+# Instrumentation Library
+from instrumentation import span
+
+# Standard Library
+from collections import OrderedDict
+import threading
+
+
+NO_OPTION = "(none)"
+
+
+# Row Filter Function
+# Positions of the rows matching text on column, evaluated on the server:
+# - hex id columns (integer codes + lookup table): id prefix
+# - text and categorical columns: case-insensitive substring
+# - numeric and datetime columns: a single value or an inclusive "low..high" range
+def filter_positions(df, column, text, schema=None):
+    values = df[column]
+    text = text.strip()
+
+    if schema is not None and column in schema.id_tables:
+        table = schema.id_tables[column]
+        start, stop = table.prefix_range(text)
+        codes = values.to_numpy()
+        return np.flatnonzero(((codes >= start) & (codes < stop)) | np.isin(codes, table.extra_prefix_codes(text)))
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = values.cat.categories.astype(str)
+        matching = np.flatnonzero(categories.str.contains(text, case=False, regex=False))
+        return np.flatnonzero(np.isin(values.cat.codes.to_numpy(), matching))
+
+    if values.dtype == object:
+        return np.flatnonzero(values.astype(str).str.contains(text, case=False, regex=False).to_numpy())
+
+    low, _, high = text.partition("..")
+    high = high if high else low
+    try:
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            low, high = pd.to_datetime(low), pd.to_datetime(high)
+        else:
+            low, high = float(low), float(high)
+    except ValueError:
+        return np.array([], dtype=np.int64)
+    return np.flatnonzero(((values >= low) & (values <= high)).to_numpy())
+
+
+# Row Order Function
+# Positions of the filtered rows in display order, None for the natural order
+def row_order(df, filter_column, filter_text, sort_column, ascending, schema=None):
+    positions = None
+    if filter_column != NO_OPTION and filter_text.strip():
+        positions = filter_positions(df, filter_column, filter_text, schema)
+
+    if sort_column == NO_OPTION:
+        return positions
+
+    if positions is None:
+        positions = np.arange(len(df))
+    values = df[sort_column].iloc[positions].reset_index(drop=True)
+    # categories and datetimes sort like the values they stand for, id codes
+    # too until a batch adds ids past the sorted table: those are sorted by the
+    # rank of their id
+    table = schema.id_tables.get(sort_column) if schema is not None else None
+    if table is not None and len(table.extra_words):
+        values = pd.Series(np.unique(table.sort_keys(values.to_numpy()), return_inverse=True)[1].reshape(-1))
+    ordered = values.sort_values(ascending=ascending, kind="stable").index.to_numpy()
+    return positions[ordered]
+
+
+# Page Cache
+#
+# Row orders are computed once per (table, filter, sort) and shared by every
+# session; turning pages is then a slice of the cached positions.
+class PageCache:
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def row_order(self, cache_key, df, filter_column, filter_text, sort_column, ascending, schema=None):
+        key = (cache_key, filter_column, filter_text.strip(), sort_column, ascending)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        with span("row_order", rows=len(df)):
+            positions = row_order(df, filter_column, filter_text, sort_column, ascending, schema)
+
+        with self._lock:
+            self._entries[key] = positions
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return positions
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+page_cache = PageCache()
+
+
+# Paginated Table Function
+# Replacement for st.dataframe(df) on large frames: only the visible page is
+# decoded and sent to the browser, so the payload does not grow with df.
+def paginated_table(df, key, cache_key, schema=None, page_size=100, width=1000, height=200):
+    columns = [NO_OPTION] + list(df.columns)
+
+    col1, col2, col3, col4 = st.columns((1, 1, 1, 1))
+    with col1:
+        sort_column = st.selectbox('Sort by', options=columns, key=f"{key}_sort_column")
+    with col2:
+        order = st.selectbox('Order', options=['Ascending', 'Descending'], key=f"{key}_sort_order")
+    with col3:
+        filter_column = st.selectbox('Filter column', options=columns, key=f"{key}_filter_column")
+    with col4:
+        filter_text = st.text_input('Filter value', key=f"{key}_filter_text")
+
+    positions = page_cache.row_order(cache_key, df, filter_column, filter_text, sort_column, order == 'Ascending', schema)
+    total_rows = len(df) if positions is None else len(positions)
+    total_pages = max(1, -(-total_rows // page_size))
+
+    page = st.number_input('Page', min_value=1, max_value=total_pages, value=1, step=1, key=f"{key}_page")
+    start = (min(page, total_pages) - 1) * page_size
+    stop = min(start + page_size, total_rows)
+
+    if positions is None:
+        page_df = df.iloc[start:stop]
+    else:
+        page_df = df.iloc[positions[start:stop]]
+    if schema is not None:
+        with span("decode_page", rows=len(page_df)):
+            page_df = schema.expand(page_df)
+
+    st.dataframe(data=page_df, width=width, height=height)
+    st.caption(f'Showing rows {start + 1 if total_rows else 0}-{stop} of {total_rows} (page {min(page, total_pages)} of {total_pages})')
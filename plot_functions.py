@@ -0,0 +1,142 @@
+# Data Visualization Library
+import matplotlib.pyplot as plt
+import seaborn as sns
+import matplotlib.dates as mdates
+
+
+# Visualization Plot Function
+#
+# Chart helpers of the dashboard, importable on their own so the benchmarks
+# draw exactly the charts the pages show.
+
+# Set the plot to dark theme (once, when the first page with charts imports us)
+sns.set(style='dark')
+
+# Bar Plot Function
+def barplotfunc(x, y, xlabel=str, ylabel=str, title=str):
+    fig, ax = plt.subplots(figsize=(14,8))
+   
+    sns.barplot(x=x, y=y, orient='h')
+    ax.set_xlabel(xlabel, fontsize=13)
+    ax.set_ylabel(ylabel, fontsize=13)
+    # no bars when the selection has no orders
+    if ax.containers:
+        ax.bar_label(ax.containers[0], rotation=0, fontsize=13)
+    ax.set_title(title, loc="center", fontsize=20)
+    ax.tick_params(axis='y', labelsize=13)
+    ax.tick_params(axis='x', labelsize=13)
+
+    return fig
+
+def barplotfunc2(cube, min_date_filter, max_date_filter, states=None, xlabel=str, ylabel=str, title=str, method=str):
+    fig, ax = plt.subplots(figsize=(16,14))
+
+    df_group_filter = cube.totals(min_date_filter, max_date_filter, by='customer_state', method=method, states=states)
+
+    df_group_filter = df_group_filter.sort_values(ascending=False)
+    
+    sns.barplot(x=df_group_filter.index, y=df_group_filter, orient='v')
+    ax.set_xlabel(xlabel, fontsize=30)
+    ax.set_ylabel(ylabel, fontsize=30)
+    if ax.containers:
+        ax.bar_label(ax.containers[0], rotation=0, fontsize=20)
+    # sampled estimate (approximate.SampleCube): 95% interval of every bar
+    if hasattr(cube, "totals_interval"):
+        bounds = cube.totals_interval(min_date_filter, max_date_filter, by='customer_state', method=method, states=states).loc[df_group_filter.index]
+        ax.errorbar(range(len(bounds)), bounds["estimate"], yerr=[bounds["estimate"] - bounds["low"], bounds["high"] - bounds["estimate"]],
+                    fmt='none', ecolor='black', capsize=8)
+    ax.set_title(title, loc="center", fontsize=36)
+    ax.tick_params(axis='y', labelsize=27)
+    ax.tick_params(axis='x', labelsize=27)
+
+    return fig
+    
+# Histogram Plot Function
+# df: the values, or their MetricIndex (rfm_engine), whose bins for the range
+# are already counted
+def histplotfunc(df, start=None, end=None, xlabel=str, ylabel=str, title=str):
+    fig, ax = plt.subplots(figsize=(18,8))
+    if hasattr(df, "histogram"):
+        edges, counts = df.histogram(start, end)
+        sns.histplot(x=edges[:-1], weights=counts, bins=list(edges))
+        # sampled estimate (approximate.WeightedMetric): 95% interval of every bin
+        if hasattr(df, "histogram_interval"):
+            low, high = df.histogram_interval(start, end)
+            ax.errorbar((edges[:-1] + edges[1:]) / 2, counts, yerr=[counts - low, high - counts], fmt='none', ecolor='black', capsize=3)
+    else:
+        df_filter = df[(df >= start) & (df <= end)]
+        sns.histplot(df_filter)
+    ax.set_xlabel(xlabel, fontsize=13)
+    ax.set_ylabel(ylabel, fontsize=13)
+    ax.set_title(title, loc='center', fontsize=20)
+    ax.tick_params(axis='y', labelsize=13)
+    ax.tick_params(axis='x', labelsize=13)
+
+    return fig
+
+# Line Plot Function
+
+def lineplotfunct1(cube, min_date_filter, max_date_filter, xlabel=str, ylabel=str, title=str, freq=str, method=str):
+    
+    df_group_filter = cube.rollup(min_date_filter, max_date_filter, freq=freq, method=method)
+
+    fig, ax= plt.subplots(figsize=(18,8))
+    
+    sns.lineplot(x= df_group_filter.index, y= df_group_filter, marker='o')
+    # sampled estimate (approximate.SampleCube): shaded 95% interval
+    if hasattr(cube, "rollup_interval"):
+        bounds = cube.rollup_interval(min_date_filter, max_date_filter, freq=freq, method=method)
+        ax.fill_between(bounds.index, bounds["low"], bounds["high"], alpha=0.25)
+    ax.set_xlabel(xlabel, fontsize=15)
+    ax.set_ylabel(ylabel, fontsize=15)
+    ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%b-%Y'))
+    ax.set_title(title, loc="center", fontsize=20)
+    ax.tick_params(axis='y', labelsize=15)
+    ax.tick_params(axis='x', labelsize=15, rotation=45)
+
+    return fig
+
+# lineplotfunct_two (this function specific for Customer State Analysis)
+def lineplotfunct2(cube, min_date_filter, max_date_filter, states=None, hue=str, xlabel=str, ylabel=str, title=str, freq=str, method=str):
+    
+    df_group_filter = cube.rollup(min_date_filter, max_date_filter, freq=freq, method=method, states=states, by_state=True)
+
+    
+    fig, ax= plt.subplots(figsize=(18,8))
+    
+    sns.lineplot(x= df_group_filter['order_approved_at'], y= df_group_filter['payment_value'], marker='o', hue=df_group_filter[hue])
+    ax.set_xlabel(xlabel, fontsize=15)
+    ax.set_ylabel(ylabel, fontsize=15)
+    ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%b-%Y'))
+    ax.set_title(title, loc="center", fontsize=20)
+    ax.tick_params(axis='y', labelsize=15)
+    ax.tick_params(axis='x', labelsize=15, rotation=45)
+
+    return fig
+
+# Pie Chart Function
+# label: one per slice; payment_labels names the payment types a count is
+# indexed by
+PAYMENT_LABELS = {'credit_card': 'Credit Card', 'boleto': 'Boleto', 'voucher': 'Voucher', 'debit_card': 'Debit Card'}
+
+
+def payment_labels(payment_types):
+    return [PAYMENT_LABELS.get(payment_type, payment_type) for payment_type in payment_types]
+
+
+def donutchartfunc(df, label,title=str):       
+    fig, ax = plt.subplots(figsize=(18,13))
+
+    _, _, autotexts = ax.pie(df, labels=label, autopct='%.0f%%', pctdistance=0.9, 
+                            textprops={'fontsize': 16}, startangle=230)
+
+    for autotext in autotexts:
+        autotext.set_color('white')
+
+    centre_circle = plt.Circle((0,0), 0.7, fc='white')
+    ax.add_artist(centre_circle)
+    ax.set_title(title, fontsize = 20)
+
+    return fig
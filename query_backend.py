@@ -0,0 +1,350 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Dashboard Libraries
+from aggregate_cube import AggregateCube, CELL_COLUMNS, CUBE_KEYS, measure, payment_cents
+from data_loader import DerivedReference, load_schema, store_path
+from instrumentation import timed
+from rfm_engine import RFMEngine, WindowCache, id_sort_keys
+
+# Standard Library
+import functools
+import hashlib
+import os
+import threading
+
+# fcntl is POSIX only; without it stale exports are removed unconditionally
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Backend of the EDA roll-ups and the RFM windows: "pandas" (the in-memory
+# AggregateCube and RFMEngine) or "duckdb" (SQL over a Parquet copy of the
+# orders).
+QUERY_BACKEND_ENV = "RFM_DASHBOARD_QUERY_BACKEND"
+DEFAULT_QUERY_BACKEND = "pandas"
+
+# Period of a day in SQL, labelled the way pd.Grouper labels it: the day
+# itself, or the last day of its week (Sunday), month or quarter
+PERIOD_SQL = {
+    "D": "order_approved_at",
+    "W-SUN": "order_approved_at + CAST((7 - isodow(order_approved_at)) % 7 AS INTEGER)",
+    "M": "last_day(order_approved_at)",
+    "Q-DEC": "CAST(date_trunc('quarter', order_approved_at) + INTERVAL 3 MONTH - INTERVAL 1 DAY AS DATE)",
+}
+
+# Order rows of a registered frame, dates as DATE like in the Parquet file
+ROWS_SQL = ("SELECT CAST(order_approved_at AS DATE) AS order_approved_at, customer_state, payment_type, cents, "
+            "customer_id, order_id, payment_value, position FROM {}")
+CELLS_SQL = "CAST(SUM(cents) AS BIGINT) AS cents, COUNT(*) AS count, CAST(SUM(cents * cents) AS BIGINT) AS cents_sq"
+
+# create_rfm_df as a GROUP BY customer_id: order count (rows with an order_id,
+# like pandas' "count"), compensated sum of payment_value and last order day.
+# A customer's payments are summed in frame order, the order pandas adds them
+# in, instead of merging partial sums of threads and of the appended rows;
+# ordering is only paid for the customers with more than one order. Batches
+# keep their arrival positions, so as for RFMEngine a batch with older orders
+# may change a sum in the last bits.
+RFM_SQL = """
+    WITH window_orders AS (
+        SELECT customer_id, order_id, payment_value, position, order_approved_at
+        FROM orders WHERE order_approved_at BETWEEN ? AND ?
+    ), customers AS (
+        SELECT customer_id, COUNT(order_id) AS frequency, COUNT(*) AS rows, ANY_VALUE(payment_value) AS payment,
+               MAX(order_approved_at) AS last_order
+        FROM window_orders GROUP BY 1
+    ), repeat_customers AS (
+        SELECT customer_id, fsum(payment_value ORDER BY position) AS monetary
+        FROM window_orders SEMI JOIN (SELECT customer_id FROM customers WHERE rows > 1) USING (customer_id)
+        GROUP BY 1
+    )
+    SELECT customer_id, frequency, COALESCE(CASE WHEN rows = 1 THEN payment ELSE monetary END, 0) AS monetary, last_order
+    FROM customers LEFT JOIN repeat_customers USING (customer_id)
+    ORDER BY 1
+"""
+
+
+def connect():
+    try:
+        import duckdb
+    except ImportError as error:
+        raise ImportError(f"the duckdb query backend needs the duckdb package (pip install duckdb), or set {QUERY_BACKEND_ENV}=pandas") from error
+    return duckdb.connect()
+
+
+# Order Rows Function
+# The columns the EDA charts and the RFM windows read, one row per order,
+# states and payment types as plain strings, ids as they are in the frame and
+# the position of the row in it
+def order_rows(df, first_position=0):
+    return pd.DataFrame({
+        "order_approved_at": df["order_approved_at"].to_numpy(),
+        "customer_state": df["customer_state"].astype(str).to_numpy(dtype=object),
+        "payment_type": df["payment_type"].astype(str).to_numpy(dtype=object),
+        "cents": payment_cents(df["payment_value"]),
+        "customer_id": df["customer_id"].to_numpy(),
+        "order_id": df["order_id"].to_numpy(),
+        "payment_value": df["payment_value"].to_numpy(dtype=np.float64),
+        "position": np.arange(first_position, first_position + len(df), dtype=np.int64),
+    })
+
+
+def timestamp(value):
+    return pd.Timestamp(value).to_pydatetime()
+
+
+def period_sql(freq):
+    offset = pd.tseries.frequencies.to_offset(freq)
+    if offset.n != 1 or offset.rule_code not in PERIOD_SQL:
+        raise ValueError(f"Unsupported roll-up frequency for the duckdb backend: {freq}")
+    return offset, PERIOD_SQL[offset.rule_code]
+
+
+# DuckDB Cube
+#
+# Same queries as AggregateCube (totals, rollup), answered by DuckDB: the date
+# window and the state selection become the WHERE clause and the roll-up a
+# GROUP BY, so only the aggregated cells (a few hundred rows at most) come back
+# to pandas, where the same measure() turns them into the series the plot
+# helpers draw. Sums are integer cents, so the results equal the pandas cube's.
+#
+# The orders are written once per dataset version as Parquet next to the
+# column store, sorted by date, so a date window only reads the row groups it
+# overlaps; every process (chart workers, batch report workers) queries the
+# same file. Batches applied afterwards are kept in memory and queried along
+# with it. Without a writable store the frame is queried in memory.
+#
+# Every cube holds a shared lock on the export it reads; writing the export of
+# a new dataset version removes the older ones no process holds any more.
+class DuckDBCube:
+    def __init__(self, df, path=None):
+        rows = order_rows(df)
+        self.fingerprint = hashlib.md5(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes()).hexdigest()
+        self._connection = connect()
+        self._lock = threading.Lock()
+        self._appended = rows.iloc[:0]
+        self._positions = len(rows)
+        self._export = None
+
+        self.parquet_path = self.write_parquet(rows, path) if path is not None else None
+        if self.parquet_path is None:
+            self._connection.register("base_orders", rows)
+            base = ROWS_SQL.format("base_orders")
+        else:
+            base = f"SELECT * FROM read_parquet('{self.parquet_path}')"
+        self._connection.register("appended_orders", self._appended)
+        self._connection.execute(f"""
+            CREATE VIEW orders AS
+            {base}
+            UNION ALL
+            {ROWS_SQL.format("appended_orders")}
+        """)
+
+    @timed("DuckDBCube.write_parquet")
+    def write_parquet(self, rows, path):
+        directory = store_path(path)
+        target = os.path.join(directory, f"orders-{self.fingerprint}.parquet")
+        if os.path.exists(target):
+            self.hold_export(target)
+            return target
+
+        staging = f"{target}.tmp-{os.getpid()}"
+        try:
+            self._connection.register("new_orders", rows)
+            self._connection.execute(f"COPY ({ROWS_SQL.format('new_orders')}) TO '{staging}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+            os.replace(staging, target)
+        except Exception:
+            # e.g. no store directory (read-only checkout): query the frame instead
+            if os.path.exists(staging):
+                os.remove(staging)
+            return None
+        finally:
+            self._connection.unregister("new_orders")
+        self.hold_export(target)
+        remove_stale_exports(directory, target)
+        return target
+
+    def hold_export(self, target):
+        self._export = open(target, "rb")
+        if fcntl is not None:
+            fcntl.flock(self._export, fcntl.LOCK_SH)
+
+    # Incremental Update Function
+    # The batch's rows are queried along with the Parquet file, O(batch)
+    @timed("DuckDBCube.apply_batch")
+    def apply_batch(self, batch):
+        if len(batch) == 0:
+            return
+
+        rows = order_rows(batch, self._positions)
+        self._positions += len(rows)
+        with self._lock:
+            self._appended = pd.concat([self._appended, rows], ignore_index=True)
+            self._connection.register("appended_orders", self._appended)
+
+        batch_digest = pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes()
+        self.fingerprint = hashlib.md5(self.fingerprint.encode("ascii") + batch_digest).hexdigest()
+
+    # Summed cells of the orders inside the date window (and states), grouped
+    # by the given SQL expressions
+    def cells(self, groups, min_date_filter, max_date_filter, states=None):
+        where = "order_approved_at BETWEEN ? AND ?"
+        parameters = [timestamp(min_date_filter), timestamp(max_date_filter)]
+        if states is not None:
+            where += " AND list_contains(?, customer_state)"
+            parameters.append([str(state) for state in states])
+
+        names = ", ".join(f"{expression} AS {name}" for name, expression in groups)
+        # by position: a name would be the column, not the period expression
+        keys = ", ".join(str(position) for position in range(1, len(groups) + 1))
+        query = f"SELECT {names}, {CELLS_SQL} FROM orders WHERE {where} GROUP BY {keys} ORDER BY {keys}"
+        with self._lock:
+            cells = self._connection.execute(query, parameters).fetchdf()
+        for column in CELL_COLUMNS:
+            cells[column] = cells[column].astype(np.int64)
+        return cells
+
+    # Every cell in AggregateCube.daily's layout (e.g. for write_cells); the
+    # strings sort like the categories pandas builds from them
+    @property
+    def daily(self):
+        keys = ", ".join(CUBE_KEYS)
+        with self._lock:
+            cells = self._connection.execute(f"SELECT {keys}, {CELLS_SQL} FROM orders GROUP BY {keys} ORDER BY {keys}").fetchdf()
+        cells["order_approved_at"] = cells["order_approved_at"].astype("datetime64[ns]")
+        for column in CUBE_KEYS[1:]:
+            cells[column] = cells[column].astype("category")
+        for column in CELL_COLUMNS:
+            cells[column] = cells[column].astype(np.int64)
+        return cells
+
+    # Time series rolled up to freq ('1Q', '1M', '1W', '1D'), optionally per state
+    @timed("DuckDBCube.rollup")
+    def rollup(self, min_date_filter, max_date_filter, freq, method, states=None, by_state=False):
+        offset, period = period_sql(freq)
+        groups = [("order_approved_at", period)]
+        if by_state:
+            groups = [("customer_state", "customer_state")] + groups
+
+        cells = self.cells(groups, min_date_filter, max_date_filter, states)
+        cells["order_approved_at"] = cells["order_approved_at"].astype("datetime64[ns]")
+        if by_state:
+            cells = cells.set_index(["customer_state", "order_approved_at"])
+            return measure(cells, method).reset_index()
+
+        # pd.Grouper also returns the empty periods between the first and last one
+        cells = cells.set_index("order_approved_at")
+        if len(cells):
+            periods = pd.date_range(cells.index[0], cells.index[-1], freq=offset, name="order_approved_at")
+        else:
+            periods = pd.DatetimeIndex([], freq=offset, name="order_approved_at")
+        return measure(cells.reindex(periods, fill_value=0), method)
+
+    # Totals per customer_state or payment_type
+    @timed("DuckDBCube.totals")
+    def totals(self, min_date_filter, max_date_filter, by, method, states=None):
+        if by not in ("customer_state", "payment_type"):
+            raise ValueError(f"Unknown totals column: {by}")
+
+        cells = self.cells([(by, by)], min_date_filter, max_date_filter, states)
+        series = measure(cells.set_index(by), method)
+        series.index = series.index.astype(str)
+        return series
+
+
+# Stale Export Function
+# Removes the exports of other dataset versions, unless a cube (of any
+# process) still holds one
+def remove_stale_exports(directory, target):
+    for name in os.listdir(directory):
+        stale = os.path.join(directory, name)
+        if not (name.startswith("orders-") and name.endswith(".parquet")) or stale == target:
+            continue
+        try:
+            with open(stale, "rb") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.remove(stale)
+        except OSError:
+            # in use (or already gone)
+            pass
+
+
+# DuckDB RFM
+#
+# Same windows as RFMEngine (window, window_index), answered by one GROUP BY
+# customer_id over the orders of the date window; recency is computed from the
+# returned last order days. Rows come back in customer_id order, re-sorted by
+# id when the id table holds customers first seen in a batch.
+class DuckDBRFM(DuckDBCube, WindowCache):
+    def __init__(self, df, path=None, id_table=None):
+        super().__init__(df, path)
+        self.id_table = id_table
+        self.init_windows()
+
+    def apply_batch(self, batch):
+        super().apply_batch(batch)
+        with self._lock:
+            self.clear_windows()
+
+    # Same output as create_rfm_df(df) restricted to the date window
+    @timed("DuckDBRFM.window")
+    def window(self, start_date, end_date):
+        with self._lock:
+            rfm = self._connection.execute(RFM_SQL, [timestamp(start_date), timestamp(end_date)]).fetchdf()
+        if self.id_table is not None and len(self.id_table.extra_words):
+            rfm = rfm.iloc[np.argsort(id_sort_keys(rfm["customer_id"].to_numpy(), self.id_table), kind="stable")]
+
+        last_day = rfm["last_order"].to_numpy().astype("datetime64[D]").astype(np.int64)
+        return pd.DataFrame({
+            "customer_id": rfm["customer_id"].to_numpy(),
+            "frequency": rfm["frequency"].to_numpy(dtype=np.int64),
+            "monetary": rfm["monetary"].to_numpy(dtype=np.float64),
+            "recency": (last_day.max() - last_day).astype(np.int64) if len(last_day) else np.array([], dtype=np.int64),
+        })
+
+
+# Backend Registry
+# Build function of each backend's cube and RFM windows for a dataset; a
+# partial of a class is picklable, so the cube can be passed to workers as a
+# DerivedReference.
+QUERY_BACKENDS = {
+    "pandas": lambda path: AggregateCube,
+    "duckdb": lambda path: functools.partial(DuckDBCube, path=path),
+}
+RFM_BACKENDS = {
+    "pandas": lambda path: RFMEngine,
+    "duckdb": lambda path: functools.partial(DuckDBRFM, path=path),
+}
+
+
+def backend_name(name=None):
+    name = name or os.environ.get(QUERY_BACKEND_ENV) or DEFAULT_QUERY_BACKEND
+    if name not in QUERY_BACKENDS:
+        raise ValueError(f"Unknown query backend: {name} (one of {', '.join(QUERY_BACKENDS)})")
+    return name
+
+
+# Cube Reference Function
+# The roll-up structure of a dataset for the chosen backend (the environment
+# variable by default); the pandas cube keeps its usual memo name.
+def cube_reference(path="main_data.csv", backend=None):
+    backend = backend_name(backend)
+    path = os.path.abspath(path)
+    name = "aggregate_cube" if backend == "pandas" else f"{backend}_cube"
+    return DerivedReference(path, name, QUERY_BACKENDS[backend](path))
+
+
+# RFM Reference Function
+# The RFM windows of a dataset for the chosen backend, with the id table that
+# orders the customers of appended batches; the pandas engine keeps its usual
+# memo name.
+def rfm_reference(path="main_data.csv", backend=None):
+    backend = backend_name(backend)
+    path = os.path.abspath(path)
+    name = "rfm_engine" if backend == "pandas" else f"{backend}_rfm"
+    id_table = load_schema(path).id_tables.get("customer_id")
+    return DerivedReference(path, name, functools.partial(RFM_BACKENDS[backend](path), id_table=id_table))
@@ -1,175 +1,69 @@
-# Data Manipulation Library
-import pandas as pd
-
-# Data Visualization Library
-import matplotlib.pyplot as plt
-import seaborn as sns
-import matplotlib.dates as mdates
+# Script start, the time to first render is measured from here
+import time
+SCRIPT_STARTED = time.perf_counter()
 
 # Streamlit Library
 import streamlit as st
 from streamlit_option_menu import option_menu
 
-# Aesthethical Library
-from babel.numbers import format_currency
-
-
-def main():
-    # Set the plot to dark theme
-    sns.set(style='dark')
-
-    # Load cleaned data
-    main_df = pd.read_csv("main_data.csv")
-
-    datetime_columns = ["order_purchase_timestamp", "order_approved_at"]
-    main_df.sort_values(by="order_approved_at", inplace=True)
-    main_df.reset_index(inplace=True)
-
-    for column in datetime_columns:
-        main_df[column] = pd.to_datetime(main_df[column], format='%Y-%m-%d %H:%M:%S')
-        main_df[column] = main_df[column].dt.date
-        main_df[column] = pd.to_datetime(main_df[column], format='%Y-%m-%d')
-
-    # Visualization Plot Function
-
-    # Bar Plot Function
-    def barplotfunc(x, y, xlabel=str, ylabel=str, title=str):
-        fig, ax = plt.subplots(figsize=(14,8))
-       
-        sns.barplot(x=x, y=y, orient='h')
-        ax.set_xlabel(xlabel, fontsize=13)
-        ax.set_ylabel(ylabel, fontsize=13)
-        ax.bar_label(ax.containers[0], rotation=0, fontsize=13)
-        ax.set_title(title, loc="center", fontsize=20)
-        ax.tick_params(axis='y', labelsize=13)
-        ax.tick_params(axis='x', labelsize=13)
-
-        return fig
-
-    def barplotfunc2(df, min_date_filter, max_date_filter, xlabel=str, ylabel=str, title=str, method=str):
-        fig, ax = plt.subplots(figsize=(16,14))
+# Instrumentation Library (timing spans, hidden debug panel with ?debug=1)
+from instrumentation import annotate, mark_first_render
+from timing_panel import instrumented_rerun, show_chart
 
-        df_filter= df[
-            (df['order_approved_at'] >= pd.to_datetime(min_date_filter)) & (df['order_approved_at'] <= pd.to_datetime(max_date_filter))
-        ]
+# The data, plotting (pandas, matplotlib, seaborn) and babel libraries are
+# imported by the pages that use them, so a page only waits for what it shows.
 
-        if(method == 'sum'):
-            df_group_filter = df_filter.groupby(by= ['customer_state'])['payment_value'].sum()
-        if(method == 'mean'):
-            df_group_filter = df_filter.groupby(by= ['customer_state'])['payment_value'].mean()
 
-        df_group_filter = df_group_filter.sort_values(ascending=False)
-        
-        sns.barplot(x=df_group_filter.index, y=df_group_filter, orient='v')
-        ax.set_xlabel(xlabel, fontsize=30)
-        ax.set_ylabel(ylabel, fontsize=30)
-        ax.bar_label(ax.containers[0], rotation=0, fontsize=20)
-        ax.set_title(title, loc="center", fontsize=36)
-        ax.tick_params(axis='y', labelsize=27)
-        ax.tick_params(axis='x', labelsize=27)
-
-        return fig
-        
-    # Histogram Plot Function
-    def histplotfunc(df, start=None, end=None, xlabel=str, ylabel=str, title=str):
-        df_filter = df[(df >= start) & (df <= end)]
-
-        fig, ax = plt.subplots(figsize=(18,8))
-        sns.histplot(df_filter)
-        ax.set_xlabel(xlabel, fontsize=13)
-        ax.set_ylabel(ylabel, fontsize=13)
-        ax.set_title(title, loc='center', fontsize=20)
-        ax.tick_params(axis='y', labelsize=13)
-        ax.tick_params(axis='x', labelsize=13)
-
-        return fig
-
-    # Line Plot Function
-
-    def lineplotfunct1(df, min_date_filter, max_date_filter, xlabel=str, ylabel=str, title=str, freq=str, method=str):
-        
-        df_filter= df[
-            (df['order_approved_at'] >= pd.to_datetime(min_date_filter)) & (df['order_approved_at'] <= pd.to_datetime(max_date_filter))
-        ]
-
-        if(method == 'sum'):
-            df_group_filter = df_filter.groupby(
-                by= pd.Grouper(key='order_approved_at', freq=freq))['payment_value'].sum()
-        if(method == 'mean'):
-            df_group_filter = df_filter.groupby(
-                by= pd.Grouper(key='order_approved_at', freq=freq))['payment_value'].mean()
-        if(method == 'count'):
-            df_group_filter = df_filter.groupby(
-                by= pd.Grouper(key='order_approved_at', freq=freq))['order_approved_at'].count()
-
-        fig, ax= plt.subplots(figsize=(18,8))
-        
-        sns.lineplot(x= df_group_filter.index, y= df_group_filter, marker='o')
-        ax.set_xlabel(xlabel, fontsize=15)
-        ax.set_ylabel(ylabel, fontsize=15)
-        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%b-%Y'))
-        ax.set_title(title, loc="center", fontsize=20)
-        ax.tick_params(axis='y', labelsize=15)
-        ax.tick_params(axis='x', labelsize=15, rotation=45)
-
-        return fig
-
-    # lineplotfunct_two (this function specific for Customer State Analysis)
-    def lineplotfunct2(df, min_date_filter, max_date_filter, hue=str, xlabel=str, ylabel=str, title=str, freq=str, method=str):
-        
-        df_filter= df[
-            (df['order_approved_at'] >= pd.to_datetime(min_date_filter)) & (df['order_approved_at'] <= pd.to_datetime(max_date_filter))
-        ]
-
-        if(method == 'sum'):
-            df_group_filter = df_filter.groupby(
-                by= ['customer_state', pd.Grouper(key='order_approved_at', freq=freq)])['payment_value'].sum()
-            df_group_filter =  pd.DataFrame(df_group_filter).reset_index()
-        if(method == 'mean'):
-            df_group_filter = df_filter.groupby(
-                by= ['customer_state', pd.Grouper(key='order_approved_at', freq=freq)])['payment_value'].mean()
-        df_group_filter =  pd.DataFrame(df_group_filter).reset_index()
-        if(method == 'count'):
-            df_group_filter = df_filter.groupby(
-                by= ['customer_state', pd.Grouper(key='order_approved_at', freq=freq)])['order_approved_at'].count()
-        df_group_filter =  pd.DataFrame(df_group_filter).reset_index()
-
-        
-        fig, ax= plt.subplots(figsize=(18,8))
-        
-        sns.lineplot(x= df_group_filter['order_approved_at'], y= df_group_filter['payment_value'], marker='o', hue=df_group_filter[hue])
-        ax.set_xlabel(xlabel, fontsize=15)
-        ax.set_ylabel(ylabel, fontsize=15)
-        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%b-%Y'))
-        ax.set_title(title, loc="center", fontsize=20)
-        ax.tick_params(axis='y', labelsize=15)
-        ax.tick_params(axis='x', labelsize=15, rotation=45)
-
-        return fig
-
-    # Pie Chart Function
-    def donutchartfunc(df, label,title=str):       
-        fig, ax = plt.subplots(figsize=(18,13))
-
-        _, _, autotexts = ax.pie(df, labels=label, autopct='%.0f%%', pctdistance=0.9, 
-                                textprops={'fontsize': 16}, startangle=230)
-
-        for autotext in autotexts:
-            autotext.set_color('white')
-
-        centre_circle = plt.Circle((0,0), 0.7, fc='white')
-        fig = plt.gcf()
-        fig.gca().add_artist(centre_circle)
-        ax.set_title(title, fontsize = 20)
-
-        return fig
-
-    
-    # Filter data
-    min_date = main_df["order_approved_at"].min()
-    max_date = main_df["order_approved_at"].max()
+def main():
+    # Data Loading Function
+    # Load cleaned data (memory-mapped, read-only and shared by every session,
+    # sorted by order_approved_at). Orders appended with incremental_refresh are
+    # picked up on the next rerun without a reload
+    def load_dataset():
+        from data_loader import load_main_data, load_schema, dataset_version
+
+        main_df = load_main_data("main_data.csv")
+        # hex ids are held as integer codes, schema turns them back into strings
+        schema = load_schema("main_data.csv")
+        return main_df, schema, dataset_version("main_data.csv")
+
+    # Filter data (the frame is sorted, so the first and last rows hold the bounds)
+    def date_bounds(main_df):
+        return main_df["order_approved_at"].iloc[0], main_df["order_approved_at"].iloc[-1]
+
+    # Chart Renderer Function
+    # Matplotlib PNGs drawn on the server (default) or Vega-Lite charts drawn in
+    # the browser from the aggregated points only (see vega_charts)
+    def select_chart_mode():
+        st.subheader("Chart Renderer")
+        chart_mode = st.radio("Draw charts as", options=['Matplotlib (PNG)', 'Vega-Lite'], key="chart_mode", horizontal=True)
+        annotate(chart_mode=chart_mode)
+        return chart_mode
+
+    # Approximate Mode Function
+    # Sampled previews first (see approximate), on by default for datasets of
+    # APPROXIMATE_ROWS orders and more
+    def select_approximate(main_df):
+        from approximate import APPROXIMATE_ROWS
+
+        approximate = st.toggle("Sampled preview first", value=len(main_df) >= APPROXIMATE_ROWS, key="approximate",
+                                help="Charts and averages are first estimated from a stratified sample, then refined in place to the exact results.")
+        annotate(approximate=approximate)
+        return approximate
+
+    # Approximation Captions
+    # An error is shown relative to its value, or as is when the value is 0
+    # (e.g. the average recency of a one day window)
+    def error_text(error, value):
+        return f"{error / abs(value):.1%}" if value else f"{error:,.2f}"
+
+    def preview_caption(units, margin):
+        st.caption(f"Sampled preview from {units} (stratified by state and month), the bounds are 95% confidence intervals "
+                   f"(±{margin} at the widest). Exact results replace it when ready.")
+
+    def error_caption(error):
+        st.caption(f"Exact. The sampled preview was off by {error['max_error']:.1%} at most, "
+                   f"{error['inside']} of {error['points']} exact values were inside its 95% bounds.")
 
     
     # ======================DASHBOARD===========================================
@@ -180,6 +74,7 @@ def main():
             menu_title="Main menu",
             options= ['Introduction', 'RFM Analysis', 'Exploratory Data Analysis']
     )
+    annotate(page=selected)
     
     if selected == 'Introduction':
         row0_space1, row0_1, row0_space2 = st.columns(
@@ -191,6 +86,7 @@ def main():
 
         with row1_1:
             st.header(f'{selected}')
+            mark_first_render()
             st.markdown(
                 '<div style="text-align: justify;">Brazilian e-commerce public dataset of orders made at Olist Store. The dataset has information of 100k orders from 2016 to 2018 made at multiple marketplaces in Brazil. Its features allows viewing an order from multiple dimensions: from order status, price, payment and freight performance to customer location, product attributes and finally reviews written by customers. You can choose what to see in the menu on the sidebar. Feel free to explore!</div>', unsafe_allow_html=True)
             
@@ -208,8 +104,12 @@ def main():
             st.markdown(
                 '<div style="text-align: justify;">You can see the snippet of dataset used in this analysis below in the table.</div>', unsafe_allow_html=True)
             st.markdown("***")
-            
-            st.dataframe(data=main_df, width=1000, height=200)
+
+            # Paginated Table Library (only the visible page is sent to the browser)
+            from paginated_table import paginated_table
+
+            main_df, schema, data_version = load_dataset()
+            paginated_table(main_df, key="main_df", cache_key=("main_df", data_version), schema=schema, width=1000, height=200)
 
 
         row2_space1, row2_1, row2_space2 = st.columns((0.1, 3.5, 0.1))
@@ -228,24 +128,29 @@ def main():
   
     if selected == 'RFM Analysis':
 
-        # Create RFM Dataset
-        def create_rfm_df(df):
-            rfm_df = df.groupby(by="customer_id", as_index=False).agg({
-            "order_approved_at": "max", # latest order date
-            "order_id": "count", # order count
-            "payment_value": "sum" # total revenue sum
-            })
-            rfm_df.columns = ["customer_id", "max_order_approved_at", "frequency", "monetary"]
+        row3_space1, row3_1, row3_space2 = st.columns((0.1, 3.5, 0.1))
 
-            # determine when customer last order date in days
-            rfm_df["max_order_approved_at"] = rfm_df["max_order_approved_at"].dt.date
-            recent_date = df["order_approved_at"].dt.date.max()
-            rfm_df["recency"] = rfm_df["max_order_approved_at"].apply(lambda x: (recent_date - x).days)
+        with row3_1:
+            st.header(f'{selected}')
+            mark_first_render()
+            st.markdown(
+                """
+                Here you can explore the dataset by looking at Recency, Frequency, and Monetary. Go check it out!
+                """
+            )
+            # Best Customer Based on RFM Parameters
+            st.subheader("Best Customer Based on RFM Parameters")
 
-            rfm_df.drop("max_order_approved_at", axis=1, inplace=True)
+        from data_loader import build_in_background, derived_ready, load_derived
+        from query_backend import rfm_reference
+        from figure_cache import figure_cache
+        from plot_functions import barplotfunc, histplotfunc
+        from paginated_table import paginated_table
+        from babel.numbers import format_currency
+
+        main_df, schema, data_version = load_dataset()
+        min_date, max_date = date_bounds(main_df)
 
-            return rfm_df
-        
         with st.sidebar:
             st.subheader("Filter Data By Date")
             # Take the start_date & end_date from date_input
@@ -255,27 +160,75 @@ def main():
                 max_value=max_date,
                 value=[min_date, max_date]
                 )
-        main_df = main_df[(main_df["order_approved_at"] >= str(start_date)) &
-                (main_df["order_approved_at"] <= str(end_date))]
-        
-        # Creating RFM dataframe
-        rfm_df = create_rfm_df(main_df)
 
-        row3_space1, row3_1, row3_space2 = st.columns((0.1, 3.5, 0.1))
-
-        with row3_1:
-            st.header(f'{selected}')
-            st.markdown(
-                """
-                Here you can explore the dataset by looking at Recency, Frequency, and Monetary. Go check it out!
-                """
-            )
-            # Best Customer Based on RFM Parameters
-            st.subheader("Best Customer Based on RFM Parameters")
+            chart_mode = select_chart_mode()
+            approximate = select_approximate(main_df)
+
+        if chart_mode == 'Vega-Lite':
+            from vega_charts import vega_spec as render_chart
+            render_preview = render_chart
+        else:
+            render_chart = figure_cache.render
+            render_preview = figure_cache.preview
+
+        # Sampled Preview Function
+        # Averages and histograms estimated from a sample of the customers
+        def show_rfm_preview(estimate):
+            previews = [
+                ("recency", "Average Recency (days)", lambda value: f"{value:.1f}", 'Days'),
+                ("frequency", "Average Frequency", lambda value: f"{value:.2f}", 'Frequency'),
+                ("monetary", "Average Monetary", lambda value: format_currency(value, 'BRL', locale='pt_BR'), 'Monetary'),
+            ]
+            for tab, (metric, label, formatting, xlabel) in zip(st.tabs(["Recency", "Frequency", "Monetary"]), previews):
+                with tab:
+                    bounds = estimate.intervals[metric]
+                    st.metric(label, value=f"≈ {formatting(bounds['estimate'])}",
+                              delta=f"95%: {formatting(bounds['low'])} to {formatting(bounds['high'])}", delta_color="off")
+                    values = estimate.metrics[metric]
+                    show_chart(render_preview(histplotfunc, values, start=values.min(), end=values.max(),
+                                              xlabel=xlabel, ylabel='Total Customer', title=f'Histogram of {metric.capitalize()} by Customer'), use_container_width=True)
+                    preview_caption(f"{estimate.sample_customers:,} of about {estimate.customers:,.0f} customers",
+                                    error_text((bounds['high'] - bounds['low']) / 2, bounds['estimate']))
+
+        def estimate_caption(estimate, metric, exact):
+            bounds = estimate.intervals[metric]
+            st.caption(f"Exact. The sampled preview was {bounds['estimate']:,.2f} (95%: {bounds['low']:,.2f} to {bounds['high']:,.2f}), "
+                       f"{error_text(abs(bounds['estimate'] - exact), exact)} off.")
+
+        # Until the engine has this window, the averages and histograms are
+        # first shown from a stratified sample of the customers (see
+        # approximate), where the exact tabs then take their place. The
+        # engine and the window are built in the background meanwhile.
+        rfm_preview = st.empty()
+        estimate = None
+        engine_ref = rfm_reference("main_data.csv")
+        if approximate and not (derived_ready("main_data.csv", engine_ref.name) and engine_ref.resolve().has_window(start_date, end_date)):
+            from approximate import SampleRFM
+
+            build_in_background(lambda: engine_ref.resolve().window_index(start_date, end_date))
+
+            estimate = load_derived("main_data.csv", "sample_rfm", SampleRFM).window(start_date, end_date)
+            if estimate.sample_customers:
+                with rfm_preview.container():
+                    show_rfm_preview(estimate)
+            else:
+                estimate = None
+
+        # RFM engine (or its DuckDB counterpart, see query_backend), built once
+        # per dataset and shared by every session
+        rfm_engine = engine_ref.resolve()
+
+        # Creating RFM dataframe (same result as create_rfm_df on the filtered data)
+        # with the averages and a sorted index per metric, kept for the reruns
+        # of the same window (slider drags)
+        rfm_window = rfm_engine.window_index(start_date, end_date)
+        rfm_df = rfm_window.frame
+        recency, frequency, monetary = (rfm_window.metrics[metric] for metric in ['recency', 'frequency', 'monetary'])
+        rfm_preview.empty()
 
         row4_space1, row4_1, row4_space2 = st.columns((0.1, 2.5, 0.1))
 
-        tab1, tab2, tab3 = st.tabs(["Recency", "Frequency", "Monetary"])
+        tab1, tab2, tab3, tab4 = st.tabs(["Recency", "Frequency", "Monetary", "Segments"])
 
         # Slider Function
         def myslider(FilterData):
@@ -290,70 +243,95 @@ def main():
         with row4_1:
 
             with tab1:
-                avg_recency = round(rfm_df["recency"].mean(), 1)
+                avg_recency = round(rfm_window.means["recency"], 1)
                 st.metric("Average Recency (days)", value=avg_recency)
+                if estimate is not None:
+                    estimate_caption(estimate, "recency", rfm_window.means["recency"])
 
                 tab_row1_space1, tab_row1_1, tab_row1_space2 = st.columns((0.1, 0.7, 0.1))
 
                 with tab_row1_1:
-                    st.pyplot(histplotfunc(rfm_df['recency'], start=rfm_df['recency'].min(), end=rfm_df['recency'].max(), 
+                    show_chart(render_chart(histplotfunc, recency, start=recency.min(), end=recency.max(), 
                                         xlabel='Days', ylabel='Total Customer', title='Histogram of Recency by Customer'), use_container_width=True)
                     
-                    recency_rank = rfm_df.sort_values(by="recency", ascending=True).head(5)
+                    recency_rank = schema.expand(rfm_df.loc[recency.smallest(5)])
 
                     st.markdown("#")
                     st.markdown("Below is a bar plot to see the top customer IDs")
 
-                    st.pyplot(barplotfunc(
+                    show_chart(render_chart(barplotfunc,
                         x=recency_rank['recency'], y=recency_rank['customer_id'], xlabel='Days', ylabel="customer_id", title="By Recency (days)"
                     ), use_container_width=True)  
 
                     st.markdown("#")           
                             
             with tab2:
-                avg_frequency = round(rfm_df.frequency.mean(), 2)
+                avg_frequency = round(rfm_window.means["frequency"], 2)
                 st.metric("Average Frequency", value=avg_frequency)
+                if estimate is not None:
+                    estimate_caption(estimate, "frequency", rfm_window.means["frequency"])
 
                 tab_row2_space1, tab_row2_1, tab_row2_space2 = st.columns((0.1, 0.7, 0.1))
 
                 with tab_row2_1:
                     st.markdown("Due to the sparse distribution of data, you have the option to filter it by selecting your preferred value using the slider located below.")
-                    start, end = myslider(rfm_df['frequency'])
-                    st.pyplot(histplotfunc(rfm_df['frequency'], start=start, end=end, 
+                    start, end = myslider(frequency)
+                    show_chart(render_chart(histplotfunc, frequency, start=start, end=end, 
                                         xlabel='Frequency', ylabel='Total Customer', title='Histogram of Frequency by Customer'), use_container_width=True)
                     
                     st.markdown("#")
                     st.markdown("Below is a bar plot to see the top customer IDs")
 
-                    frequency_rank = rfm_df.sort_values(by="frequency", ascending=False).head(5)
+                    frequency_rank = schema.expand(rfm_df.loc[frequency.largest(5)])
         
-                    st.pyplot(barplotfunc(x=frequency_rank['frequency'], y=frequency_rank['customer_id'], 
+                    show_chart(render_chart(barplotfunc, x=frequency_rank['frequency'], y=frequency_rank['customer_id'], 
                                           xlabel='Frequency', ylabel="customer_id", title="By Frequency"), use_container_width=True)
 
                     st.markdown("#")
         
             with tab3:
-                avg_monetary = format_currency(rfm_df.monetary.mean(), 'BRL', locale='pt_BR')
+                avg_monetary = format_currency(rfm_window.means["monetary"], 'BRL', locale='pt_BR')
                 st.metric("Average Monetary", value=avg_monetary)
+                if estimate is not None:
+                    estimate_caption(estimate, "monetary", rfm_window.means["monetary"])
 
                 tab_row3_space1, tab_row3_1, tab_row3_space2 = st.columns((0.1, 0.7, 0.1))
 
                 with tab_row3_1:
                     st.markdown("Due to the sparse distribution of data, you have the option to filter it by selecting your preferred value using the slider located below.")
-                    start, end = myslider(rfm_df['monetary'])
-                    st.pyplot(histplotfunc(rfm_df['monetary'], start=start, end=end, 
+                    start, end = myslider(monetary)
+                    show_chart(render_chart(histplotfunc, monetary, start=start, end=end, 
                                         xlabel='Monetary', ylabel='Total Customer', title='Histogram of Monetary by Customer'), use_container_width=True)
                     
                     st.markdown("#")
                     st.markdown("Below is a bar plot to see the top customer IDs")
                     
-                    monetary_rank = rfm_df.sort_values(by="monetary", ascending=False).head(5)
+                    monetary_rank = schema.expand(rfm_df.loc[monetary.largest(5)])
         
-                    st.pyplot(barplotfunc(
+                    show_chart(render_chart(barplotfunc,
                         x=monetary_rank['monetary'], y=monetary_rank['customer_id'], xlabel='Monetary', ylabel="customer_id", title="By Monetary"
                     ), use_container_width=True)
 
                     st.markdown("#")
+
+            with tab4:
+                # 1-5 quintile R, F and M scores (quantile sketches) and the segments of the R x FM grid
+                scored_df, segments = rfm_window.segments()
+                champions = segments.loc['Champions']
+                st.metric("Champions revenue share", value=f"{champions['revenue_share']:.1%}",
+                          delta=f"{champions['customer_share']:.1%} of customers", delta_color="off")
+
+                tab_row4_space1, tab_row4_1, tab_row4_space2 = st.columns((0.1, 0.7, 0.1))
+
+                with tab_row4_1:
+                    st.markdown("Every customer gets a 1-5 score for recency, frequency and monetary (the quintile of the window it falls in), and a segment from its recency score and the mean of its frequency and monetary scores.")
+                    segment_revenue = (segments['revenue_share'] * 100).round(1)
+                    show_chart(render_chart(barplotfunc,
+                        x=segment_revenue, y=segment_revenue.index, xlabel='Revenue Share (%)', ylabel="Segment", title="Revenue Share by Segment"
+                    ), use_container_width=True)
+
+                    st.markdown("#")
+                    st.dataframe(segments.style.format({'revenue': '{:,.2f}', 'customer_share': '{:.1%}', 'revenue_share': '{:.1%}'}), use_container_width=True)
                     
                     
 
@@ -363,7 +341,7 @@ def main():
             st.markdown(
                 '<div style="text-align: justify;">You can see the snippet of RFM dataframe used in this analysis below in the table.</div>', unsafe_allow_html=True)
                         
-            st.dataframe(data=rfm_df, width=1000, height=200)
+            paginated_table(rfm_df, key="rfm_df", cache_key=("rfm_df", data_version, start_date, end_date), schema=schema, width=1000, height=200)
 
             st.markdown("#")
 
@@ -375,6 +353,28 @@ def main():
 
     if selected == 'Exploratory Data Analysis':
 
+        row6_space1, row6_1, row6_space2 = st.columns((0.1, 3.5, 0.1))
+
+        with row6_1:
+            st.header(f'{selected}')
+            mark_first_render()
+            st.markdown(
+                """
+                Next is to explore other interesting variable that may give us more insight about this dataset!
+                """
+            )       
+
+        from query_backend import cube_reference
+        from date_index import slice_date_range
+        from data_loader import build_in_background, derived_ready, load_derived
+        from chart_pool import chart_pool
+        from figure_cache import figure_cache
+        from approximate import approximation_error, relative_margin
+        from plot_functions import barplotfunc, barplotfunc2, lineplotfunct1, lineplotfunct2, donutchartfunc, payment_labels
+
+        main_df, schema, data_version = load_dataset()
+        min_date, max_date = date_bounds(main_df)
+
         with st.sidebar:
             st.subheader("Filter Data By Date")
             # Take the start_date & end_date from date_input
@@ -391,18 +391,83 @@ def main():
             options= ['1Q', '1M', '1W', '1D']
             )
 
-        main_df = main_df[(main_df["order_approved_at"] >= str(start_date)) &
-                (main_df["order_approved_at"] <= str(end_date))]
-
-        row6_space1, row6_1, row6_space2 = st.columns((0.1, 3.5, 0.1))
-
-        with row6_1:
-            st.header(f'{selected}')
-            st.markdown(
-                """
-                Next is to explore other interesting variable that may give us more insight about this dataset!
-                """
-            )       
+            chart_mode = select_chart_mode()
+            approximate = select_approximate(main_df)
+
+        if chart_mode == 'Vega-Lite':
+            from vega_charts import vega_spec as submit_chart
+            render_preview = submit_chart
+        else:
+            submit_chart = chart_pool.submit
+            render_preview = figure_cache.preview
+
+        main_df = slice_date_range(main_df, start_date, end_date)
+
+        # daily time x state x payment_type cube (or its DuckDB counterpart,
+        # see query_backend), built once per dataset; the chart workers
+        # memory-map its cells from the store (see chart_pool.CubeCells)
+        cube_ref = cube_reference("main_data.csv")
+
+        # (func, args, kwargs) of every chart of the page, drawn from cube: the
+        # reference above, or the sample cube of the previews
+        def chart_calls(cube, state):
+            totals_cube = cube.resolve() if hasattr(cube, 'resolve') else cube
+            state_counts = totals_cube.totals(start_date, end_date, by='customer_state', method='count', states=state).sort_values(ascending=False)
+            payment_counts = totals_cube.totals(start_date, end_date, by='payment_type', method='count', states=state).sort_values(ascending=False)
+            label = payment_labels(payment_counts.index)
+            return {
+                'total_trend': (lineplotfunct1, (cube, start_date, end_date), dict(xlabel='Dates', ylabel='Transaction Value', title='Total Transaction Trend', 
+                                     freq=select_freq, method='sum')),
+                'average_trend': (lineplotfunct1, (cube, start_date, end_date), dict(xlabel='Dates', ylabel='Transaction Value', title='Average Transaction Trend', 
+                                     freq=select_freq, method='mean')),
+                'state_orders': (barplotfunc, (), dict(
+                        x=state_counts, y=state_counts.index, xlabel='Total Order', ylabel='State', title='Total Order by State'
+                    )),
+                'state_total': (barplotfunc2, (), dict(cube=cube, min_date_filter=start_date, max_date_filter=end_date, states=state, xlabel='Transaction Value', ylabel='State', title='Total Transaction Value by State', method='sum')),
+                'state_average': (barplotfunc2, (), dict(cube=cube, min_date_filter=start_date, max_date_filter=end_date, states=state, xlabel='Transaction Value', ylabel='State', title='Average Transaction Value by State', method='mean')),
+                'state_trend': (lineplotfunct2, (cube, start_date, end_date), dict(states=state, hue='customer_state', xlabel='Dates', ylabel='Transaction Value', title='Total Transaction Value By States', 
+                                     freq=select_freq, method='sum')),
+                'payment_types': (donutchartfunc, (payment_counts,), dict(label=label, title='Donut Chart of Payment Types')),
+            }
+
+        # Values behind the charts that have a sampled preview: the rollup or
+        # totals query of the cube and its arguments
+        def preview_query(name, state):
+            return {
+                'total_trend': ('rollup', dict(freq=select_freq, method='sum')),
+                'average_trend': ('rollup', dict(freq=select_freq, method='mean')),
+                'state_total': ('totals', dict(by='customer_state', method='sum', states=state)),
+                'state_average': ('totals', dict(by='customer_state', method='mean', states=state)),
+            }[name]
+
+        # Until the cube is built, the trend and state value charts are first
+        # drawn from a stratified sample of the orders (see approximate), in
+        # the placeholders the exact charts then fill, while the cube is built
+        # in the background. The states are the ones the multiselect further
+        # down holds, read from its session state.
+        previews = {}
+        submitted_state = st.session_state.get('eda_states', [])
+        if approximate and not derived_ready("main_data.csv", cube_ref.name):
+            from approximate import SampleCube
+
+            build_in_background(cube_ref.resolve)
+
+            sample_cube = load_derived("main_data.csv", "sample_cube", SampleCube)
+            preview_names = ['total_trend', 'average_trend'] + (['state_total', 'state_average'] if submitted_state else [])
+            previews = {name: call for name, call in chart_calls(sample_cube, submitted_state).items() if name in preview_names}
+
+        slots = {}
+
+        def chart_slot(name):
+            slots[name] = st.empty()
+            if name not in previews:
+                return
+            func, args, kwargs = previews[name]
+            kind, query = preview_query(name, submitted_state)
+            with slots[name].container():
+                show_chart(render_preview(func, *args, **kwargs), use_container_width=True)
+                preview_caption(f"{sample_cube.rows:,} of {sample_cube.population:,} orders",
+                                f"{relative_margin(getattr(sample_cube, f'{kind}_interval')(start_date, end_date, **query)):.1%}")
 
         # trend analysis
         row7_space1, row7_1, row7_space2 = st.columns((0.1, 3.5, 0.1))
@@ -421,16 +486,12 @@ def main():
 
         with row8_1:
 
-            st.pyplot(lineplotfunct1(main_df, start_date, end_date, xlabel='Dates', ylabel='Transaction Value', title='Total Transaction Trend', 
-                                     freq=select_freq, method='sum'), 
-                                     use_container_width=True)
+            chart_slot('total_trend')
         
         row9_space1, row9_1, row9_space2 = st.columns((0.1, 3.5, 0.1))
         
         with row9_1:
-            st.pyplot(lineplotfunct1(main_df, start_date, end_date, xlabel='Dates', ylabel='Transaction Value', title='Average Transaction Trend', 
-                                     freq=select_freq, method='mean'), 
-                                     use_container_width=True)
+            chart_slot('average_trend')
 
         # state analysis  
         row10_space1, row10_1, row10_space2 = st.columns((0.1, 3.5, 0.1))        
@@ -445,11 +506,8 @@ def main():
             
             state= st.multiselect(
                 'Select Customer State',
-                options= main_df['customer_state'].unique(),
-            )
-
-            Selection_state= main_df.query(
-                "customer_state == @state"
+                options= main_df['customer_state'].unique().astype(str),
+                key='eda_states',
             )
 
         row11_space1, row11_1, row11_space2 = st.columns((0.1, 3.5, 0.1))
@@ -457,9 +515,7 @@ def main():
         with row11_1:
             st.write("")
             st.markdown("Bar Plot to see the total order made by customer per state(s)")   
-            st.pyplot(barplotfunc(
-                        x=Selection_state['customer_state'].value_counts(), y=Selection_state['customer_state'].value_counts().index, xlabel='Total Order', ylabel='State', title='Total Order by State'
-                    ), use_container_width=True)
+            chart_slot('state_orders')
             st.write("")
             st.markdown("Bar Plot to see the total transaction value and average transaction value in state(s), you can compare between states in this plot.")
 
@@ -469,19 +525,17 @@ def main():
         )
 
         with row12_1:
-            st.pyplot(barplotfunc2(df=Selection_state, min_date_filter=start_date, max_date_filter=end_date, xlabel='Transaction Value', ylabel='State', title='Total Transaction Value by State', method='sum'), use_container_width=True)
+            chart_slot('state_total')
             
         with row12_2:
-            st.pyplot(barplotfunc2(df=Selection_state, min_date_filter=start_date, max_date_filter=end_date, xlabel='Transaction Value', ylabel='State', title='Average Transaction Value by State', method='mean'), use_container_width=True)
+            chart_slot('state_average')
                     
 
         row13_space1, row13_1, row13_space2 = st.columns((0.1, 3.5, 0.1))
         with row13_1:
             st.write("")
             st.markdown("Line Plot to see the total transaction value by designed time interval, you also can compare between states with this plot.")
-            st.pyplot(lineplotfunct2(Selection_state, start_date, end_date, hue='customer_state', xlabel='Dates', ylabel='Transaction Value', title='Total Transaction Value By States', 
-                                     freq=select_freq, method='sum'), 
-                                     use_container_width=True)
+            chart_slot('state_trend')
             st.write("")
         
         row14_space1, row14_1, row14_space2 = st.columns((0.1, 3.5, 0.1))
@@ -497,12 +551,19 @@ def main():
         row15_space1, row15_1, row15_space2 = st.columns((0.1, 0.3, 0.1))
 
         with row15_1:
-            # Your data
-            payment_counts = Selection_state['payment_type'].value_counts()
-
-            label = ['Credit Card', 'Boleto', 'Voucher', 'Debit Card']
-
-            st.pyplot(donutchartfunc(payment_counts, label=label, title='Donut Chart of Payment Types'), use_container_width=True)
+            chart_slot('payment_types')
+
+        # Exact charts: every chart is submitted to the chart pool before the
+        # first one is shown, so they render in parallel (Vega-Lite specs are
+        # built straight away), and each replaces its preview, in page order
+        charts = {name: submit_chart(func, *args, **kwargs) for name, (func, args, kwargs) in chart_calls(cube_ref, state).items()}
+        for name, slot in slots.items():
+            with slot.container():
+                show_chart(charts[name], use_container_width=True)
+                if name in previews:
+                    kind, query = preview_query(name, submitted_state)
+                    error_caption(approximation_error(getattr(sample_cube, f"{kind}_interval")(start_date, end_date, **query),
+                                                      getattr(cube_ref.resolve(), kind)(start_date, end_date, **query)))
 
         st.caption('Copyright © Haris Yafie 2023')
 
@@ -511,5 +572,6 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with instrumented_rerun(SCRIPT_STARTED):
+        main()
 
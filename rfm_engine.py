@@ -0,0 +1,462 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Instrumentation Library
+from instrumentation import timed
+
+# RFM Scoring Library
+from rfm_segments import score_rfm, segment_summary
+
+# Standard Library
+from collections import OrderedDict
+import hashlib
+import threading
+
+
+RFM_COLUMNS = ["customer_id", "frequency", "monetary", "recency"]
+RFM_METRICS = ["recency", "frequency", "monetary"]
+# windows whose indexes are kept (the last few date ranges picked)
+WINDOW_INDEXES = 8
+
+
+# Create RFM Dataset (reference pandas implementation)
+def create_rfm_df(df):
+    rfm_df = df.groupby(by="customer_id", as_index=False).agg({
+    "order_approved_at": "max", # latest order date
+    "order_id": "count", # order count
+    "payment_value": "sum" # total revenue sum
+    })
+    rfm_df.columns = ["customer_id", "max_order_approved_at", "frequency", "monetary"]
+
+    # determine when customer last order date in days
+    rfm_df["max_order_approved_at"] = rfm_df["max_order_approved_at"].dt.date
+    recent_date = df["order_approved_at"].dt.date.max()
+    rfm_df["recency"] = rfm_df["max_order_approved_at"].apply(lambda x: (recent_date - x).days)
+
+    rfm_df.drop("max_order_approved_at", axis=1, inplace=True)
+
+    return rfm_df
+
+
+# Date To Day Number Function
+def to_day(value):
+    return int(pd.Timestamp(value).to_datetime64().astype("datetime64[D]").astype(np.int64))
+
+
+# Compensated Segment Sum Function
+#
+# Continues the running sums total/compensation (updated in place) over
+# values[lo[i]:hi[i]] with the same compensated (Kahan) summation pandas uses
+# for groupby sums, so the totals match create_rfm_df to the last bit. The loop
+# runs over the position inside a segment (bounded by the largest order count of
+# one customer), never over customers or orders.
+def kahan_segments(values, lo, hi, total, compensation):
+    # from a zero state the first Kahan step is exact, so it is done directly
+    # and only segments with more values go through the compensated loop
+    fresh = np.flatnonzero((hi > lo) & (total == 0) & (compensation == 0))
+    total[fresh] = values[lo[fresh]]
+    lo = lo.copy()
+    lo[fresh] += 1
+
+    remaining = np.flatnonzero(hi > lo)
+    if len(remaining) == 0:
+        return
+
+    lengths = (hi - lo)[remaining]
+    by_length = remaining[np.argsort(-lengths, kind="stable")]
+    starts = lo[by_length]
+    sorted_lengths = (hi - lo)[by_length]
+
+    running_total = total[by_length]
+    running_compensation = compensation[by_length]
+    for k in range(int(sorted_lengths[0])):
+        m = np.count_nonzero(sorted_lengths > k)
+        y = values[starts[:m] + k] - running_compensation[:m]
+        t = running_total[:m] + y
+        running_compensation[:m] = t - running_total[:m] - y
+        running_total[:m] = t
+
+    total[by_length] = running_total
+    compensation[by_length] = running_compensation
+
+
+def segment_sum(values, lo, hi):
+    total = np.zeros(len(lo), dtype=np.float64)
+    kahan_segments(values, lo, hi, total, np.zeros(len(lo), dtype=np.float64))
+    return total
+
+
+# Grow Function
+# Capacity doubling, so adding customers batch after batch stays O(batch)
+def grow(array, size, fill):
+    if len(array) >= size:
+        return array
+    grown = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+# Order Runs
+#
+# Orders sorted once by (customer, day) and encoded as a single int64 key
+# customer_code * span + day offset. The orders of one customer inside any
+# [start_day, end_day] window are then a contiguous run of that array, found for
+# every customer at once with two searchsorted calls.
+class OrderRuns:
+    def __init__(self, codes, days, values):
+        order = np.lexsort((days, codes))
+        self.codes = codes[order].astype(np.int64)
+        self.days = days[order]
+        self.values = values[order]
+
+        first_of_customer = np.ones(len(self.codes), dtype=bool)
+        first_of_customer[1:] = self.codes[1:] != self.codes[:-1]
+        self.customers = self.codes[first_of_customer]
+
+        self.first_day = int(days.min()) if len(days) else 0
+        self.last_day = int(days.max()) if len(days) else -1
+        self.span = self.last_day - self.first_day + 1
+        self.keys = self.codes * self.span + (self.days - self.first_day)
+        self.customer_base = self.customers * self.span
+
+    def __len__(self):
+        return len(self.codes)
+
+    # Runs of both sets of orders; a customer's orders of one day stay in
+    # arrival order (self's first), as lexsort is stable
+    def merged(self, newer):
+        return OrderRuns(np.concatenate([self.codes, newer.codes]), np.concatenate([self.days, newer.days]),
+                         np.concatenate([self.values, newer.values]))
+
+    def ranges(self, start_day, end_day):
+        start = max(start_day, self.first_day) - self.first_day
+        end = min(end_day, self.last_day) - self.first_day
+        if start > end:
+            return None
+
+        lo = np.searchsorted(self.keys, self.customer_base + start, side="left")
+        hi = np.searchsorted(self.keys, self.customer_base + end, side="right")
+        return self.customers, lo, hi
+
+    # Adds the orders inside the window to per-customer accumulators
+    def accumulate(self, start_day, end_day, frequency, total, compensation, last_day):
+        ranges = self.ranges(start_day, end_day)
+        if ranges is None:
+            return
+        customers, lo, hi = ranges
+
+        active = hi > lo
+        customers, lo, hi = customers[active], lo[active], hi[active]
+
+        frequency[customers] += hi - lo
+        running_total, running_compensation = total[customers], compensation[customers]
+        kahan_segments(self.values, lo, hi, running_total, running_compensation)
+        total[customers] = running_total
+        compensation[customers] = running_compensation
+        last_day[customers] = np.maximum(last_day[customers], self.days[hi - 1])
+
+
+# Linear Percentile Function
+# np.percentile of already sorted values (same interpolation), O(1)
+def sorted_percentile(values, q):
+    position = q / 100 * (len(values) - 1)
+    below = int(np.floor(position))
+    above = min(below + 1, len(values) - 1)
+    a, b = values[below], values[above]
+    t = position - below
+    diff = b - a
+    return b - diff * (1 - t) if t >= 0.5 else a + diff * t
+
+
+# Metric Index
+#
+# One RFM metric of a window, sorted once. The customers inside any slider
+# range are a slice of the sorted values found with two binary searches, and
+# the cumulative count at every bin edge is one more, so the histogram of a
+# range is counted by subtraction in O(bins log n) instead of masking every
+# customer. The bins follow numpy's "auto" rule, which seaborn's histplot uses,
+# computed from the slice (extremes, quartiles) without copying it.
+class MetricIndex:
+    def __init__(self, values):
+        self.values = values
+        self.sorted = np.sort(values.to_numpy())
+        self.fingerprint = hashlib.md5(self.sorted.tobytes()).hexdigest()
+        self._ranks = {}
+
+    def min(self):
+        return self.sorted[0]
+
+    def max(self):
+        return self.sorted[-1]
+
+    def range(self, start, end):
+        return self.sorted[np.searchsorted(self.sorted, start, side="left"):np.searchsorted(self.sorted, end, side="right")]
+
+    # (bin edges, counts) of the values in [start, end], as np.histogram(..., bins="auto")
+    def histogram(self, start, end):
+        values = self.range(start, end)
+        if len(values) == 0:
+            return np.array([0.0, 1.0]), np.zeros(1, dtype=np.int64)
+
+        first, last = float(values[0]), float(values[-1])
+        sturges = (last - first) / (np.log2(len(values)) + 1.0)
+        fd = 2.0 * (sorted_percentile(values, 75) - sorted_percentile(values, 25)) * len(values) ** (-1.0 / 3.0)
+        width = min(fd, sturges) if fd else sturges
+        if first == last:
+            first, last = first - 0.5, last + 0.5
+        bins = int(np.ceil((last - first) / width)) if width else 1
+
+        edges = np.linspace(first, last, bins + 1)
+        cumulative = np.searchsorted(values, edges, side="left")
+        cumulative[-1] = len(values)
+        return edges, np.diff(cumulative)
+
+    # Index labels of the k lowest / highest customers, ties in row order
+    # (nsmallest / nlargest), found once per k
+    def smallest(self, k):
+        if ("smallest", k) not in self._ranks:
+            self._ranks[("smallest", k)] = self.values.nsmallest(k).index
+        return self._ranks[("smallest", k)]
+
+    def largest(self, k):
+        if ("largest", k) not in self._ranks:
+            self._ranks[("largest", k)] = self.values.nlargest(k).index
+        return self._ranks[("largest", k)]
+
+
+# RFM Window
+# rfm_df of one date window with the averages and the index of every metric;
+# the scores and segments are computed on first use
+class RFMWindow:
+    def __init__(self, rfm_df):
+        self.frame = rfm_df
+        self.means = {metric: rfm_df[metric].mean() for metric in RFM_METRICS}
+        self.metrics = {metric: MetricIndex(rfm_df[metric]) for metric in RFM_METRICS}
+        self._segments = None
+
+    # (rfm_df with r/f/m scores and segment, per segment summary)
+    def segments(self):
+        if self._segments is None:
+            scored = score_rfm(self.frame)
+            self._segments = scored, segment_summary(scored)
+        return self._segments
+
+
+# Window Cache
+#
+# window_index of an RFM backend (RFMEngine, query_backend.DuckDBRFM): the
+# RFMWindow of a date window, built on the first request and kept for the
+# reruns that follow (every slider drag) until a batch changes the backend.
+# Requests for a window being built (e.g. in the background) wait for it. The
+# backend provides window(start_date, end_date) and self._lock, and calls
+# clear_windows when it applies a batch.
+class WindowCache:
+    def init_windows(self):
+        self._windows = OrderedDict()
+        self._building = {}
+        self._batches = 0
+
+    # under self._lock
+    def clear_windows(self):
+        self._windows.clear()
+        self._batches += 1
+
+    @timed("window_index")
+    def window_index(self, start_date, end_date):
+        key = (to_day(start_date), to_day(end_date))
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None:
+                self._windows.move_to_end(key)
+                return window
+            building = self._building.setdefault(key, threading.Lock())
+
+        with building:
+            with self._lock:
+                window = self._windows.get(key)
+                if window is not None:
+                    return window
+                batches = self._batches
+
+            window = RFMWindow(self.window(start_date, end_date))
+            with self._lock:
+                self._building.pop(key, None)
+                # a batch applied meanwhile: hand the window out but do not keep it
+                if batches != self._batches:
+                    return window
+                self._windows[key] = window
+                while len(self._windows) > WINDOW_INDEXES:
+                    self._windows.popitem(last=False)
+            return window
+
+    # Whether window_index(start_date, end_date) is already built
+    def has_window(self, start_date, end_date):
+        with self._lock:
+            return (to_day(start_date), to_day(end_date)) in self._windows
+
+
+# Customer Sort Key Function
+# Values that sort like the customer ids (the order of the groupby in
+# create_rfm_df): the ids themselves, or the keys of the HexIdTable of codes
+def id_sort_keys(ids, id_table=None):
+    return id_table.sort_keys(ids) if id_table is not None else np.asarray(ids)
+
+
+# RFM Engine
+#
+# Answers create_rfm_df for any [start_date, end_date] window in
+# O(customers * log(orders)) with no Python level loop. Besides the sorted
+# orders it keeps the all-time RFM state of every customer (order count, last
+# order day and compensated revenue sum): the default full-range view is read
+# straight from it, and apply_batch updates it in O(batch) when new orders are
+# ingested (see incremental_refresh). Batch orders are kept in delta runs that
+# window queries combine with the base one: every batch adds a run, and runs
+# are merged with their older neighbour once it is no larger (a binary
+# counter), so a batch costs O(batch log batches) amortized and a window reads
+# O(log batches) runs.
+#
+# Monetary is summed per customer in day order, the base's orders first, then
+# each batch's: exactly the sum of create_rfm_df while batches arrive in date
+# order. A batch with orders older than those already applied is added after
+# them, not in date order, so those customers' sums may differ from pandas in
+# the last bits (benchmark.py --verify checks them to VERIFY_RTOL).
+#
+# id_table: HexIdTable of the customer_id codes, so customers first seen in a
+# batch are still listed in id order; without it the ids themselves are sorted.
+class RFMEngine(WindowCache):
+    def __init__(self, df, id_table=None):
+        customer_ids, customer_codes = np.unique(df["customer_id"].to_numpy(), return_inverse=True)
+        days = df["order_approved_at"].to_numpy().astype("datetime64[D]").astype(np.int64)
+
+        self.customer_ids = customer_ids
+        self.extra_ids = []
+        self.extra_codes = {}
+        self.id_table = id_table
+        self.order = None
+        self.order_keys = None
+        self.base = OrderRuns(customer_codes.reshape(-1), days, df["payment_value"].to_numpy(dtype=np.float64))
+        self.deltas = []
+        self.first_day = self.base.first_day
+        self.last_day = self.base.last_day
+        self._lock = threading.Lock()
+        self.init_windows()
+
+        size = len(customer_ids)
+        self.frequency = np.zeros(size, dtype=np.int64)
+        self.total = np.zeros(size, dtype=np.float64)
+        self.compensation = np.zeros(size, dtype=np.float64)
+        self.last_order_day = np.full(size, np.iinfo(np.int64).min, dtype=np.int64)
+        self.base.accumulate(self.first_day, self.last_day, self.frequency, self.total, self.compensation, self.last_order_day)
+
+    def customer_count(self):
+        return len(self.customer_ids) + len(self.extra_ids)
+
+    def empty(self):
+        return pd.DataFrame({
+            "customer_id": np.array([], dtype=self.customer_ids.dtype),
+            "frequency": np.array([], dtype=np.int64),
+            "monetary": np.array([], dtype=np.float64),
+            "recency": np.array([], dtype=np.int64),
+        })
+
+    def frame(self, frequency, total, last_day):
+        if self.order is None:
+            active = np.flatnonzero(frequency > 0)
+        else:
+            active = self.order[frequency[self.order] > 0]
+        if len(active) == 0:
+            return self.empty()
+
+        if self.extra_ids:
+            customer_ids = np.concatenate([self.customer_ids, np.array(self.extra_ids, dtype=self.customer_ids.dtype)])
+        else:
+            customer_ids = self.customer_ids
+        last_day = last_day[active]
+
+        return pd.DataFrame({
+            "customer_id": customer_ids[active],
+            "frequency": frequency[active],
+            "monetary": total[active],
+            "recency": (last_day.max() - last_day).astype(np.int64),
+        })
+
+    # Same output as create_rfm_df(df) restricted to the date window
+    @timed("RFMEngine.window")
+    def window(self, start_date, end_date):
+        start_day, end_day = to_day(start_date), to_day(end_date)
+
+        with self._lock:
+            if start_day <= self.first_day and end_day >= self.last_day:
+                return self.frame(self.frequency, self.total, self.last_order_day)
+
+            size = self.customer_count()
+            frequency = np.zeros(size, dtype=np.int64)
+            total = np.zeros(size, dtype=np.float64)
+            compensation = np.zeros(size, dtype=np.float64)
+            last_day = np.full(size, np.iinfo(np.int64).min, dtype=np.int64)
+            for runs in (self.base, *self.deltas):
+                runs.accumulate(start_day, end_day, frequency, total, compensation, last_day)
+            return self.frame(frequency, total, last_day)
+
+    # Internal codes of customer ids, new customers get the next free codes
+    def internal_codes(self, ids):
+        codes = np.full(len(ids), -1, dtype=np.int64)
+        if len(self.customer_ids):
+            positions = np.minimum(np.searchsorted(self.customer_ids, ids), len(self.customer_ids) - 1)
+            found = self.customer_ids[positions] == ids
+            codes[found] = positions[found]
+        for i in np.flatnonzero(codes < 0):
+            code = self.extra_codes.get(ids[i])
+            if code is None:
+                code = self.extra_codes[ids[i]] = self.customer_count()
+                self.extra_ids.append(ids[i])
+            codes[i] = code
+        return codes
+
+    # Output Order Function
+    # New customers get the next internal codes, which do not sort like their
+    # ids; order lists the internal codes in id order (the order of the groupby
+    # in create_rfm_df), the new ones merged into their sorted positions.
+    def merge_order(self, first_new):
+        if self.order is None:
+            self.order = np.arange(first_new)
+            self.order_keys = id_sort_keys(self.customer_ids, self.id_table)
+
+        new_ids = np.array(self.extra_ids[first_new - len(self.customer_ids):], dtype=self.customer_ids.dtype)
+        new_keys = id_sort_keys(new_ids, self.id_table)
+        by_key = np.argsort(new_keys, kind="stable")
+        positions = np.searchsorted(self.order_keys, new_keys[by_key])
+        self.order = np.insert(self.order, positions, np.arange(first_new, self.customer_count())[by_key])
+        self.order_keys = np.insert(self.order_keys, positions, new_keys[by_key])
+
+    # Incremental Update Function
+    # batch: new rows with the columns create_rfm_df reads, in date order
+    @timed("RFMEngine.apply_batch")
+    def apply_batch(self, batch):
+        days = batch["order_approved_at"].to_numpy().astype("datetime64[D]").astype(np.int64)
+        values = batch["payment_value"].to_numpy(dtype=np.float64)
+        if len(days) == 0:
+            return
+
+        with self._lock:
+            self.clear_windows()
+            first_new = self.customer_count()
+            codes = self.internal_codes(batch["customer_id"].to_numpy())
+            size = self.customer_count()
+            if size > first_new:
+                self.merge_order(first_new)
+            self.frequency = grow(self.frequency, size, 0)
+            self.total = grow(self.total, size, 0.0)
+            self.compensation = grow(self.compensation, size, 0.0)
+            self.last_order_day = grow(self.last_order_day, size, np.iinfo(np.int64).min)
+
+            runs = OrderRuns(codes, days, values)
+            runs.accumulate(runs.first_day, runs.last_day, self.frequency, self.total, self.compensation, self.last_order_day)
+
+            self.deltas.append(runs)
+            while len(self.deltas) > 1 and len(self.deltas[-2]) <= len(self.deltas[-1]):
+                newer = self.deltas.pop()
+                self.deltas.append(self.deltas.pop().merged(newer))
+            self.first_day = min(self.first_day, runs.first_day)
+            self.last_day = max(self.last_day, runs.last_day)
@@ -0,0 +1,143 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Instrumentation Library
+from instrumentation import timed
+
+
+# Score edges are the 20/40/60/80% quantiles of each metric
+QUINTILES = [0.2, 0.4, 0.6, 0.8]
+SKETCH_K = 256
+SKETCH_CHUNK_ROWS = 1_000_000
+
+# Segments of the (R score, FM score) grid, FM being the mean of the F and M
+# scores rounded half up. Rows are R 1..5, columns FM 1..5.
+SEGMENT_NAMES = [
+    "Hibernating", "At Risk", "Can't Lose Them", "About to Sleep", "Need Attention",
+    "Loyal Customers", "Promising", "New Customers", "Potential Loyalists", "Champions",
+]
+SEGMENT_GRID = np.array([
+    [0, 0, 1, 1, 2],
+    [0, 0, 1, 1, 2],
+    [3, 3, 4, 5, 5],
+    [6, 8, 8, 5, 5],
+    [7, 8, 8, 9, 9],
+])
+
+
+# Quantile Sketch
+#
+# Mergeable KLL-style sketch: level h holds items that each stand for 2**h
+# values. A level over its capacity is sorted and every other item (random
+# offset) is promoted to the next level, so memory stays O(k log(n / k)) and the
+# rank error of a quantile about 1 / k, whatever the number of values. Sketches
+# of chunks or partitions merge level by level, so quantiles of the whole never
+# need a global sort. Up to k values the sketch is exact.
+class QuantileSketch:
+    def __init__(self, k=SKETCH_K, seed=0):
+        self.k = k
+        self.levels = [np.empty(0, dtype=np.float64)]
+        self.count = 0
+        self._rng = np.random.default_rng(seed)
+
+    # capacity shrinks by 2/3 per level below the top one, as in KLL
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.count += len(values)
+        self.compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.compress()
+        return self
+
+    def compress(self):
+        while True:
+            over = [level for level, items in enumerate(self.levels) if len(items) > self.capacity(level)]
+            if not over:
+                return
+            level = over[0]
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0, dtype=np.float64))
+
+            items = np.sort(self.levels[level])
+            # an odd item out stays on its level
+            kept = items[len(items) - len(items) % 2:]
+            promoted = items[int(self._rng.integers(2)):len(items) - len(items) % 2:2]
+            self.levels[level] = kept
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    # Lower quantiles: the smallest item whose weighted rank reaches q * count
+    def quantiles(self, qs):
+        items = np.concatenate(self.levels)
+        if len(items) == 0:
+            return np.full(len(qs), np.nan)
+        weights = np.concatenate([np.full(len(level_items), 2 ** level, dtype=np.int64) for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        items, cumulative = items[order], np.cumsum(weights[order])
+        ranks = np.maximum(np.ceil(np.asarray(qs) * cumulative[-1]), 1)
+        return items[np.minimum(np.searchsorted(cumulative, ranks, side="left"), len(items) - 1)]
+
+
+# Sketch Function
+# One sketch per metric, built chunk by chunk and merged (the same code path
+# that combines the sketches of separate partitions)
+@timed("sketch_rfm")
+def sketch_rfm(rfm_df, chunk_rows=SKETCH_CHUNK_ROWS, k=SKETCH_K):
+    sketches = {}
+    for metric in ["recency", "frequency", "monetary"]:
+        values = rfm_df[metric].to_numpy()
+        sketch = QuantileSketch(k)
+        for start in range(0, len(values), chunk_rows):
+            sketch.merge(QuantileSketch(k, seed=start).update(values[start:start + chunk_rows]))
+        sketches[metric] = sketch
+    return sketches
+
+
+# Scoring Function
+#
+# 1-5 quintile scores of create_rfm_df's output: a customer scores one more
+# for every quintile edge its value is above, so heavily tied values (most
+# customers order once) share the lowest score instead of being split at
+# random. Recency is reversed: the most recent customers score 5.
+# sketches: from sketch_rfm, e.g. merged over partitions; built from rfm_df
+# when not given.
+@timed("score_rfm")
+def score_rfm(rfm_df, sketches=None):
+    sketches = sketches or sketch_rfm(rfm_df)
+    scores = {}
+    for metric in ["recency", "frequency", "monetary"]:
+        edges = sketches[metric].quantiles(QUINTILES)
+        above = np.searchsorted(edges, rfm_df[metric].to_numpy(), side="left")
+        scores[metric] = (5 - above if metric == "recency" else 1 + above).astype(np.int8)
+
+    fm_score = (scores["frequency"] + scores["monetary"] + 1) // 2
+    segment_codes = SEGMENT_GRID[scores["recency"] - 1, fm_score - 1]
+    return rfm_df.assign(
+        r_score=scores["recency"],
+        f_score=scores["frequency"],
+        m_score=scores["monetary"],
+        segment=pd.Categorical.from_codes(segment_codes, categories=SEGMENT_NAMES),
+    )
+
+
+# Segment Summary Function
+# Customers and revenue (monetary) per segment, with their shares
+def segment_summary(scored):
+    summary = scored.groupby("segment", observed=False).agg(customers=("monetary", "size"), revenue=("monetary", "sum"))
+    summary["customer_share"] = summary["customers"] / max(summary["customers"].sum(), 1)
+    summary["revenue_share"] = summary["revenue"] / (summary["revenue"].sum() or 1)
+    summary.index = summary.index.astype(str)
+    return summary.sort_values("revenue", ascending=False)
@@ -0,0 +1,200 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# ETL Library (main_data.csv layout)
+from etl_pipeline import DATETIME_FORMAT, MAIN_COLUMNS
+
+# Standard Library
+import argparse
+import os
+import time
+
+
+# Marginals of the public Olist dataset (share of main_data.csv rows), so the
+# synthetic data has the same skew: SP alone is ~42% of the orders, credit card
+# ~74% of the payments, ~3% of orders come from a returning customer and there
+# are ~1.045 payments per order.
+STATE_SHARES = {
+    "SP": 0.4193, "RJ": 0.1292, "MG": 0.1170, "RS": 0.0549, "PR": 0.0507, "SC": 0.0366,
+    "BA": 0.0340, "DF": 0.0215, "ES": 0.0205, "GO": 0.0203, "PE": 0.0166, "CE": 0.0134,
+    "PA": 0.0098, "MT": 0.0091, "MA": 0.0075, "MS": 0.0072, "PB": 0.0054, "PI": 0.0050,
+    "RN": 0.0049, "AL": 0.0041, "SE": 0.0035, "TO": 0.0028, "RO": 0.0025, "AM": 0.0015,
+    "AC": 0.0008, "AP": 0.0007, "RR": 0.0005,
+}
+STATE_CAPITALS = {
+    "SP": "sao paulo", "RJ": "rio de janeiro", "MG": "belo horizonte", "RS": "porto alegre",
+    "PR": "curitiba", "SC": "florianopolis", "BA": "salvador", "DF": "brasilia", "ES": "vitoria",
+    "GO": "goiania", "PE": "recife", "CE": "fortaleza", "PA": "belem", "MT": "cuiaba",
+    "MA": "sao luis", "MS": "campo grande", "PB": "joao pessoa", "PI": "teresina", "RN": "natal",
+    "AL": "maceio", "SE": "aracaju", "TO": "palmas", "RO": "porto velho", "AM": "manaus",
+    "AC": "rio branco", "AP": "macapa", "RR": "boa vista",
+}
+# type of the first payment of an order; the extra payments of split orders are
+# vouchers, which brings the row shares to ~74/19/5.5/1.5%
+FIRST_PAYMENT_TYPE_SHARES = {"credit_card": 0.770, "boleto": 0.200, "voucher": 0.013, "debit_card": 0.016}
+ORDER_STATUS_SHARES = {
+    "delivered": 0.9705, "shipped": 0.0112, "canceled": 0.0062, "unavailable": 0.0061,
+    "invoiced": 0.0032, "processing": 0.0030,
+}
+# credit card installments 1..10, every other payment type pays in one go
+INSTALLMENT_SHARES = [0.50, 0.12, 0.10, 0.07, 0.05, 0.04, 0.02, 0.05, 0.005, 0.045]
+
+REPEAT_CUSTOMER_RATE = 0.031
+SPLIT_PAYMENT_RATE = 0.027
+CAPITAL_SHARE = 0.35
+CITIES_PER_STATE = 200
+
+FIRST_DAY = np.datetime64("2016-09-04")
+LAST_DAY = np.datetime64("2018-09-03")
+BLACK_FRIDAY = np.datetime64("2017-11-24")
+
+
+# Id Function
+# Deterministic 32 character hex ids: two splitmix64 words of (seed, kind, number)
+def splitmix64(values):
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def hex_ids(numbers, seed, kind):
+    salt = splitmix64(np.array([seed * 8 + kind], dtype=np.uint64))[0]
+    numbers = np.asarray(numbers, dtype=np.uint64) * np.uint64(2)
+    words = np.stack([splitmix64(salt ^ numbers), splitmix64(salt ^ (numbers + np.uint64(1)))], axis=1)
+    hex_text = words.astype(">u8").tobytes().hex()
+    return np.frombuffer(hex_text.encode("ascii"), dtype="S32").astype("U32").astype(object)
+
+
+# Order Volume Function
+# Daily order weights: the marketplace grows over the two years, with the
+# Black Friday 2017 peak of the real data
+def day_weights():
+    days = np.arange(FIRST_DAY, LAST_DAY + 1)
+    weights = np.linspace(0.05, 1.0, len(days))
+    weights[days == BLACK_FRIDAY] *= 5
+    return days, weights / weights.sum()
+
+
+def choice(rng, shares, size):
+    labels = np.array(list(shares))
+    probabilities = np.array(list(shares.values()))
+    return labels[rng.choice(len(labels), size=size, p=probabilities / probabilities.sum())]
+
+
+# Chunk Generator Function
+#
+# Yields main_data.csv rows chunk by chunk, so 10M rows never have to fit in
+# memory at once. One row per payment, like the ETL output. The same (rows,
+# seed, chunk_rows) always gives the same data.
+def iter_main_data(rows, seed=0, chunk_rows=1_000_000):
+    rng = np.random.default_rng(seed)
+    days, weights = day_weights()
+    states = list(STATE_SHARES)
+    state_probabilities = np.array(list(STATE_SHARES.values()))
+    state_probabilities /= state_probabilities.sum()
+
+    customers = 0
+    customer_states = np.empty(0, dtype=np.int8)
+    orders = 0
+    emitted = 0
+
+    while emitted < rows:
+        wanted = min(chunk_rows, rows - emitted)
+        # split orders have 1 + geometric extra payments, the last order of the
+        # chunk may lose some
+        payments = 1 + np.where(rng.random(wanted) < SPLIT_PAYMENT_RATE, rng.geometric(0.6, wanted), 0)
+        order_count = int(np.searchsorted(np.cumsum(payments), wanted) + 1)
+        payments = payments[:order_count]
+        payments[-1] -= payments.sum() - wanted
+
+        # customer_unique_id: mostly new customers, ~3% returning ones
+        # (any customer created before the order)
+        returning = rng.random(order_count) < REPEAT_CUSTOMER_RATE
+        returning[0] &= customers > 0
+        created_before = customers + np.cumsum(~returning) - ~returning
+        customer_numbers = np.where(returning, (rng.random(order_count) * created_before).astype(np.int64), created_before)
+        new_customers = np.count_nonzero(~returning)
+        customer_states = np.concatenate([customer_states, rng.choice(len(states), new_customers, p=state_probabilities).astype(np.int8)])
+        customers += new_customers
+
+        state_codes = customer_states[customer_numbers]
+        in_capital = rng.random(order_count) < CAPITAL_SHARE
+        city_numbers = np.minimum(rng.zipf(1.6, order_count), CITIES_PER_STATE)
+        cities = np.where(
+            in_capital,
+            np.array([STATE_CAPITALS[state] for state in states], dtype=object)[state_codes],
+            np.char.add(np.array([state.lower() + " cidade " for state in states])[state_codes], city_numbers.astype(str)).astype(object),
+        )
+
+        purchase = (
+            days[rng.choice(len(days), order_count, p=weights)].astype("datetime64[s]")
+            + rng.integers(0, 86400, order_count).astype("timedelta64[s]")
+        )
+        approved = purchase + np.minimum(rng.exponential(10 * 3600, order_count), 7 * 86400).astype("timedelta64[s]")
+
+        order_numbers = orders + np.arange(order_count)
+        orders += order_count
+
+        # expand orders to payment rows
+        row_order = np.repeat(np.arange(order_count), payments)
+        first_payment = np.repeat(np.cumsum(payments) - payments, payments)
+        sequential = np.arange(wanted) - first_payment + 1
+
+        payment_type = choice(rng, FIRST_PAYMENT_TYPE_SHARES, wanted)
+        payment_type[sequential > 1] = "voucher"
+        installments = np.where(
+            payment_type == "credit_card",
+            rng.choice(len(INSTALLMENT_SHARES), wanted, p=np.array(INSTALLMENT_SHARES) / sum(INSTALLMENT_SHARES)) + 1,
+            1,
+        )
+        # log-normal order values: median ~R$100, mean ~R$150
+        payment_value = np.maximum(np.round(rng.lognormal(np.log(100), 0.9, wanted), 2), 0.01)
+
+        yield pd.DataFrame({
+            "customer_id": hex_ids(order_numbers, seed, 0)[row_order],
+            "customer_unique_id": hex_ids(customer_numbers, seed, 1)[row_order],
+            "customer_city": cities[row_order],
+            "customer_state": np.array(states, dtype=object)[state_codes][row_order],
+            "order_id": hex_ids(order_numbers, seed, 2)[row_order],
+            "order_status": choice(rng, ORDER_STATUS_SHARES, order_count)[row_order],
+            "order_purchase_timestamp": purchase[row_order],
+            "order_approved_at": approved[row_order],
+            "payment_sequential": sequential.astype(np.float64),
+            "payment_type": payment_type,
+            "payment_installments": installments.astype(np.float64),
+            "payment_value": payment_value,
+        })[MAIN_COLUMNS]
+        emitted += wanted
+
+
+def generate_main_data(rows, seed=0):
+    return pd.concat(iter_main_data(rows, seed), ignore_index=True)
+
+
+# Write Function
+def write_main_data(path, rows, seed=0, chunk_rows=1_000_000):
+    start = time.perf_counter()
+    header = True
+    for chunk in iter_main_data(rows, seed, chunk_rows):
+        chunk.to_csv(path, mode="w" if header else "a", header=header, index=False, date_format=DATETIME_FORMAT)
+        header = False
+    return {"path": path, "rows": rows, "seed": seed, "bytes": os.path.getsize(path), "seconds": time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a seeded synthetic main_data.csv with Olist-like skew.")
+    parser.add_argument("rows", type=int, help="number of rows (payments) to write")
+    parser.add_argument("--output", default="main_data.csv", help="csv to write")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000, help="rows generated per chunk")
+    args = parser.parse_args()
+
+    stats = write_main_data(args.output, args.rows, args.seed, args.chunk_rows)
+    for name, value in stats.items():
+        print(f"{name:>8}: {value}")
+
+
+if __name__ == "__main__":
+    main()
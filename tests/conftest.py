@@ -0,0 +1,108 @@
+# Testing Library
+import pytest
+
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Standard Library
+import os
+import sys
+
+# the dashboard modules are flat files next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+from etl_pipeline import DATETIME_FORMAT
+from synthetic_data import generate_main_data
+
+
+DATETIME_COLUMNS = ["order_purchase_timestamp", "order_approved_at"]
+ORDER_ROWS = 3000
+# the tolerance of benchmark.VERIFY_RTOL
+RTOL = 1e-12
+FREQS = ["1D", "1W", "1M", "1Q"]
+
+
+# Synthetic Orders
+# main_data.csv rows in date order at day resolution, as the dashboard holds
+# them, with returning customers and split payments
+@pytest.fixture(scope="session")
+def orders():
+    df = generate_main_data(ORDER_ROWS, seed=1)
+    df = df.sort_values(by="order_approved_at", kind="stable", ignore_index=True)
+    for column in DATETIME_COLUMNS:
+        df[column] = df[column].astype("datetime64[ns]").dt.normalize()
+    return df
+
+
+@pytest.fixture(autouse=True)
+def empty_data_cache():
+    yield
+    data_loader.clear_cache()
+
+
+def write_orders(path, df):
+    df.to_csv(path, index=False, date_format=DATETIME_FORMAT)
+    return path
+
+
+# Original Loading Function
+# main_data.csv read the way the dashboard did before the column store
+def baseline_frame(path):
+    df = pd.read_csv(path)
+    df.sort_values(by="order_approved_at", inplace=True)
+    df.reset_index(inplace=True)
+    for column in DATETIME_COLUMNS:
+        df[column] = pd.to_datetime(df[column], format='%Y-%m-%d %H:%M:%S').dt.normalize()
+    return df
+
+
+# Original date filter of the dashboard pages
+def baseline_window(df, start_date, end_date):
+    return df[(df["order_approved_at"] >= start_date) & (df["order_approved_at"] <= end_date)]
+
+
+# Rows of two frames, whatever their order
+def same_rows(expected, result, columns):
+    key = ["order_id", "payment_sequential"]
+    expected = expected[columns].sort_values(by=key, ignore_index=True)
+    result = result[columns].sort_values(by=key, ignore_index=True)
+    pd.testing.assert_frame_equal(expected, result, check_dtype=False, check_categorical=False)
+
+
+# Date windows checked on every structure, as in benchmark.py --verify
+def windows(df):
+    min_date, max_date = df["order_approved_at"].min(), df["order_approved_at"].max()
+    return [
+        (min_date, max_date),
+        (max_date - pd.Timedelta(days=365), max_date),
+        (min_date + pd.Timedelta(days=90), min_date + pd.Timedelta(days=120)),
+        (max_date, max_date),
+    ]
+
+
+# A cube or RFM engine built from the first 80% of the orders, the rest applied
+# as batches (rows of each batch)
+def built_with_batches(structure_class, orders, batches):
+    head = orders.iloc[:len(orders) * 4 // 5]
+    structure = structure_class(head)
+    for rows in batches:
+        structure.apply_batch(orders.iloc[rows])
+    return structure
+
+
+def in_date_order(orders):
+    return np.array_split(np.arange(len(orders) * 4 // 5, len(orders)), 3)
+
+
+def interleaved(orders):
+    rest = np.arange(len(orders) * 4 // 5, len(orders))
+    return [rest[i::3] for i in range(3)]
+
+
+# RFM windows are exact, monetary to rtol when given
+def check_window(expected, result, rtol=None):
+    if rtol is not None:
+        np.testing.assert_allclose(result.pop("monetary"), expected.pop("monetary"), rtol=rtol, atol=0)
+    pd.testing.assert_frame_equal(expected, result, check_exact=True)
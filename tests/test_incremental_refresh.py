@@ -0,0 +1,94 @@
+# Testing Library
+import pytest
+
+# Standard Library
+import os
+
+import data_loader
+from data_loader import load_main_data, load_schema, read_watermark
+from incremental_refresh import ingest_batch
+from rfm_engine import create_rfm_df
+
+from conftest import baseline_frame, same_rows, write_orders
+
+
+COLUMNS = ["customer_id", "order_id", "payment_sequential", "customer_state", "order_approved_at", "payment_value"]
+BASE_ROWS = 2000
+
+
+# Loaded frame with its ids decoded, as the original code read the csv
+def loaded_frame(path):
+    return load_schema(path).expand(load_main_data(path))
+
+
+def check_loaded(path, expected_rows):
+    baseline = baseline_frame(path)
+    assert len(baseline) == expected_rows
+    loaded = loaded_frame(path)
+    same_rows(baseline, loaded, COLUMNS)
+    rfm = create_rfm_df(loaded)
+    expected = create_rfm_df(baseline)
+    assert rfm["customer_id"].tolist() == expected["customer_id"].tolist()
+    assert rfm["frequency"].tolist() == expected["frequency"].tolist()
+    assert rfm["recency"].tolist() == expected["recency"].tolist()
+
+
+@pytest.fixture
+def base_csv(tmp_path, orders):
+    return write_orders(str(tmp_path / "main_data.csv"), orders.iloc[:BASE_ROWS])
+
+
+def test_batch_refreshes_the_loaded_frame(base_csv, orders):
+    load_main_data(base_csv)
+    watermark = ingest_batch(orders.iloc[BASE_ROWS:2500], base_csv)
+
+    assert watermark["rows_applied"] == 500
+    assert watermark["batches"] == 1
+    assert not watermark.get("pending")
+    assert watermark["bytes"] == os.path.getsize(base_csv)
+    check_loaded(base_csv, 2500)
+    assert data_loader.get_load_stats(base_csv)["batches_applied"] == 1
+
+
+def test_crashed_append_is_dropped_and_written_again(base_csv, orders, monkeypatch):
+    ingest_batch(orders.iloc[BASE_ROWS:2500], base_csv)
+    load_main_data(base_csv)
+
+    # the process dies after writing part of the next batch
+    def crash(fd):
+        raise OSError("disk gone")
+
+    monkeypatch.setattr(os, "fsync", crash)
+    with pytest.raises(OSError):
+        ingest_batch(orders.iloc[2500:], base_csv)
+    monkeypatch.undo()
+    with open(base_csv, "r+b") as f:
+        f.truncate(os.path.getsize(base_csv) - 25)
+
+    watermark = read_watermark(base_csv)
+    assert watermark["pending"]
+    assert watermark["bytes"] < os.path.getsize(base_csv)
+
+    # the partial rows are never loaded, warm or cold
+    assert len(load_main_data(base_csv)) == 2500
+    data_loader.clear_cache()
+    assert len(load_main_data(base_csv)) == 2500
+
+    watermark = ingest_batch(orders.iloc[2500:], base_csv)
+    assert not watermark.get("pending")
+    assert watermark["rows_applied"] == len(orders) - BASE_ROWS
+    assert watermark["batches"] == 2
+    assert watermark["bytes"] == os.path.getsize(base_csv)
+    check_loaded(base_csv, len(orders))
+
+
+def test_empty_batch_leaves_the_csv(base_csv, orders):
+    size = os.path.getsize(base_csv)
+    watermark = ingest_batch(orders.iloc[:0], base_csv)
+    assert watermark["bytes"] == size
+    assert os.path.getsize(base_csv) == size
+
+
+def test_batch_missing_columns_is_rejected(base_csv, orders):
+    with pytest.raises(ValueError):
+        ingest_batch(orders.drop(columns=["payment_value"]).iloc[BASE_ROWS:], base_csv)
@@ -0,0 +1,80 @@
+# Testing Library
+import pytest
+
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+from data_loader import append_rows, load_main_data, load_schema
+from paginated_table import NO_OPTION, filter_positions, row_order
+from synthetic_data import generate_main_data
+
+from conftest import write_orders
+
+
+# Compact frame of the dashboard, its schema and the frame the original code
+# read (ids as text)
+@pytest.fixture
+def tables(tmp_path, orders):
+    path = write_orders(str(tmp_path / "main_data.csv"), orders)
+    df, schema = load_main_data(path), load_schema(path)
+    return df, schema, schema.expand(df)
+
+
+@pytest.mark.parametrize("column, text, expected", [
+    ("customer_id", "a3", lambda df: df["customer_id"].str.startswith("a3")),
+    ("customer_state", "p", lambda df: df["customer_state"].astype(str).str.contains("p", case=False)),
+    ("customer_city", "SAO", lambda df: df["customer_city"].astype(str).str.contains("sao", case=False)),
+    ("payment_value", "50..100", lambda df: df["payment_value"].between(50, 100)),
+    ("payment_installments", "3", lambda df: df["payment_installments"] == 3),
+    ("order_approved_at", "2017-11-01..2017-11-30", lambda df: df["order_approved_at"].between("2017-11-01", "2017-11-30")),
+])
+def test_filter_matches_pandas(tables, column, text, expected):
+    df, schema, expanded = tables
+    positions = filter_positions(df, column, text, schema)
+    assert len(positions)
+    assert positions.tolist() == np.flatnonzero(expected(expanded).to_numpy()).tolist()
+
+
+def test_unparsable_range_matches_nothing(tables):
+    df, schema, _ = tables
+    assert len(filter_positions(df, "payment_value", "cheap", schema)) == 0
+    assert len(filter_positions(df, "customer_id", "not hex", schema)) == 0
+
+
+@pytest.mark.parametrize("sort_column", ["customer_id", "customer_state", "payment_value", "order_approved_at"])
+@pytest.mark.parametrize("ascending", [True, False])
+def test_sort_matches_pandas(tables, sort_column, ascending):
+    df, schema, expanded = tables
+    positions = row_order(df, "payment_type", "credit", sort_column, ascending, schema)
+
+    filtered = expanded[expanded["payment_type"].astype(str).str.contains("credit")].reset_index(drop=True)
+    order = filtered[sort_column].astype(str) if sort_column == "customer_state" else filtered[sort_column]
+    expected = filtered["index"].iloc[order.sort_values(ascending=ascending, kind="stable").index]
+    assert df["index"].iloc[positions].tolist() == expected.tolist()
+
+
+def test_natural_order_is_none(tables):
+    df, schema, _ = tables
+    assert row_order(df, NO_OPTION, "", NO_OPTION, True, schema) is None
+
+
+# Ids first seen in a batch get codes past the sorted table
+def test_sort_by_id_after_a_batch(tables):
+    df, schema, expanded = tables
+    batch = generate_main_data(200, seed=2)
+    batch["order_approved_at"] = batch["order_approved_at"].astype("datetime64[ns]")
+    batch["order_purchase_timestamp"] = batch["order_purchase_timestamp"].astype("datetime64[ns]")
+    batch.insert(0, "index", np.arange(len(df), len(df) + len(batch)))
+    combined = append_rows(df, schema.encode(batch[df.columns]))
+    expected = pd.concat([expanded, batch[expanded.columns]], ignore_index=True)
+    assert len(schema.id_tables["customer_id"].extra_words)
+
+    for ascending in [True, False]:
+        positions = row_order(combined, NO_OPTION, "", "customer_id", ascending, schema)
+        assert combined["index"].iloc[positions].tolist() == \
+            expected["index"].iloc[expected["customer_id"].sort_values(ascending=ascending, kind="stable").index].tolist()
+
+    prefix = batch["customer_id"].iloc[0][:4]
+    positions = filter_positions(combined, "customer_id", prefix, schema)
+    assert positions.tolist() == np.flatnonzero(expected["customer_id"].str.startswith(prefix).to_numpy()).tolist()
@@ -0,0 +1,56 @@
+# Testing Library
+import pytest
+
+# Data Manipulation Library
+import pandas as pd
+
+from aggregate_cube import AggregateCube
+from rfm_engine import RFMEngine, create_rfm_df
+
+from conftest import FREQS, RTOL, baseline_window, built_with_batches, check_window, in_date_order, interleaved, windows
+
+pytest.importorskip("duckdb")
+from query_backend import DuckDBCube, DuckDBRFM  # noqa: E402
+
+
+METHODS = ["sum", "mean", "count", "std"]
+
+
+# DuckDB answers exactly what the pandas cube answers, both being sums of cents
+@pytest.mark.parametrize("batches", [None, in_date_order, interleaved])
+def test_cube_parity(orders, batches):
+    if batches is None:
+        cubes = AggregateCube(orders), DuckDBCube(orders)
+    else:
+        cubes = built_with_batches(AggregateCube, orders, batches(orders)), built_with_batches(DuckDBCube, orders, batches(orders))
+    pandas_cube, duckdb_cube = cubes
+    states = list(orders["customer_state"].value_counts().index[:3])
+
+    for start_date, end_date in windows(orders):
+        for method in METHODS:
+            for freq in FREQS:
+                pd.testing.assert_series_equal(pandas_cube.rollup(start_date, end_date, freq=freq, method=method),
+                                               duckdb_cube.rollup(start_date, end_date, freq=freq, method=method), check_exact=True)
+                pd.testing.assert_frame_equal(pandas_cube.rollup(start_date, end_date, freq=freq, method=method, states=states, by_state=True),
+                                              duckdb_cube.rollup(start_date, end_date, freq=freq, method=method, states=states, by_state=True), check_exact=True)
+            for by in ["customer_state", "payment_type"]:
+                pd.testing.assert_series_equal(pandas_cube.totals(start_date, end_date, by=by, method=method),
+                                               duckdb_cube.totals(start_date, end_date, by=by, method=method), check_exact=True)
+
+
+@pytest.mark.parametrize("batches", [None, in_date_order])
+def test_rfm_parity(orders, batches):
+    if batches is None:
+        engines = RFMEngine(orders), DuckDBRFM(orders)
+    else:
+        engines = built_with_batches(RFMEngine, orders, batches(orders)), built_with_batches(DuckDBRFM, orders, batches(orders))
+    for start_date, end_date in windows(orders):
+        expected = create_rfm_df(baseline_window(orders, start_date, end_date))
+        for engine in engines:
+            check_window(expected.copy(), engine.window(start_date, end_date))
+
+
+def test_rfm_interleaved_batches_within_tolerance(orders):
+    engine = built_with_batches(DuckDBRFM, orders, interleaved(orders))
+    for start_date, end_date in windows(orders):
+        check_window(create_rfm_df(baseline_window(orders, start_date, end_date)), engine.window(start_date, end_date), RTOL)
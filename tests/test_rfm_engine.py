@@ -0,0 +1,66 @@
+# Testing Library
+import pytest
+
+# Data Manipulation Library
+import pandas as pd
+
+from aggregate_cube import AggregateCube
+from rfm_engine import RFMEngine, create_rfm_df
+
+from conftest import FREQS, RTOL, baseline_window, built_with_batches, check_window, in_date_order, interleaved, windows
+
+
+def test_window_matches_create_rfm_df(orders):
+    engine = RFMEngine(orders)
+    for start_date, end_date in windows(orders):
+        check_window(create_rfm_df(baseline_window(orders, start_date, end_date)), engine.window(start_date, end_date))
+
+
+def test_batches_in_date_order_are_exact(orders):
+    engine = built_with_batches(RFMEngine, orders, in_date_order(orders))
+    for start_date, end_date in windows(orders):
+        check_window(create_rfm_df(baseline_window(orders, start_date, end_date)), engine.window(start_date, end_date))
+
+
+# older orders arriving late are summed after the newer ones
+def test_interleaved_batches_within_tolerance(orders):
+    engine = built_with_batches(RFMEngine, orders, interleaved(orders))
+    for start_date, end_date in windows(orders):
+        check_window(create_rfm_df(baseline_window(orders, start_date, end_date)), engine.window(start_date, end_date), RTOL)
+
+
+def test_empty_window(orders):
+    engine = RFMEngine(orders)
+    window = engine.window(pd.Timestamp("2030-01-01"), pd.Timestamp("2030-12-31"))
+    assert window.empty
+    assert list(window.columns) == ["customer_id", "frequency", "monetary", "recency"]
+
+
+# Original groupbys of the EDA charts on the float payment values
+def baseline_group(df, start_date, end_date, by, method):
+    grouped = baseline_window(df, start_date, end_date).groupby(by=by, observed=True)
+    if method == "count":
+        return grouped["order_approved_at"].count().rename("payment_value")
+    return getattr(grouped["payment_value"], method)()
+
+
+def check_series(expected, result, rtol):
+    if rtol is None:
+        pd.testing.assert_series_equal(expected, result, check_exact=True)
+    else:
+        pd.testing.assert_series_equal(expected, result, check_exact=False, rtol=rtol, atol=0)
+
+
+@pytest.mark.parametrize("batches", [None, in_date_order, interleaved])
+@pytest.mark.parametrize("method", ["sum", "mean", "count", "std"])
+def test_cube_matches_original_groupbys(orders, batches, method):
+    cube = AggregateCube(orders) if batches is None else built_with_batches(AggregateCube, orders, batches(orders))
+    # whole cents against float sums
+    rtol = None if method == "count" else RTOL
+    for start_date, end_date in windows(orders):
+        for freq in FREQS:
+            check_series(baseline_group(orders, start_date, end_date, pd.Grouper(key="order_approved_at", freq=freq), method),
+                         cube.rollup(start_date, end_date, freq=freq, method=method), rtol)
+
+        expected = baseline_group(orders, start_date, end_date, "customer_state", method)
+        check_series(expected, cube.totals(start_date, end_date, by="customer_state", method=method), rtol)
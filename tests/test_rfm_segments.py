@@ -0,0 +1,70 @@
+# Testing Library
+import pytest
+
+# Data Manipulation Library
+import numpy as np
+
+from rfm_engine import create_rfm_df
+from rfm_segments import QUINTILES, SKETCH_K, QuantileSketch, score_rfm, segment_summary, sketch_rfm
+
+
+QS = [0.01] + QUINTILES + [0.5, 0.99]
+# KLL rank error is about 1 / k; the seeded sketches below stay under 2 / k
+RANK_ERROR = 3 / SKETCH_K
+
+
+def rank_error(values, quantiles, qs):
+    ranks = np.searchsorted(np.sort(values), quantiles, side="right") / len(values)
+    return np.abs(ranks - np.asarray(qs)).max()
+
+
+def payments(seed, size=100_000):
+    return np.random.default_rng(seed).lognormal(5, 1, size)
+
+
+def test_exact_up_to_k():
+    values = payments(0, SKETCH_K)
+    sketch = QuantileSketch().update(values)
+    assert np.array_equal(sketch.quantiles(QS), np.quantile(values, QS, method="inverted_cdf"))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_rank_error_of_one_sketch(seed):
+    values = payments(seed)
+    sketch = QuantileSketch(seed=seed).update(values)
+    assert sketch.count == len(values)
+    assert rank_error(values, sketch.quantiles(QS), QS) <= RANK_ERROR
+
+
+# Sketches of partitions merged level by level answer like one of the whole
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_rank_error_of_merged_sketches(seed):
+    values = payments(seed)
+    merged = QuantileSketch()
+    for start in range(0, len(values), 7000):
+        merged.merge(QuantileSketch(seed=start).update(values[start:start + 7000]))
+
+    assert merged.count == len(values)
+    assert sum(len(items) for items in merged.levels) < 4 * SKETCH_K
+    assert rank_error(values, merged.quantiles(QS), QS) <= RANK_ERROR
+
+
+def test_empty_sketch():
+    sketch = QuantileSketch().update([np.nan])
+    assert sketch.count == 0
+    assert np.isnan(sketch.quantiles(QS)).all()
+
+
+# Chunked sketches of the RFM metrics score like exact quintiles
+def test_chunked_scores_match_exact_scores(orders):
+    rfm_df = create_rfm_df(orders)
+    chunked = score_rfm(rfm_df, sketch_rfm(rfm_df, chunk_rows=500))
+    exact = score_rfm(rfm_df, sketch_rfm(rfm_df, k=len(rfm_df)))
+
+    assert len(chunked) == len(rfm_df)
+    for score in ["r_score", "f_score", "m_score"]:
+        assert chunked[score].between(1, 5).all()
+        assert (chunked[score] != exact[score]).mean() <= RANK_ERROR * 2
+    summary = segment_summary(chunked)
+    assert summary["customers"].sum() == len(rfm_df)
+    assert summary["revenue"].sum() == pytest.approx(rfm_df["monetary"].sum())
@@ -0,0 +1,21 @@
+# Testing Library
+import pytest
+
+# Data Manipulation Library
+import pandas as pd
+
+from plot_functions import payment_labels
+from vega_charts import donutchartfunc
+
+
+def test_donut_draws_every_slice():
+    counts = pd.Series([50, 30, 10, 6, 3, 1], index=["credit_card", "boleto", "voucher", "debit_card", "not_defined", "pix"])
+    spec = donutchartfunc(counts, label=payment_labels(counts.index), title="Payment Types")
+    assert [point["label"] for point in spec["data"]["values"]] == ["Credit Card", "Boleto", "Voucher", "Debit Card", "not_defined", "pix"]
+    assert [point["count"] for point in spec["data"]["values"]] == counts.tolist()
+
+
+def test_donut_needs_a_label_per_slice():
+    counts = pd.Series([50, 30, 10], index=["credit_card", "boleto", "voucher"])
+    with pytest.raises(ValueError):
+        donutchartfunc(counts, label=["Credit Card", "Boleto", "Voucher", "Debit Card"], title="Payment Types")
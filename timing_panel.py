@@ -0,0 +1,130 @@
+# Streamlit Library
+import streamlit as st
+
+# Instrumentation Library
+from instrumentation import SPAN_COLUMNS, finish_timeline, span, start_timeline
+
+# Standard Library
+from contextlib import contextmanager
+import cProfile
+import io
+import os
+import pstats
+
+
+# The panel is hidden unless the app runs with RFM_DASHBOARD_DEBUG=1 or is
+# opened with ?debug=1 in the url
+DEBUG_ENV = "RFM_DASHBOARD_DEBUG"
+PROFILE_REQUEST = "profile_next_rerun"
+PROFILE_REPORT = "profile_report"
+PROFILE_LINES = 30
+
+# set by the first rerun of the process, the one that pays for the imports
+_process_state = {"first_rerun": True}
+
+
+def debug_enabled():
+    return os.environ.get(DEBUG_ENV) == "1" or st.query_params.get("debug") == "1"
+
+
+def session_id():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return get_script_run_ctx().session_id
+    except (ImportError, AttributeError):
+        return None
+
+
+# Chart Function
+# st.image of a cached PNG, timed as the transfer of the chart to the page. A
+# future from the chart pool is waited for first, and a Vega-Lite spec (see
+# vega_charts) is sent as is for the browser to draw.
+def show_chart(png, **kwargs):
+    if isinstance(png, dict):
+        with span("st.vega_lite_chart"):
+            st.vega_lite_chart(spec=png, theme=None, **kwargs)
+        return
+    if hasattr(png, "result"):
+        with span("chart_wait"):
+            png = png.result()
+    with span("st.image", bytes=len(png)):
+        st.image(png, **kwargs)
+
+
+def request_profile():
+    st.session_state[PROFILE_REQUEST] = True
+
+
+def start_profiler():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler is already active in this thread
+        return None
+    return profiler
+
+
+def profile_report(profiler):
+    profiler.disable()
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return text.getvalue()
+
+
+# Rerun Instrumentation Function
+#
+# Wraps one script run: a fresh timeline for the spans recorded while it runs,
+# cProfile when the previous run asked for it, and at the end the log line and
+# the sidebar panel. Streamlit's own stop/rerun signals end the run quietly.
+# started: perf_counter() taken at the top of the script, so the time spent in
+# imports before main() counts towards the rerun and its first render.
+@contextmanager
+def instrumented_rerun(started=None):
+    timeline = start_timeline(started)
+    if started is not None:
+        timeline.add("imports", 0.0, timeline.elapsed())
+    cold_process, _process_state["first_rerun"] = _process_state["first_rerun"], False
+    profiler = start_profiler() if st.session_state.pop(PROFILE_REQUEST, False) else None
+    status = "ok"
+    try:
+        yield timeline
+    except Exception:
+        status = "error"
+        raise
+    except BaseException:
+        status = "interrupted"
+        raise
+    finally:
+        if profiler is not None:
+            st.session_state[PROFILE_REPORT] = profile_report(profiler)
+        finish_timeline(status=status, session=session_id(), cold_process=cold_process)
+        if status != "interrupted" and debug_enabled():
+            show_timing_panel(timeline)
+
+
+# Timing Panel Function
+def show_timing_panel(timeline):
+    with st.sidebar:
+        st.markdown("***")
+        if not st.toggle("Show timing breakdown", key="debug_timing"):
+            return
+
+        spans = timeline.frame()
+        table = spans.drop(columns=SPAN_COLUMNS)
+        table.insert(0, "span", ["· " * depth + name for depth, name in zip(spans["depth"], spans["name"])])
+        table.insert(1, "ms", (spans["seconds"] * 1000).round(1))
+        table.insert(2, "start ms", (spans["start"] * 1000).round(1))
+        table.insert(3, "memory MB", (spans["memory_delta_bytes"] / 2 ** 20).round(2))
+
+        first_render = timeline.fields.get("first_render_seconds")
+        st.caption(f"Rerun of {timeline.fields.get('page', '')}: {timeline.seconds * 1000:.0f} ms, {len(table)} spans"
+                   + ("" if first_render is None else f", first render after {first_render * 1000:.0f} ms"))
+        st.dataframe(table, hide_index=True)
+
+        st.button("Profile next rerun", on_click=request_profile)
+        report = st.session_state.get(PROFILE_REPORT)
+        if report:
+            with st.expander("cProfile of the last profiled rerun"):
+                st.code(report)
+
@@ -0,0 +1,188 @@
+# Data Manipulation Library
+import numpy as np
+import pandas as pd
+
+# Dashboard Libraries
+from data_loader import resolve
+from instrumentation import span
+
+# Standard Library
+import json
+
+
+# Vega-Lite Chart Specs
+#
+# Client-side versions of the plot helpers in plot_functions: same names, same
+# arguments, same titles and labels, but they return a Vega-Lite spec holding
+# only the aggregated points (tens to hundreds) for the browser to draw,
+# instead of a matplotlib figure rasterized on the server.
+#
+# Sizes keep the proportions of the matplotlib figures: PIXELS_PER_INCH pixels
+# per inch of figsize, and font sizes scaled the same way, so a 30pt label on a
+# 16 inch figure takes the same share of the chart as it does in the PNG.
+PIXELS_PER_INCH = 50
+
+
+def pixels(points):
+    return round(points * PIXELS_PER_INCH / 72, 1)
+
+
+def base_spec(figsize, title, title_size, label_size, tick_size, values):
+    return {
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+        "width": figsize[0] * PIXELS_PER_INCH,
+        "height": figsize[1] * PIXELS_PER_INCH,
+        "title": {"text": title, "fontSize": pixels(title_size)},
+        "data": {"values": values},
+        "config": {"axis": {"titleFontSize": pixels(label_size), "labelFontSize": pixels(tick_size)}},
+    }
+
+
+def records(**columns):
+    frame = pd.DataFrame(columns)
+    for column in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[column]):
+            frame[column] = frame[column].dt.strftime("%Y-%m-%d")
+    return json.loads(frame.to_json(orient="records"))
+
+
+# Bar Plot Function
+def barplotfunc(x, y, xlabel=str, ylabel=str, title=str):
+    spec = base_spec((14, 8), title, 20, 13, 13, records(x=np.asarray(x), y=np.asarray(y).astype(str)))
+    spec["encoding"] = {
+        "y": {"field": "y", "type": "nominal", "sort": None, "title": ylabel},
+        "x": {"field": "x", "type": "quantitative", "title": xlabel},
+    }
+    spec["layer"] = [
+        {"mark": "bar"},
+        {"mark": {"type": "text", "align": "left", "dx": 3, "fontSize": pixels(13)}, "encoding": {"text": {"field": "x", "type": "quantitative"}}},
+    ]
+    return spec
+
+def barplotfunc2(cube, min_date_filter, max_date_filter, states=None, xlabel=str, ylabel=str, title=str, method=str):
+    df_group_filter = cube.totals(min_date_filter, max_date_filter, by='customer_state', method=method, states=states)
+
+    df_group_filter = df_group_filter.sort_values(ascending=False)
+
+    spec = base_spec((16, 14), title, 36, 30, 27, records(x=df_group_filter.index, y=df_group_filter.to_numpy()))
+    spec["encoding"] = {
+        "x": {"field": "x", "type": "nominal", "sort": None, "title": xlabel},
+        "y": {"field": "y", "type": "quantitative", "title": ylabel},
+    }
+    spec["layer"] = [
+        {"mark": "bar"},
+        {"mark": {"type": "text", "baseline": "bottom", "dy": -3, "fontSize": pixels(20)}, "encoding": {"text": {"field": "y", "type": "quantitative"}}},
+    ]
+    # sampled estimate (approximate.SampleCube): 95% interval of every bar
+    if hasattr(cube, "totals_interval"):
+        bounds = cube.totals_interval(min_date_filter, max_date_filter, by='customer_state', method=method, states=states).loc[df_group_filter.index]
+        spec["data"]["values"] = records(x=bounds.index, y=bounds["estimate"].to_numpy(), low=bounds["low"].to_numpy(), high=bounds["high"].to_numpy())
+        spec["layer"].append({"mark": "rule", "encoding": {"y": {"field": "low", "type": "quantitative"}, "y2": {"field": "high"}}})
+    return spec
+
+# Histogram Plot Function
+# The bins are counted here with the rule seaborn uses (numpy "auto"), or read
+# from a MetricIndex, so only one row per bin is sent
+def histplotfunc(df, start=None, end=None, xlabel=str, ylabel=str, title=str):
+    if hasattr(df, "histogram"):
+        edges, counts = df.histogram(start, end)
+    else:
+        df_filter = df[(df >= start) & (df <= end)].to_numpy(dtype=np.float64)
+        counts, edges = np.histogram(df_filter, bins="auto") if len(df_filter) else (np.zeros(0), np.zeros(1))
+    spec = base_spec((18, 8), title, 20, 13, 13, records(start=edges[:-1], end=edges[1:], count=counts))
+    spec["mark"] = "bar"
+    spec["encoding"] = {
+        "x": {"field": "start", "type": "quantitative", "bin": {"binned": True}, "title": xlabel},
+        "x2": {"field": "end"},
+        "y": {"field": "count", "type": "quantitative", "title": ylabel},
+    }
+    # sampled estimate (approximate.WeightedMetric): 95% interval of every bin
+    if hasattr(df, "histogram_interval"):
+        low, high = df.histogram_interval(start, end)
+        spec["data"]["values"] = records(start=edges[:-1], end=edges[1:], count=counts, center=(edges[:-1] + edges[1:]) / 2, low=low, high=high)
+        spec["layer"] = [
+            {"mark": spec.pop("mark")},
+            {"mark": "rule", "encoding": {"x": {"field": "center", "type": "quantitative"}, "x2": {"field": "center"},
+                                          "y": {"field": "low", "type": "quantitative"}, "y2": {"field": "high"}}},
+        ]
+    return spec
+
+# Line Plot Function
+def time_axis(xlabel):
+    return {"field": "date", "type": "temporal", "title": xlabel,
+            "axis": {"format": "%b-%Y", "labelAngle": -45, "tickCount": "month"}}
+
+def lineplotfunct1(cube, min_date_filter, max_date_filter, xlabel=str, ylabel=str, title=str, freq=str, method=str):
+
+    df_group_filter = cube.rollup(min_date_filter, max_date_filter, freq=freq, method=method)
+
+    spec = base_spec((18, 8), title, 20, 15, 15, records(date=df_group_filter.index, value=df_group_filter.to_numpy()))
+    spec["mark"] = {"type": "line", "point": True}
+    spec["encoding"] = {
+        "x": time_axis(xlabel),
+        "y": {"field": "value", "type": "quantitative", "title": ylabel},
+    }
+    # sampled estimate (approximate.SampleCube): shaded 95% interval
+    if hasattr(cube, "rollup_interval"):
+        bounds = cube.rollup_interval(min_date_filter, max_date_filter, freq=freq, method=method)
+        spec["data"]["values"] = records(date=bounds.index, value=bounds["estimate"].to_numpy(), low=bounds["low"].to_numpy(), high=bounds["high"].to_numpy())
+        spec["layer"] = [
+            {"mark": {"type": "area", "opacity": 0.25}, "encoding": {"y": {"field": "low", "type": "quantitative", "title": ylabel}, "y2": {"field": "high"}}},
+            {"mark": spec.pop("mark")},
+        ]
+    return spec
+
+# lineplotfunct_two (this function specific for Customer State Analysis)
+def lineplotfunct2(cube, min_date_filter, max_date_filter, states=None, hue=str, xlabel=str, ylabel=str, title=str, freq=str, method=str):
+
+    df_group_filter = cube.rollup(min_date_filter, max_date_filter, freq=freq, method=method, states=states, by_state=True)
+
+    spec = base_spec((18, 8), title, 20, 15, 15, records(date=df_group_filter['order_approved_at'], value=df_group_filter['payment_value'],
+                                                         hue=df_group_filter[hue]))
+    spec["mark"] = {"type": "line", "point": True}
+    spec["encoding"] = {
+        "x": time_axis(xlabel),
+        "y": {"field": "value", "type": "quantitative", "title": ylabel},
+        "color": {"field": "hue", "type": "nominal", "title": hue},
+    }
+    return spec
+
+# Pie Chart Function
+def donutchartfunc(df, label, title=str):
+    count, label = np.asarray(df), list(label)
+    # every slice is drawn, each with its own label, as ax.pie requires
+    if len(label) != len(count):
+        raise ValueError(f"'label' must be of length 'x': {len(label)} labels for {len(count)} slices")
+    spec = base_spec((18, 13), title, 20, 16, 16, records(label=label, count=count, order=np.arange(len(label))))
+    radius = 13 * PIXELS_PER_INCH * 0.4
+    spec["transform"] = [
+        {"joinaggregate": [{"op": "sum", "field": "count", "as": "total"}]},
+        {"calculate": "datum.count / datum.total", "as": "share"},
+    ]
+    spec["encoding"] = {
+        "theta": {"field": "count", "type": "quantitative", "stack": True},
+        "order": {"field": "order", "type": "quantitative"},
+        "color": {"field": "label", "type": "nominal", "sort": None, "title": None},
+    }
+    spec["layer"] = [
+        {"mark": {"type": "arc", "radius": radius, "radius2": radius * 0.7}},
+        {"mark": {"type": "text", "radius": radius * 0.9, "fill": "white", "fontSize": pixels(16)},
+         "encoding": {"text": {"field": "share", "type": "quantitative", "format": ".0%"}}},
+    ]
+    return spec
+
+
+# Spec Function
+# Vega-Lite spec of a plot_functions helper called with its usual arguments;
+# the span records the build time and the payload sent to the browser.
+def vega_spec(func, *args, **kwargs):
+    with span(f"vega:{func.__name__}") as record:
+        args = [resolve(value) for value in args]
+        kwargs = {name: resolve(value) for name, value in kwargs.items()}
+        spec = globals()[func.__name__](*args, **kwargs)
+        record.update(bytes=payload_bytes(spec))
+        return spec
+
+
+def payload_bytes(spec):
+    return len(json.dumps(spec, separators=(",", ":")))